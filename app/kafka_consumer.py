@@ -1,123 +1,420 @@
 import asyncio
-import json
-import uuid
-from typing import Optional
+import contextlib
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from aiokafka import AIOKafkaConsumer
-from sqlalchemy.orm import Session
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRebalanceListener
+from aiokafka.structs import ConsumerRecord, TopicPartition
 
 from app.config import get_settings
-from app.models import Transaction, TransactionStatus
-from app.models.db import SessionLocal
-from app.services.cache import get_cache
-from datetime import datetime
+from app.services.cache import get_cache, get_stats_cache
+from app.services.decision import Decision, from_headers
+from app.services.features import observe_velocity
+from app.services.flagged import cache_entry, rebuild_redis_queue
 from app.services.inference import FraudModel
-from app.services import rules
+from app.services import metrics, persistence, rules, wire
+
+
+logger = logging.getLogger(__name__)
+
+# Why a record was dead-lettered: (record, reason label, detail)
+Poison = Tuple[ConsumerRecord, str, str]
+
+
+def invalid_reason(payload: dict) -> Optional[str]:
+    """Why a decoded payload cannot be scored and persisted, or None when it can."""
+    for field in ("transaction_id", "user_id"):
+        if not payload.get(field):
+            return f"missing {field}"
+    try:
+        float(payload.get("amount"))
+    except (TypeError, ValueError):
+        return "amount is not a number"
+    return None
+
+
+def next_offsets(batch: Iterable[ConsumerRecord]) -> Dict[TopicPartition, int]:
+    """Per partition, the offset after the last record of the batch: what to commit once it is durable."""
+    offsets: Dict[TopicPartition, int] = {}
+    for msg in batch:
+        tp = TopicPartition(msg.topic, msg.partition)
+        offsets[tp] = max(offsets.get(tp, 0), msg.offset + 1)
+    return offsets
+
+
+class ThroughputCounter:
+    """Batch sizes and per-stage wall time, summarized in the log every interval."""
+
+    STAGES = ("decode", "features", "rules", "score", "db", "cache", "commit")
+
+    def __init__(self, log_interval: float = 30.0) -> None:
+        self.log_interval = log_interval
+        self.total_batches = 0
+        self.total_messages = 0
+        self._reset_window()
+
+    def _reset_window(self) -> None:
+        self.batches = 0
+        self.messages = 0
+        self.max_batch = 0
+        self.stage_seconds: Dict[str, float] = dict.fromkeys(self.STAGES, 0.0)
+        self._window_start = time.perf_counter()
+
+    def record(self, size: int, stage_seconds: Dict[str, float]) -> None:
+        self.batches += 1
+        self.messages += size
+        self.total_batches += 1
+        self.total_messages += size
+        self.max_batch = max(self.max_batch, size)
+        for stage, seconds in stage_seconds.items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def snapshot(self) -> dict:
+        elapsed = max(time.perf_counter() - self._window_start, 1e-9)
+        batches = max(self.batches, 1)
+        return {
+            "messages_per_s": self.messages / elapsed,
+            "batches": self.batches,
+            "avg_batch_size": self.messages / batches,
+            "max_batch_size": self.max_batch,
+            "stage_ms_per_batch": {k: 1000.0 * v / batches for k, v in self.stage_seconds.items()},
+            "total_messages": self.total_messages,
+        }
+
+    def maybe_log(self) -> None:
+        if time.perf_counter() - self._window_start < self.log_interval:
+            return
+        if self.batches:
+            snap = self.snapshot()
+            stages = " ".join(f"{k}={v:.2f}ms" for k, v in snap["stage_ms_per_batch"].items())
+            logger.info(
+                "consumer throughput: %.0f msg/s, %d batches, avg size %.1f, max size %d, per batch: %s",
+                snap["messages_per_s"],
+                snap["batches"],
+                snap["avg_batch_size"],
+                snap["max_batch_size"],
+                stages,
+            )
+        self._reset_window()
+
+
+class _RebalanceListener(ConsumerRebalanceListener):
+    def __init__(self, service: "KafkaConsumerService") -> None:
+        self.service = service
+
+    async def on_partitions_revoked(self, revoked) -> None:
+        await self.service.release_partitions(revoked)
+
+    async def on_partitions_assigned(self, assigned) -> None:
+        logger.info("consumer assigned partitions %s", sorted(tp.partition for tp in assigned))
 
 
 class KafkaConsumerService:
     def __init__(self) -> None:
         self.settings = get_settings()
         self.consumer: Optional[AIOKafkaConsumer] = None
+        # Sends poison messages to KAFKA_DEAD_LETTER_TOPIC
+        self.dead_letters: Optional[AIOKafkaProducer] = None
         self._task: Optional[asyncio.Task] = None
         self._stopping = asyncio.Event()
+        # Whether Redis missed flagged pushes; None until checked, as a worker may have died mid-rebuild
+        self._flagged_dirty: Optional[bool] = None
+        # Held while a batch is processed and committed; a rebalance waits for it
+        self._batch_lock = asyncio.Lock()
+        # Velocity features of records observed but not yet committed, by (partition, offset): a rewound
+        # batch reuses them instead of recording its transactions a second time
+        self._observed: Dict[Tuple[TopicPartition, int], Dict[str, float]] = {}
+        self.throughput = ThroughputCounter(self.settings.CONSUMER_STATS_INTERVAL_S)
 
     async def start(self) -> None:
         if self.consumer is not None:
             return
         self.consumer = AIOKafkaConsumer(
-            self.settings.KAFKA_TRANSACTIONS_TOPIC,
             bootstrap_servers=self.settings.KAFKA_BOOTSTRAP_SERVERS,
-            group_id="fraud-consumer",
-            enable_auto_commit=True,
-            auto_offset_reset="latest",
+            group_id=self.settings.CONSUMER_GROUP_ID,
+            # Offsets are committed explicitly once a batch has been persisted
+            enable_auto_commit=False,
+            auto_offset_reset=self.settings.CONSUMER_AUTO_OFFSET_RESET,
+            max_poll_records=max(1, self.settings.CONSUMER_BATCH_MAX_RECORDS),
         )
-        await self.consumer.start()
+        self.consumer.subscribe([self.settings.KAFKA_TRANSACTIONS_TOPIC], listener=_RebalanceListener(self))
+        if self.settings.KAFKA_DEAD_LETTER_TOPIC:
+            self.dead_letters = AIOKafkaProducer(bootstrap_servers=self.settings.KAFKA_BOOTSTRAP_SERVERS, acks="all")
+        try:
+            await self.consumer.start()
+            if self.dead_letters is not None:
+                await self.dead_letters.start()
+        except Exception:
+            await self._close()
+            raise
         self._stopping.clear()
         self._task = asyncio.create_task(self._run_loop())
 
     async def stop(self) -> None:
+        """Finish and commit the batch in progress, then leave the group."""
         self._stopping.set()
         if self._task:
             await self._task
+        await self._close()
+
+    async def _close(self) -> None:
         if self.consumer is not None:
             await self.consumer.stop()
             self.consumer = None
+        if self.dead_letters is not None:
+            await self.dead_letters.stop()
+            self.dead_letters = None
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Consume until `stop` is set or the loop exits, then drain like stop()."""
+        await self.start()
+        assert self._task is not None
+        waiter = asyncio.create_task(stop.wait())
+        await asyncio.wait({waiter, self._task}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        await self.stop()
+
+    async def release_partitions(self, revoked: Iterable[TopicPartition]) -> None:
+        """
+        Rebalance hook: let the batch in progress finish and commit before the
+        partitions move to another worker, so neither of them processes it twice.
+        """
+        async with self._batch_lock:
+            pass
+        revoked = set(revoked)
+        self._observed = {k: v for k, v in self._observed.items() if k[0] not in revoked}
+        partitions = sorted(tp.partition for tp in revoked)
+        for partition in partitions:
+            with contextlib.suppress(KeyError):
+                metrics.KAFKA_CONSUMER_LAG.remove(str(partition))
+        logger.info("consumer released partitions %s", partitions)
+
+    def _owned(self, batch: List[ConsumerRecord]) -> List[ConsumerRecord]:
+        """Drop records of partitions revoked since they were fetched; their new owner reads them again."""
+        assert self.consumer is not None
+        assigned = self.consumer.assignment()
+        return [msg for msg in batch if TopicPartition(msg.topic, msg.partition) in assigned]
 
     async def _run_loop(self) -> None:
         assert self.consumer is not None
-        cache = get_cache()
         # Lazy model load (kept here to defer heavy load until consumer runs)
         model = FraudModel.instance()
 
         try:
             while not self._stopping.is_set():
-                try:
-                    msg = await asyncio.wait_for(self.consumer.getone(), timeout=1.0)
-                except asyncio.TimeoutError:
-                    continue
-                try:
-                    payload = json.loads(msg.value)
-                except Exception:
-                    continue
-                # Rules + Model
-                rules_flag, _ = rules.evaluate_transaction(payload)
-                score, model_flag = model.predict_from_transaction(payload)
-                is_fraud = bool(rules_flag or model_flag)
-                tx_id = str(payload.get("transaction_id"))
-
-                # Upsert in DB in a thread to avoid blocking loop
-                await asyncio.to_thread(self._upsert_transaction, payload, score, is_fraud)
-
-                # Push to Redis if flagged
-                if is_fraud:
-                    await cache.push_flagged(tx_id, payload)
+                batch = await self._next_batch()
+                async with self._batch_lock:
+                    batch = self._owned(batch)
+                    if not batch:
+                        if self._flagged_dirty is not False:
+                            await self._repair_flagged_queue()
+                        self.throughput.maybe_log()
+                        continue
+                    try:
+                        await self._process_batch(batch, model)
+                    except Exception:
+                        # Nothing was committed: rewind so the batch is redelivered
+                        logger.exception("consumer batch of %d failed; retrying", len(batch))
+                        self._rewind(batch)
+                        failed = True
+                    else:
+                        failed = False
+                if failed:
+                    await asyncio.sleep(1.0)
+                self.throughput.maybe_log()
         except asyncio.CancelledError:
             pass
 
-    def _parse_ts(self, s: Optional[str]) -> Optional[datetime]:
-        if not s:
-            return None
+    async def _next_batch(self) -> List[ConsumerRecord]:
+        """Wait up to 1s for the first records, then linger to fill the batch."""
+        assert self.consumer is not None
+        max_records = max(1, self.settings.CONSUMER_BATCH_MAX_RECORDS)
+        batch: List[ConsumerRecord] = []
+        records = await self.consumer.getmany(timeout_ms=1000, max_records=max_records)
+        for msgs in records.values():
+            batch.extend(msgs)
+        if not batch:
+            return batch
+
+        deadline = time.monotonic() + self.settings.CONSUMER_BATCH_LINGER_MS / 1000.0
+        while len(batch) < max_records:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            records = await self.consumer.getmany(
+                timeout_ms=int(remaining * 1000), max_records=max_records - len(batch)
+            )
+            if not records:
+                break
+            for msgs in records.values():
+                batch.extend(msgs)
+        return batch
+
+    def _rewind(self, batch: List[ConsumerRecord]) -> None:
+        assert self.consumer is not None
+        first: Dict[TopicPartition, int] = {}
+        for msg in batch:
+            tp = TopicPartition(msg.topic, msg.partition)
+            if tp not in first or msg.offset < first[tp]:
+                first[tp] = msg.offset
+        for tp, offset in first.items():
+            self.consumer.seek(tp, offset)
+
+    async def _process_batch(self, batch: List[ConsumerRecord], model: FraudModel) -> None:
+        assert self.consumer is not None
+        timings: Dict[str, float] = {}
+        last = time.perf_counter()
+
+        def lap(stage: str) -> None:
+            nonlocal last
+            now = time.perf_counter()
+            timings[stage] = now - last
+            last = now
+
+        payloads: List[dict] = []
+        positions: List[Tuple[TopicPartition, int]] = []
+        decisions: List[Optional[Decision]] = []
+        poison: List[Poison] = []
+        for msg in batch:
+            try:
+                payload = wire.decode(msg.value)
+            except Exception as e:
+                poison.append((msg, "decode", f"{type(e).__name__}: {e}"))
+                continue
+            reason = invalid_reason(payload)
+            if reason is not None:
+                poison.append((msg, "invalid", reason))
+                continue
+            payloads.append(payload)
+            positions.append((TopicPartition(msg.topic, msg.partition), msg.offset))
+            decisions.append(from_headers(msg.headers) if self.settings.CONSUMER_TRUST_EDGE_DECISIONS else None)
+        lap("decode")
+
+        if payloads:
+            # Velocity state is updated here, in arrival order, before anything reads it. Records of a
+            # rewound batch were recorded on the first attempt and reuse those features
+            fresh = [i for i, pos in enumerate(positions) if pos not in self._observed]
+            if fresh:
+                observed = await observe_velocity([payloads[i] for i in fresh])
+                self._observed.update((positions[i], f) for i, f in zip(fresh, observed))
+            velocity = [self._observed[pos] for pos in positions]
+            lap("features")
+
+            # Reuse the API's verdict when it came from the same model and rules and, if it read velocity,
+            # from the shared counters; score the rest
+            ruleset = rules.get_ruleset()
+            rescore = [i for i, d in enumerate(decisions) if d is None or not d.is_current(model, ruleset)]
+            scores = [d.score if d is not None else 0.0 for d in decisions]
+            is_fraud = [d.is_fraud if d is not None else False for d in decisions]
+            if rescore:
+                subset = [payloads[i] for i in rescore]
+                sub_velocity = [velocity[i] for i in rescore]
+                rule_flags = rules.evaluate_batch(subset, sub_velocity).flags
+                lap("rules")
+                sub_scores, model_flags = model.predict_batch(subset, sub_velocity)
+                for i, score, fraud in zip(rescore, sub_scores.tolist(), (rule_flags | model_flags).tolist()):
+                    scores[i], is_fraud[i] = score, fraud
+            else:
+                lap("rules")
+            lap("score")
+            metrics.CONSUMER_DECISIONS.labels(source="edge").inc(len(payloads) - len(rescore))
+            metrics.CONSUMER_DECISIONS.labels(source="rescored").inc(len(rescore))
+
+            # Upsert in DB in a thread to avoid blocking loop
+            stored = await asyncio.to_thread(persistence.persist_batch, payloads, scores, is_fraud)
+            lap("db")
+
+            # New rows change the stats rollups
+            await get_stats_cache().bump()
+
+            # Mirror the stored rows in Redis in one call: a replay of a reviewed row pushes its review, and a
+            # row rescored as clean leaves the queue. The DB is the source of truth
+            flagged = [(row["id"], cache_entry(row)) for row in stored if row["is_fraud"]]
+            cleared = [row["id"] for row in stored if not row["is_fraud"]]
+            # A lost push would leave holes readers cannot see, so it marks the queue for a rebuild
+            if await self._repair_flagged_queue():
+                try:
+                    await get_cache().push_flagged_many(flagged, cleared)
+                except Exception:
+                    self._flagged_dirty = True
+                    logger.warning("failed to push %d flagged transactions to Redis", len(flagged), exc_info=True)
+            lap("cache")
+
+        if poison:
+            await self._dead_letter(poison)
+
+        # Only commit once the batch is durable, and only the offsets of this batch
+        await self.consumer.commit(next_offsets(batch))
+        for pos in positions:
+            self._observed.pop(pos, None)
+        lap("commit")
+
+        self.throughput.record(len(batch), timings)
+        self._observe(batch, timings)
+
+    async def _repair_flagged_queue(self) -> bool:
+        """Rebuild the Redis queue from Postgres if pushes were lost; False while Redis is unreachable."""
+        cache = get_cache()
+        was_dirty = self._flagged_dirty
         try:
-            if s.endswith("Z"):
-                s = s.replace("Z", "+00:00")
-            return datetime.fromisoformat(s)
+            if self._flagged_dirty is None:
+                self._flagged_dirty = await cache.flagged_stale()
+            if self._flagged_dirty:
+                count = await rebuild_redis_queue(cache)
+                self._flagged_dirty = False
+                logger.info("rebuilt the Redis flagged queue from Postgres (%d entries)", count)
         except Exception:
-            return None
+            self._flagged_dirty = True
+            if not was_dirty:
+                logger.warning("Redis flagged queue is stale; it is rebuilt once Redis is reachable", exc_info=True)
+            return False
+        return True
 
-    def _upsert_transaction(self, payload: dict, score: float, is_fraud: bool) -> None:
-        db: Session = SessionLocal()
-        try:
-            tx_id = str(payload.get("transaction_id"))
-            t = db.query(Transaction).filter(Transaction.id == tx_id).one_or_none()
-            if t is None:
-                t = Transaction(
-                    id=tx_id,
-                    user_id=str(payload.get("user_id")),
-                    amount=payload.get("amount"),
-                    currency=payload.get("currency"),
-                    merchant_id=payload.get("merchant_id"),
-                    merchant_category=payload.get("merchant_category"),
-                    timestamp=self._parse_ts(payload.get("timestamp")),
-                    channel=payload.get("channel"),
-                    ip=payload.get("ip"),
-                    lat=(payload.get("geo", {}) or {}).get("lat"),
-                    lon=(payload.get("geo", {}) or {}).get("lon"),
-                    device_id=payload.get("device_id"),
+    async def _dead_letter(self, poison: List[Poison]) -> None:
+        """
+        Park records that can never be processed on the dead-letter topic, with
+        their origin and the error in headers, so they do not block the
+        partition. Raises when the topic cannot take them, and the batch is
+        retried before anything is committed.
+        """
+        dlq = self.settings.KAFKA_DEAD_LETTER_TOPIC
+        if self.dead_letters is not None and dlq:
+            sends = [
+                await self.dead_letters.send(
+                    dlq,
+                    key=msg.key,
+                    value=msg.value,
+                    headers=[
+                        *(msg.headers or ()),
+                        ("x-original-topic", msg.topic.encode()),
+                        ("x-original-partition", str(msg.partition).encode()),
+                        ("x-original-offset", str(msg.offset).encode()),
+                        ("x-error", detail.encode(errors="replace")[:512]),
+                    ],
                 )
-                db.add(t)
-
-            t.score = score
-            t.is_fraud = is_fraud
-            # Auto-approve clean transactions for demo
-            t.status = TransactionStatus.PENDING_REVIEW if is_fraud else TransactionStatus.APPROVED
+                for msg, _, detail in poison
+            ]
+            await asyncio.gather(*sends)
+            logger.warning("dead-lettered %d consumed messages to %s", len(poison), dlq)
+        else:
+            logger.warning("dropped %d unprocessable messages; no dead-letter topic", len(poison))
+        for _, reason, _ in poison:
+            metrics.CONSUMER_DEAD_LETTERED.labels(reason=reason).inc()
 
-            db.commit()
-        except Exception:
-            db.rollback()
-            raise
-        finally:
-            db.close()
+    def _observe(self, batch: List[ConsumerRecord], timings: Dict[str, float]) -> None:
+        """Export a processed batch's stage times, record age and per-partition lag."""
+        assert self.consumer is not None
+        for stage, seconds in timings.items():
+            metrics.CONSUMER_STAGE_LATENCY.labels(stage=stage).observe(seconds)
+        # Record timestamps are epoch ms; -1 when the producer did not set one
+        oldest = min(msg.timestamp for msg in batch)
+        if oldest > 0:
+            metrics.KAFKA_CONSUME_LATENCY.observe(max(0.0, time.time() - oldest / 1000.0))
+        for tp, offset in next_offsets(batch).items():
+            highwater = self.consumer.highwater(tp)
+            if highwater is not None:
+                metrics.KAFKA_CONSUMER_LAG.labels(partition=str(tp.partition)).set(max(0, highwater - offset))
 
 
 _consumer_service: Optional[KafkaConsumerService] = None
@@ -1,34 +1,193 @@
-from typing import Optional
+import asyncio
+import functools
+import logging
+import time
+from typing import List, Optional, Sequence, Set, Tuple
 
 from aiokafka import AIOKafkaProducer
 
 from app.config import get_settings
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
 
 _producer: Optional[AIOKafkaProducer] = None
+# Bounded window of sent-but-unacknowledged messages; full window = backpressure
+_window: Optional[asyncio.Semaphore] = None
+_in_flight = 0
+_dead_letter_tasks: Set[asyncio.Task] = set()
+
+# Kafka record headers: (name, value) pairs
+Headers = List[Tuple[str, bytes]]
 
 
 async def start_producer() -> None:
-    global _producer
+    global _producer, _window
     settings = get_settings()
     if _producer is None:
-        _producer = AIOKafkaProducer(bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS)
+        _producer = AIOKafkaProducer(
+            bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
+            linger_ms=settings.KAFKA_LINGER_MS,
+            max_batch_size=settings.KAFKA_MAX_BATCH_SIZE,
+            compression_type=settings.KAFKA_COMPRESSION_TYPE or None,
+            # The client retries failed batches itself, in order and without duplicates, so a
+            # user's messages (keyed by user_id) keep their partition order
+            enable_idempotence=True,
+            request_timeout_ms=settings.KAFKA_REQUEST_TIMEOUT_MS,
+        )
         await _producer.start()
+        _window = asyncio.Semaphore(max(1, settings.KAFKA_MAX_IN_FLIGHT))
 
 
 async def stop_producer() -> None:
-    global _producer
+    global _producer, _window
     if _producer is not None:
+        # Let queued batches and pending dead-letter sends settle before closing
+        await _producer.flush()
+        if _dead_letter_tasks:
+            await asyncio.gather(*list(_dead_letter_tasks), return_exceptions=True)
         await _producer.stop()
         _producer = None
+        _window = None
+
+
+def in_flight() -> int:
+    """Number of messages sent but not yet acknowledged (or dead-lettered)."""
+    return _in_flight
+
+
+async def is_ready(topic: str) -> bool:
+    """True when the producer is started and the broker returns metadata for `topic`."""
+    if _producer is None:
+        return False
+    return bool(await _producer.partitions_for(topic))
+
+
+async def _acquire_slot() -> bool:
+    global _in_flight
+    if _window is None:
+        return False
+    timeout = get_settings().KAFKA_IN_FLIGHT_TIMEOUT_MS / 1000.0
+    try:
+        await asyncio.wait_for(_window.acquire(), timeout=timeout)
+    except asyncio.TimeoutError:
+        metrics.KAFKA_PRODUCE_REJECTED.inc()
+        return False
+    _in_flight += 1
+    metrics.KAFKA_PRODUCE_IN_FLIGHT.set(_in_flight)
+    return True
+
+
+def _release_slot() -> None:
+    global _in_flight
+    _in_flight -= 1
+    metrics.KAFKA_PRODUCE_IN_FLIGHT.set(_in_flight)
+    if _window is not None:
+        _window.release()
 
 
-async def send_transaction(topic: str, key: bytes, value: bytes) -> bool:
+def _settle(done: Optional[asyncio.Future], delivered: bool) -> None:
+    """Tell a waiting send_batch whether the message reached its topic."""
+    if done is not None and not done.done():
+        done.set_result(delivered)
+
+
+def _on_delivery(
+    topic: str,
+    key: bytes,
+    value: bytes,
+    headers: Optional[Headers],
+    sent_at: float,
+    fut: asyncio.Future,
+    done: Optional[asyncio.Future] = None,
+) -> None:
+    if not fut.cancelled() and fut.exception() is None:
+        metrics.KAFKA_PRODUCE_DELIVERED.inc()
+        metrics.KAFKA_PRODUCE_LATENCY.observe(time.perf_counter() - sent_at)
+        _release_slot()
+        _settle(done, True)
+        return
+    # The client already retried in order; re-sending here would land behind later messages
+    # for the same key. Keep holding the slot while dead-lettering so the window stays honest
+    task = asyncio.ensure_future(_give_up(topic, key, value, headers, done))
+    _dead_letter_tasks.add(task)
+    task.add_done_callback(_dead_letter_tasks.discard)
+
+
+async def _give_up(
+    topic: str, key: bytes, value: bytes, headers: Optional[Headers], done: Optional[asyncio.Future] = None
+) -> None:
+    try:
+        await _dead_letter(topic, key, value, headers)
+    except Exception:
+        logger.exception("dead-lettering key=%r from %s failed", key, topic)
+        metrics.KAFKA_PRODUCE_LOST.inc()
+    _release_slot()
+    _settle(done, False)
+
+
+async def _dead_letter(topic: str, key: bytes, value: bytes, headers: Optional[Headers] = None) -> None:
+    settings = get_settings()
+    dlq = settings.KAFKA_DEAD_LETTER_TOPIC
+    if _producer is None or not dlq:
+        raise RuntimeError("no dead-letter topic available")
+    await _producer.send_and_wait(dlq, value=value, key=key, headers=[*(headers or ()), ("x-original-topic", topic.encode())])
+    metrics.KAFKA_PRODUCE_DEAD_LETTERED.inc()
+    logger.warning("key=%r dead-lettered to %s after the client's retries", key, dlq)
+
+
+async def send_transaction(topic: str, key: bytes, value: bytes, headers: Optional[Headers] = None) -> bool:
     global _producer
     if _producer is None:
         # Kafka disabled or not ready
         return False
+    sent_at = time.perf_counter()
+    if get_settings().KAFKA_PRODUCE_MODE == "ack":
+        try:
+            await _producer.send_and_wait(topic, value=value, key=key, headers=headers)
+            metrics.KAFKA_PRODUCE_LATENCY.observe(time.perf_counter() - sent_at)
+            return True
+        except Exception:
+            return False
+
+    # Async mode: enqueue into the producer batch and return once accepted
+    if not await _acquire_slot():
+        return False
     try:
-        await _producer.send_and_wait(topic, value=value, key=key)
-        return True
+        fut = await _producer.send(topic, value=value, key=key, headers=headers)
     except Exception:
+        _release_slot()
         return False
+    metrics.KAFKA_PRODUCE_ENQUEUED.inc()
+    fut.add_done_callback(lambda f: _on_delivery(topic, key, value, headers, sent_at, f))
+    return True
+
+
+async def send_batch(topic: str, messages: Sequence[Tuple[bytes, bytes, Optional[Headers]]]) -> List[bool]:
+    """
+    Enqueue all (key, value, headers) messages into the producer batch, then
+    await their delivery together. Failed acks are dead-lettered like
+    send_transaction's; a message is True once it reaches `topic`.
+    """
+    global _producer
+    if _producer is None:
+        return [False] * len(messages)
+    loop = asyncio.get_running_loop()
+    settled: List[Optional[asyncio.Future]] = []
+    sent_at = time.perf_counter()
+    for key, value, headers in messages:
+        if not await _acquire_slot():
+            settled.append(None)
+            continue
+        try:
+            fut = await _producer.send(topic, value=value, key=key, headers=headers)
+        except Exception:
+            _release_slot()
+            settled.append(None)
+            continue
+        metrics.KAFKA_PRODUCE_ENQUEUED.inc()
+        done = loop.create_future()
+        fut.add_done_callback(functools.partial(_on_delivery, topic, key, value, headers, sent_at, done=done))
+        settled.append(done)
+    delivered = iter(await asyncio.gather(*(d for d in settled if d is not None)))
+    return [d is not None and next(delivered) for d in settled]
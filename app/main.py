@@ -1,4 +1,7 @@
+import asyncio
+import contextlib
 import logging
+from typing import Optional
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,12 +9,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.config import get_settings, SELECTED_ENV_FILE
 from app.kafka_consumer import start_consumer, stop_consumer
 from app.kafka_producer import start_producer, stop_producer
-from app.models.db import Base, engine
+from app.models.db import Base, async_engine, engine, watch_pools
 from app.routes import health as health_router
 from app.routes import transactions as transactions_router
 from app.routes import auth as auth_router
 from app.routes import fraud as fraud_router
 from app.routes import stats as stats_router
+from app.services import ai, rules
+from app.services.inference import FraudModel
+from app.services.metrics import RequestMetricsMiddleware
 
 
 settings = get_settings()
@@ -26,6 +32,9 @@ logging.getLogger(__name__).info(
 )
 
 app = FastAPI(title="Fraud Detection API", version="0.1.0")
+_rules_watcher: Optional[asyncio.Task] = None
+_pool_watcher: Optional[asyncio.Task] = None
+_model_loader: Optional[asyncio.Task] = None
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,7 +42,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Cache"],
 )
+if settings.ENABLE_METRICS:
+    app.add_middleware(RequestMetricsMiddleware)
 
 # Include routers
 app.include_router(health_router.router)
@@ -48,13 +60,29 @@ async def on_startup() -> None:
     # Simple init without Alembic for demo
     Base.metadata.create_all(bind=engine)
 
+    global _rules_watcher, _pool_watcher, _model_loader
+    rules.get_ruleset()
+    # Load the model off the event loop; /ready reports not_ready until it is in memory
+    _model_loader = asyncio.create_task(asyncio.to_thread(FraudModel.instance))
+    _rules_watcher = asyncio.create_task(rules.watch_rules())
+    if settings.DB_LIVENESS_INTERVAL_S > 0:
+        _pool_watcher = asyncio.create_task(watch_pools(settings.DB_LIVENESS_INTERVAL_S))
+
     if settings.ENABLE_KAFKA:
         await start_producer()
-        await start_consumer()
+        if settings.CONSUMER_IN_API:
+            await start_consumer()
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
+    for task in (_rules_watcher, _pool_watcher, _model_loader):
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(Exception, asyncio.CancelledError):
+                await task
     if settings.ENABLE_KAFKA:
         await stop_consumer()
         await stop_producer()
+    await ai.close_http_client()
+    await async_engine.dispose()
@@ -1,13 +1,19 @@
-from .db import Base, get_db, engine
+from .db import Base, async_engine, engine, get_async_db, get_db
 from .transaction import Transaction, TransactionStatus
 from .review import Review, ReviewDecision
+from .rule import RuleDefinition
+from .stats import StatsRollup
 
 __all__ = [
     "Base",
     "engine",
+    "async_engine",
     "get_db",
+    "get_async_db",
     "Transaction",
     "TransactionStatus",
     "Review",
     "ReviewDecision",
+    "RuleDefinition",
+    "StatsRollup",
 ]
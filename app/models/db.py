@@ -1,9 +1,15 @@
+import asyncio
 import logging
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from typing import Iterator
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from typing import AsyncIterator, Iterator, Union
 
 from app.config import get_settings, SELECTED_ENV_FILE
+from app.services import metrics
 
 
 settings = get_settings()
@@ -15,8 +21,83 @@ logging.getLogger(__name__).info(
     settings.POSTGRES_DSN,
 )
 
-engine = create_engine(settings.POSTGRES_DSN, pool_pre_ping=True, future=True)
+# asyncio drivers used by the API routes for each sync dialect
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def async_dsn(dsn: str) -> URL:
+    """The same database as `dsn`, through its asyncio driver."""
+    url = make_url(dsn)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"no asyncio driver configured for {backend!r}")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+class _PoolMetrics:
+    """Times checkouts and counts overflow connections and timeouts under `pool_name`."""
+
+    pool_name = "db"
+
+    def _do_get(self):
+        overflow = self._overflow
+        start = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except exc.TimeoutError:
+            metrics.DB_POOL_TIMEOUTS.labels(pool=self.pool_name).inc()
+            raise
+        finally:
+            metrics.DB_POOL_WAIT.labels(pool=self.pool_name).observe(time.perf_counter() - start)
+        if self._overflow > max(overflow, 0):
+            metrics.DB_POOL_OVERFLOW_OPENED.labels(pool=self.pool_name).inc()
+        return entry
+
+
+def instrumented_pool(base: type, name: str) -> type:
+    """A `base` pool class reporting metrics as `name`; recreated pools keep the class."""
+    return type(f"{name.title()}{base.__name__}", (_PoolMetrics, base), {"pool_name": name})
+
+
+def pool_options(dsn: Union[str, URL], name: str, size: int, overflow: int, is_async: bool = False) -> dict:
+    """create_engine keyword arguments for a sized, instrumented pool."""
+    opts = dict(pool_pre_ping=settings.DB_POOL_PRE_PING, pool_recycle=settings.DB_POOL_RECYCLE_S)
+    url = make_url(dsn)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory SQLite gets a single shared connection; there is nothing to size
+        return opts
+    base = AsyncAdaptedQueuePool if is_async else QueuePool
+    opts.update(
+        poolclass=instrumented_pool(base, name),
+        pool_size=size,
+        max_overflow=overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT_S,
+    )
+    return opts
+
+
+def _export_pool_gauges(name: str, target: Union[AsyncEngine, Engine]) -> None:
+    # Read on scrape from whichever pool the engine currently has (dispose() replaces it)
+    metrics.DB_POOL_IN_USE.labels(pool=name).set_function(lambda: target.pool.checkedout())
+    metrics.DB_POOL_OVERFLOW.labels(pool=name).set_function(lambda: max(0, target.pool.overflow()))
+
+
+# Consumer upserts, startup and scripts use the sync "writer" engine from worker threads
+engine = create_engine(
+    settings.POSTGRES_DSN,
+    future=True,
+    **pool_options(settings.POSTGRES_DSN, "writer", settings.DB_WRITER_POOL_SIZE, settings.DB_WRITER_MAX_OVERFLOW),
+)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
+# Request handlers await queries on this engine instead of blocking the event loop
+_api_dsn = async_dsn(settings.POSTGRES_DSN)
+async_engine = create_async_engine(
+    _api_dsn,
+    **pool_options(_api_dsn, "api", settings.DB_API_POOL_SIZE, settings.DB_API_MAX_OVERFLOW, is_async=True),
+)
+_export_pool_gauges("writer", engine)
+_export_pool_gauges("api", async_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -30,3 +111,50 @@ def get_db() -> Iterator:
         raise
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def check_pools() -> bool:
+    """
+    Run a trivial query on each pool. A failure disposes that pool, so the
+    connections it held (e.g. to a restarted server) are replaced on the next
+    checkout instead of failing requests one by one.
+    """
+    healthy = True
+    try:
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        healthy = False
+        metrics.DB_LIVENESS_FAILURES.labels(pool="api").inc()
+        logging.getLogger(__name__).warning("[DB] api pool liveness probe failed (%s); resetting it", e)
+        await async_engine.dispose()
+
+    def probe_writer() -> None:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    try:
+        await asyncio.to_thread(probe_writer)
+    except Exception as e:
+        healthy = False
+        metrics.DB_LIVENESS_FAILURES.labels(pool="writer").inc()
+        logging.getLogger(__name__).warning("[DB] writer pool liveness probe failed (%s); resetting it", e)
+        engine.dispose()
+    return healthy
+
+
+async def watch_pools(interval: float) -> None:
+    """Background alternative to DB_POOL_PRE_PING: check_pools() every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        await check_pools()
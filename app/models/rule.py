@@ -0,0 +1,17 @@
+from datetime import datetime
+from sqlalchemy import Column, String, Text, Boolean, Integer, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .db import Base
+
+
+class RuleDefinition(Base):
+    """A declarative fraud rule; `definition` is the JSON object understood by services.rules."""
+
+    __tablename__ = "rule_definitions"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    definition = Column(Text, nullable=False)
+    enabled = Column(Boolean, default=True)
+    position = Column(Integer, default=0)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, DateTime, Integer, String
+
+from .db import Base
+
+
+class StatsRollup(Base):
+    """
+    Transaction counts per UTC hour and day and per (merchant_category,
+    channel, currency), kept in step with `transactions` by services.rollups.
+    Missing dimension values are stored as "".
+    """
+
+    __tablename__ = "stats_rollups"
+
+    granularity = Column(String(8), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    merchant_category = Column(String, primary_key=True, default="")
+    channel = Column(String, primary_key=True, default="")
+    currency = Column(String, primary_key=True, default="")
+    count_fraud = Column(Integer, nullable=False, default=0)
+    count_clean = Column(Integer, nullable=False, default=0)
+    count_approved = Column(Integer, nullable=False, default=0)
+    count_pending = Column(Integer, nullable=False, default=0)
+    count_rejected = Column(Integer, nullable=False, default=0)
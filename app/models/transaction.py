@@ -45,5 +45,24 @@ class Transaction(Base):
 
     __table_args__ = (
         Index("ix_user_ts", "user_id", "timestamp"),
-        Index("ix_is_fraud", "is_fraud"),
     )
+
+
+# Flagged queue keyset scans: (timestamp, id) DESC over fraud rows only, with
+# and without a status filter. Partial, so they stay small next to the table.
+_flagged = Transaction.is_fraud.is_(True)
+Index(
+    "ix_flagged_ts_id",
+    Transaction.timestamp.desc(),
+    Transaction.id.desc(),
+    postgresql_where=_flagged,
+    sqlite_where=_flagged,
+)
+Index(
+    "ix_flagged_status_ts_id",
+    Transaction.status,
+    Transaction.timestamp.desc(),
+    Transaction.id.desc(),
+    postgresql_where=_flagged,
+    sqlite_where=_flagged,
+)
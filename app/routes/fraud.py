@@ -1,12 +1,15 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import Transaction, TransactionStatus, Review, ReviewDecision
-from app.models.db import get_db
+from app.models.db import get_async_db
 from app.schemas.review import ReviewIn, OkResponse
 from app.schemas.transaction import TransactionDetail, TransactionListItem
 from app.services.auth import get_current_user
+from app.services import flagged, rollups
+from app.services.cache import get_detail_cache, get_stats_cache
 
 router = APIRouter(prefix="/fraud", tags=["fraud"])
 
@@ -15,74 +18,55 @@ router = APIRouter(prefix="/fraud", tags=["fraud"])
 async def get_flagged(
     limit: int = Query(50, ge=1, le=200),
     status: Optional[TransactionStatus] = Query(None),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    db: AsyncSession = Depends(get_async_db),
     _: str = Depends(get_current_user),
 ):
-    q = db.query(Transaction).filter(Transaction.is_fraud.is_(True))
-    if status is not None:
-        q = q.filter(Transaction.status == status)
-    q = q.order_by(Transaction.timestamp.desc()).limit(limit)
-    items = [
-        TransactionListItem(
-            id=t.id,
-            user_id=t.user_id,
-            amount=float(t.amount) if t.amount is not None else None,
-            currency=t.currency,
-            merchant_id=t.merchant_id,
-            merchant_category=t.merchant_category,
-            timestamp=t.timestamp,
-            score=t.score,
-            status=t.status,
-        )
-        for t in q.all()
-    ]
-    return items
+    try:
+        items, next_cursor, source = await flagged.flagged_page(db, limit, status, cursor)
+    except flagged.InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Entries already have TransactionListItem's types; encode them as they are
+    headers = {"X-Cache": source}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=flagged.page_body(items), media_type="application/json", headers=headers)
 
 
 @router.get("/tx/{id}", response_model=TransactionDetail)
 async def get_detail(
     id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     _: str = Depends(get_current_user),
 ):
-    t = db.query(Transaction).filter(Transaction.id == id).one_or_none()
-    if not t:
+    # A tx:{id} left behind by a lost review update is replaced before it can be read
+    await flagged.repair_redis_queue()
+    # Cached bodies are already in TransactionDetail's shape; send them as they are
+    body, source = await get_detail_cache().get(id, lambda: db.run_sync(flagged.load_entry, id))
+    if body is None:
         raise HTTPException(status_code=404, detail="Not found")
-    return TransactionDetail(
-        id=t.id,
-        user_id=t.user_id,
-        amount=float(t.amount) if t.amount is not None else None,
-        currency=t.currency,
-        merchant_id=t.merchant_id,
-        merchant_category=t.merchant_category,
-        timestamp=t.timestamp,
-        channel=t.channel,
-        ip=t.ip,
-        lat=float(t.lat) if t.lat is not None else None,
-        lon=float(t.lon) if t.lon is not None else None,
-        device_id=t.device_id,
-        score=t.score,
-        is_fraud=t.is_fraud,
-        status=t.status,
-    )
+    return Response(content=body, media_type="application/json", headers={"X-Cache": source})
 
 
 @router.post("/review/{id}", response_model=OkResponse)
 async def review(
     id: str,
     body: ReviewIn,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     reviewer: str = Depends(get_current_user),
 ):
-    t = db.query(Transaction).filter(Transaction.id == id).one_or_none()
+    # Lock the row so the rollup delta is taken against the status we overwrite
+    t = (await db.execute(select(Transaction).where(Transaction.id == id).with_for_update())).scalar_one_or_none()
     if not t:
         raise HTTPException(status_code=404, detail="Not found")
 
-    t.status = (
-        TransactionStatus.APPROVED if body.decision == ReviewDecision.APPROVED else TransactionStatus.REJECTED
-    )
+    previous = t.status
+    status = TransactionStatus.APPROVED if body.decision == ReviewDecision.APPROVED else TransactionStatus.REJECTED
+    t.status = status
+    conn = await db.connection()
+    await conn.run_sync(rollups.apply_deltas, rollups.status_delta(t, previous, status))
 
-    existing = db.query(Review).filter(Review.transaction_id == id).one_or_none()
+    existing = (await db.execute(select(Review).where(Review.transaction_id == id))).scalar_one_or_none()
     if existing:
         existing.decision = body.decision
         existing.notes = body.notes
@@ -92,5 +76,9 @@ async def review(
             Review(transaction_id=id, reviewer=reviewer, decision=body.decision, notes=body.notes)
         )
 
-    db.flush()
+    # Commit before invalidating so a concurrent refill cannot cache the old counts
+    await db.commit()
+    await get_stats_cache().bump()
+    await flagged.set_cached_status(id, status)
+    await get_detail_cache().invalidate(id)
     return OkResponse(ok=True)
@@ -1,7 +1,40 @@
-from fastapi import APIRouter
+import asyncio
+from typing import Awaitable, Callable, Dict
+
+from fastapi import APIRouter, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import text
+
+from app import kafka_producer
+from app.config import get_settings
+from app.models.db import async_engine
+from app.services.cache import get_cache
+from app.services.inference import FraudModel
 
 router = APIRouter(tags=["health"])
 
+# Checks whose failure takes the instance out of rotation; Redis only degrades it
+# (the flagged queue, caches and velocity counters all fall back without it)
+REQUIRED = ("model", "db", "kafka")
+
+
+async def _db() -> bool:
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    return True
+
+
+async def _redis() -> bool:
+    return bool(await get_cache().client.ping())
+
+
+async def _check(probe: Callable[[], Awaitable[bool]], timeout: float) -> str:
+    try:
+        return "ok" if await asyncio.wait_for(probe(), timeout) else "fail"
+    except Exception:
+        return "fail"
+
 
 @router.get("/health")
 async def health() -> dict:
@@ -9,5 +42,35 @@ async def health() -> dict:
 
 
 @router.get("/ready")
-async def ready() -> dict:
-    return {"status": "ready"}
+async def ready() -> JSONResponse:
+    """
+    Readiness of this instance: model loaded, database and Kafka reachable
+    (503 otherwise), Redis reachable ("degraded" but still 200 otherwise).
+    """
+    settings = get_settings()
+    timeout = settings.READY_TIMEOUT_S
+    db, redis, kafka = await asyncio.gather(
+        _check(_db, timeout),
+        _check(_redis, timeout),
+        _check(lambda: kafka_producer.is_ready(settings.KAFKA_TRANSACTIONS_TOPIC), timeout)
+        if settings.ENABLE_KAFKA
+        else asyncio.sleep(0, "disabled"),
+    )
+    checks: Dict[str, str] = {
+        "model": "ok" if FraudModel.is_loaded() else "loading",
+        "db": db,
+        "redis": redis,
+        "kafka": kafka,
+    }
+    if any(checks[name] not in ("ok", "disabled") for name in REQUIRED):
+        status, code = "not_ready", 503
+    elif checks["redis"] != "ok":
+        status, code = "degraded", 200
+    else:
+        status, code = "ready", 200
+    return JSONResponse({"status": status, "checks": checks}, status_code=code)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
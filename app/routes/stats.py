@@ -1,25 +1,63 @@
+import asyncio
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.db import get_db
+from app.models.db import get_async_db
 from app.services.auth import get_current_user
-from app.services.stats import compute_stats
+from app.services import stats as stats_service
+from app.services.cache import get_stats_cache
 from app.services.ai import call_gemini
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/fraud", tags=["stats"])
 
 
+async def cached_stats(
+    db: AsyncSession,
+    window: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = "day",
+    group_by: Optional[List[str]] = None,
+) -> tuple:
+    """fetch_stats and shape_stats through the response cache; returns (stats, cache source)."""
+    group_by = [g.strip() for spec in group_by or [] for g in spec.split(",") if g.strip()]
+    key = "|".join(
+        [window, start.isoformat() if start else "", end.isoformat() if end else "", granularity, ",".join(group_by)]
+    )
+
+    async def compute() -> Dict:
+        # The queries are awaited on the async engine; merging up to MAX_BUCKETS rows runs in a thread
+        rows = await db.run_sync(
+            lambda session: stats_service.fetch_stats(
+                session, window, start=start, end=end, granularity=granularity, group_by=group_by
+            )
+        )
+        return await asyncio.to_thread(stats_service.shape_stats, rows)
+
+    try:
+        return await get_stats_cache().get(key, compute)
+    except stats_service.StatsQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/stats")
 async def stats(
-    window: str = Query("7d"),
-    db: Session = Depends(get_db),
+    response: Response,
+    window: str = Query("7d", description="Trailing window such as 90m, 12h, 7d; ignored when `from` is given"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to", description="Defaults to now"),
+    granularity: str = Query("day", pattern="^(minute|hour|day)$"),
+    group_by: Optional[List[str]] = Query(None, description="merchant_category, channel and/or currency"),
+    db: AsyncSession = Depends(get_async_db),
     _: str = Depends(get_current_user),
 ) -> Dict:
-    return compute_stats(db, window)
+    result, source = await cached_stats(db, window, start, end, granularity, group_by)
+    response.headers["X-Cache"] = source
+    return result
 
 
 class AIRequest(BaseModel):
@@ -30,10 +68,10 @@ class AIRequest(BaseModel):
 @router.post("/stats/ai")
 async def stats_ai(
     body: AIRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     _: str = Depends(get_current_user),
 ) -> Dict:
-    stats = compute_stats(db, body.window)
-    result = call_gemini(body.prompt, stats)
+    stats, _source = await cached_stats(db, body.window)
+    result = await call_gemini(body.prompt, stats)
     # Pass through the original stats window for client reference
     return {"window": body.window, "insight": result.get("insight"), "chartSpec": result.get("chartSpec")}
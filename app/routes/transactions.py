@@ -1,39 +1,145 @@
-import json
-from fastapi import APIRouter, HTTPException
+from typing import List, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
 from app.config import get_settings
 from app import kafka_producer
-from app.schemas.transaction import TransactionIn, EnqueueResponse
+from app.schemas.transaction import (
+    BulkIngestResponse,
+    BulkRowResult,
+    EnqueueResponse,
+    IngestDecision,
+    TransactionIn,
+)
 from app.models.db import SessionLocal
 from app.models import Transaction, TransactionStatus
 from app.services.cache import get_cache
 from app.services.inference import FraudModel
-from app.services import rules
+from app.services import wire
+from app.services.admission import AdmissionTicket, admit, admit_bulk
+from app.services.bulk import RowError, iter_rows
+from app.services.decision import decide_batch, decide_one
+from app.services.features import read_velocity_with_source
 
 router = APIRouter(tags=["transactions"])
 
 
-@router.post("/transactions", response_model=EnqueueResponse)
-async def post_transaction(body: TransactionIn) -> EnqueueResponse:
+@router.post(
+    "/transactions", response_model=EnqueueResponse, response_model_exclude_none=True, dependencies=[Depends(admit)]
+)
+async def post_transaction(body: TransactionIn, decision: bool = False) -> EnqueueResponse:
+    """
+    Score a transaction and enqueue it. The verdict travels with the message in
+    Kafka headers so the consumer does not score it again; `decision=true` also
+    returns it in the response.
+    """
     settings = get_settings()
 
     # Pydantic v2: ensure datetime/UUID are JSON-serializable
     payload = body.model_dump(mode="json")
+    try:
+        value = wire.encode(payload, settings.KAFKA_WIRE_FORMAT)
+    except wire.WireFormatError as e:
+        # Valid JSON the wire format cannot carry (NUL in a string, over 64 KiB of strings)
+        raise HTTPException(status_code=422, detail=str(e))
 
-    # Ensure transaction_id is a str UUID for Kafka key
-    tx_id = str(body.transaction_id)
-
-    # Rule-based pre-checks
-    rules_flag, reasons = rules.evaluate_transaction(payload)
-    # Model scoring
-    model = FraudModel.instance()
-    score, model_flag = model.predict_from_transaction(payload)
-    is_fraud = bool(rules_flag or model_flag)
+    # Rule-based pre-checks and model scoring
+    velocity, source = await read_velocity_with_source([payload])
+    verdict, reasons = decide_one(payload, velocity[0] if velocity else None, FraudModel.instance(), source)
 
     enqueued = await kafka_producer.send_transaction(
-        topic=settings.KAFKA_TRANSACTIONS_TOPIC, key=tx_id.encode(), value=json.dumps(payload).encode()
+        topic=settings.KAFKA_TRANSACTIONS_TOPIC,
+        # Keyed by user so one partition (and one consumer) sees a user's transactions in order
+        key=body.user_id.encode(),
+        value=value,
+        headers=verdict.headers(),
     )
     if not enqueued:
         raise HTTPException(status_code=503, detail="Kafka unavailable")
-    return EnqueueResponse(enqueued=True, id=body.transaction_id)
+    if not decision:
+        return EnqueueResponse(enqueued=True, id=body.transaction_id)
+    return EnqueueResponse(
+        enqueued=True,
+        id=body.transaction_id,
+        decision=IngestDecision(
+            score=verdict.score,
+            is_fraud=verdict.is_fraud,
+            reasons=reasons,
+            model_version=verdict.model_version,
+            rules_version=verdict.rules_version,
+        ),
+    )
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc']) or 'row'}: {e['msg']}" for e in exc.errors())
+
+
+async def _ingest_batch(rows: List[Tuple[int, TransactionIn]], topic: str) -> List[BulkRowResult]:
+    wire_format = get_settings().KAFKA_WIRE_FORMAT
+    results: List[BulkRowResult] = []
+    sendable: List[Tuple[int, TransactionIn]] = []
+    payloads: List[dict] = []
+    values: List[bytes] = []
+    for i, tx in rows:
+        payload = tx.model_dump(mode="json")
+        try:
+            values.append(wire.encode(payload, wire_format))
+        except wire.WireFormatError as e:
+            results.append(BulkRowResult(index=i, id=tx.transaction_id, accepted=False, error=str(e)))
+            continue
+        sendable.append((i, tx))
+        payloads.append(payload)
+    if not sendable:
+        return results
+
+    # Rule-based pre-checks and model scoring, once for the whole batch
+    velocity, source = await read_velocity_with_source(payloads)
+    verdicts = decide_batch(payloads, velocity, FraudModel.instance(), source)
+
+    acks = await kafka_producer.send_batch(
+        topic,
+        [(tx.user_id.encode(), value, v.headers()) for (_, tx), value, v in zip(sendable, values, verdicts)],
+    )
+    results.extend(
+        BulkRowResult(index=i, id=tx.transaction_id, accepted=ok, error=None if ok else "Kafka unavailable")
+        for (i, tx), ok in zip(sendable, acks)
+    )
+    return results
+
+
+@router.post("/transactions/bulk", response_model=BulkIngestResponse)
+async def post_transactions_bulk(
+    request: Request, ticket: AdmissionTicket = Depends(admit_bulk)
+) -> BulkIngestResponse:
+    """
+    Ingest a JSON array or NDJSON body of transactions. Rows are validated as
+    the body streams in and are scored and produced in batches of BULK_BATCH_SIZE.
+    """
+    settings = get_settings()
+    batch_size = max(1, settings.BULK_BATCH_SIZE)
+    results: List[BulkRowResult] = []
+    pending: List[Tuple[int, TransactionIn]] = []
+
+    async for index, row in iter_rows(request.stream()):
+        if isinstance(row, RowError):
+            results.append(BulkRowResult(index=index, accepted=False, error=str(row)))
+            continue
+        try:
+            tx = TransactionIn.model_validate(row)
+        except ValidationError as e:
+            results.append(BulkRowResult(index=index, accepted=False, error=_validation_message(e)))
+            continue
+        pending.append((index, tx))
+        if len(pending) >= batch_size:
+            results.extend(await _ingest_batch(pending, settings.KAFKA_TRANSACTIONS_TOPIC))
+            pending = []
+    if pending:
+        results.extend(await _ingest_batch(pending, settings.KAFKA_TRANSACTIONS_TOPIC))
+
+    results.sort(key=lambda r: r.index)
+    # Admission control compares per-row latency across bulk requests
+    ticket.units = len(results)
+    accepted = sum(1 for r in results if r.accepted)
+    return BulkIngestResponse(accepted=accepted, rejected=len(results) - accepted, results=results)
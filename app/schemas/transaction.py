@@ -1,6 +1,6 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
 from app.models.transaction import TransactionStatus
@@ -25,9 +25,32 @@ class TransactionIn(BaseModel):
     device_id: Optional[str] = None
 
 
+class IngestDecision(BaseModel):
+    score: float
+    is_fraud: bool
+    reasons: List[str]
+    model_version: str
+    rules_version: str
+
+
 class EnqueueResponse(BaseModel):
     enqueued: bool
     id: str
+    # Only with ?decision=true
+    decision: Optional[IngestDecision] = None
+
+
+class BulkRowResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    accepted: bool
+    error: Optional[str] = None
+
+
+class BulkIngestResponse(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[BulkRowResult]
 
 
 class TransactionListItem(BaseModel):
@@ -0,0 +1,149 @@
+from __future__ import annotations
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app import kafka_producer
+from app.config import get_settings
+from app.services import metrics
+
+# Ingest endpoints with a latency window of their own
+SINGLE = "single"
+BULK = "bulk"
+
+
+class AdmissionTicket:
+    """Handed to an admitted request. Its latency is divided by `units` (rows, for bulk) before it is recorded."""
+
+    __slots__ = ("units",)
+
+    def __init__(self) -> None:
+        self.units = 1
+
+
+class _LatencyWindow:
+    def __init__(self) -> None:
+        # (finished_at, seconds), oldest first, plus their running sum
+        self.samples: Deque[Tuple[float, float]] = deque()
+        self.total = 0.0
+
+    def expire(self, cutoff: float) -> None:
+        while self.samples and self.samples[0][0] < cutoff:
+            self.total -= self.samples.popleft()[1]
+
+
+class AdmissionController:
+    """
+    Load shedding for the ingest endpoints. A request is turned away with 429
+    before any work is done when one of the limits is reached (0 disables a
+    limit):
+
+    - `max_in_flight` admitted requests still running in this process;
+    - `max_producer_queue` messages waiting for a Kafka ack;
+    - `max_latency_ms` mean latency of the requests to the same endpoint
+      completed in the last `window_s` seconds, once at least `min_samples`
+      completed there (a lone cold-start request does not shed). Samples age
+      out, so shedding on latency stops by itself once the window passes.
+      Each endpoint has its own window, and bulk requests are recorded per
+      row, so a multi-second bulk upload does not shed single ingests.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 512,
+        max_producer_queue: int = 8000,
+        max_latency_ms: float = 500.0,
+        window_s: float = 5.0,
+        min_samples: int = 20,
+        retry_after_s: int = 1,
+        producer_queue: Callable[[], int] = kafka_producer.in_flight,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_producer_queue = max_producer_queue
+        self.max_latency_ms = max_latency_ms
+        self.window_s = window_s
+        self.min_samples = min_samples
+        self.retry_after_s = retry_after_s
+        self.producer_queue = producer_queue
+        self.in_flight = 0
+        self._windows: Dict[str, _LatencyWindow] = {}
+
+    def _window(self, endpoint: str) -> _LatencyWindow:
+        window = self._windows.get(endpoint)
+        if window is None:
+            window = self._windows[endpoint] = _LatencyWindow()
+        return window
+
+    def recent_latency_ms(self, endpoint: str = SINGLE) -> Optional[float]:
+        window = self._window(endpoint)
+        window.expire(time.monotonic() - self.window_s)
+        if len(window.samples) < max(self.min_samples, 1):
+            return None
+        return 1000.0 * window.total / len(window.samples)
+
+    def observe(self, seconds: float, endpoint: str = SINGLE) -> None:
+        now = time.monotonic()
+        window = self._window(endpoint)
+        window.samples.append((now, seconds))
+        window.total += seconds
+        window.expire(now - self.window_s)
+
+    def reject_reason(self, endpoint: str = SINGLE) -> Optional[str]:
+        """Why a new request to `endpoint` should be shed right now, or None to admit it."""
+        if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+            return "in_flight"
+        if self.max_producer_queue > 0 and self.producer_queue() >= self.max_producer_queue:
+            return "producer_queue"
+        if self.max_latency_ms > 0:
+            latency = self.recent_latency_ms(endpoint)
+            if latency is not None and latency > self.max_latency_ms:
+                return "latency"
+        return None
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        settings = get_settings()
+        _controller = AdmissionController(
+            max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+            max_producer_queue=settings.ADMISSION_MAX_PRODUCER_QUEUE,
+            max_latency_ms=settings.ADMISSION_MAX_LATENCY_MS,
+            window_s=settings.ADMISSION_LATENCY_WINDOW_S,
+            min_samples=settings.ADMISSION_LATENCY_MIN_SAMPLES,
+            retry_after_s=settings.ADMISSION_RETRY_AFTER_S,
+        )
+    return _controller
+
+
+def _admission(endpoint: str) -> Callable[[], AsyncIterator[AdmissionTicket]]:
+    async def dependency() -> AsyncIterator[AdmissionTicket]:
+        """FastAPI dependency: 429 + Retry-After when overloaded, otherwise track the request."""
+        controller = get_admission()
+        reason = controller.reject_reason(endpoint)
+        if reason is not None:
+            metrics.ADMISSION_REJECTED.labels(reason=reason).inc()
+            raise HTTPException(
+                status_code=429,
+                detail=f"Overloaded ({reason}); retry later",
+                headers={"Retry-After": str(controller.retry_after_s)},
+            )
+        controller.in_flight += 1
+        ticket = AdmissionTicket()
+        start = time.perf_counter()
+        try:
+            yield ticket
+        finally:
+            controller.in_flight -= 1
+            controller.observe((time.perf_counter() - start) / max(ticket.units, 1), endpoint)
+
+    return dependency
+
+
+admit = _admission(SINGLE)
+admit_bulk = _admission(BULK)
@@ -3,6 +3,9 @@ import httpx
 from typing import Any, Dict, Optional
 from app.config import get_settings
 
+# One pooled client per process; connections to the Gemini API are reused across requests
+_client: Optional[httpx.AsyncClient] = None
+
 SYSTEM_INSTRUCTIONS = (
     "You are an analytics assistant for a fraud detection dashboard. "
     "Given JSON stats (totals and daily time series), produce: \n"
@@ -15,7 +18,24 @@ SYSTEM_INSTRUCTIONS = (
 )
 
 
-def call_gemini(prompt: str, stats_json: Dict[str, Any]) -> Dict[str, Any]:
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30, connect=5),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def call_gemini(prompt: str, stats_json: Dict[str, Any]) -> Dict[str, Any]:
     settings = get_settings()
     api_key = settings.GEMINI_API_KEY or ""
     model = settings.GEMINI_MODEL or "gemini-2.5-flash"
@@ -43,10 +63,9 @@ def call_gemini(prompt: str, stats_json: Dict[str, Any]) -> Dict[str, Any]:
     }
 
     try:
-        with httpx.Client(timeout=30) as client:
-            r = client.post(generation_url, headers=headers, params=params, json=payload)
-            r.raise_for_status()
-            data = r.json()
+        r = await get_http_client().post(generation_url, headers=headers, params=params, json=payload)
+        r.raise_for_status()
+        data = r.json()
     except Exception as e:
         return {"insight": f"AI service call failed: {e}", "chartSpec": None}
 
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import codecs
+import json
+from typing import Any, AsyncIterator, List, Tuple
+
+
+# Largest single row we are willing to buffer while waiting for it to complete
+MAX_ROW_BYTES = 1 << 20
+
+
+class RowError(Exception):
+    """A row (or the remainder of the body) could not be decoded as JSON."""
+
+
+class _NDJSONParser:
+    def __init__(self) -> None:
+        self.buf = b""
+
+    def feed(self, chunk: bytes, final: bool = False) -> List[Any]:
+        self.buf += chunk
+        lines = self.buf.split(b"\n")
+        self.buf = b"" if final else lines.pop()
+        if len(self.buf) > MAX_ROW_BYTES:
+            raise RowError(f"row exceeds {MAX_ROW_BYTES} bytes")
+        out: List[Any] = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                out.append(json.loads(line))
+            except ValueError as e:
+                out.append(RowError(f"invalid JSON: {e}"))
+        return out
+
+
+class _JSONArrayParser:
+    """Decodes the elements of a top-level JSON array as their bytes arrive."""
+
+    _WS = " \t\r\n"
+
+    def __init__(self) -> None:
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.state = "start"  # start -> value -> sep -> ... -> end
+
+    def feed(self, chunk: bytes, final: bool = False) -> List[Any]:
+        self.buf += self.text.decode(chunk, final=final)
+        out: List[Any] = []
+        buf, pos, n = self.buf, 0, len(self.buf)
+        while True:
+            while pos < n and buf[pos] in self._WS:
+                pos += 1
+            if pos >= n:
+                break
+            ch = buf[pos]
+            if self.state == "start":
+                if ch != "[":
+                    raise RowError("body must be a JSON array or NDJSON")
+                self.state = "first"
+                pos += 1
+            elif self.state in ("first", "value"):
+                if ch == "]" and self.state == "first":
+                    self.state = "end"
+                    pos += 1
+                    continue
+                try:
+                    value, end = self.decoder.raw_decode(buf, pos)
+                except ValueError:
+                    # Either incomplete (wait for more) or malformed (reported at the end)
+                    break
+                if end >= n and not final:
+                    # A number could still continue in the next chunk
+                    break
+                out.append(value)
+                pos = end
+                self.state = "sep"
+            elif self.state == "sep":
+                if ch == ",":
+                    self.state = "value"
+                elif ch == "]":
+                    self.state = "end"
+                else:
+                    raise RowError(f"expected ',' or ']' at offset {pos}")
+                pos += 1
+            else:
+                raise RowError("unexpected data after the closing ']'")
+        self.buf = buf[pos:]
+        if len(self.buf) > MAX_ROW_BYTES:
+            raise RowError(f"row exceeds {MAX_ROW_BYTES} bytes")
+        if final and (self.buf.strip() or self.state not in ("end", "start")):
+            raise RowError("truncated or malformed JSON array")
+        return out
+
+
+async def iter_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yield (index, row) for each row of a JSON array or NDJSON body without
+    buffering the whole body. Undecodable NDJSON lines are yielded as RowError;
+    a malformed JSON array yields one final RowError and stops.
+    """
+    parser = None
+    head = b""
+    index = 0
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if parser is None:
+                head += chunk
+                stripped = head.lstrip()
+                if not stripped:
+                    continue
+                parser = _JSONArrayParser() if stripped[:1] == b"[" else _NDJSONParser()
+                chunk, head = head, b""
+            for row in parser.feed(chunk):
+                yield index, row
+                index += 1
+        if parser is not None:
+            for row in parser.feed(b"", final=True):
+                yield index, row
+                index += 1
+    except RowError as e:
+        yield index, e
@@ -1,35 +1,678 @@
+import asyncio
 import json
-from typing import Any, List, Optional
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
+import orjson
 import redis.asyncio as redis
 
 from app.config import get_settings
+from app.models.transaction import TransactionStatus
+from app.services import metrics
+from app.services.features import DIMENSIONS, WINDOWS, event_time
+
+
+logger = logging.getLogger(__name__)
+
+# Members per ZREM/DEL call, well under Lua's unpack() limit
+_LUA_CHUNK = 500
+
+# KEYS: the queue set, the status sets, tx:{id} per pushed entry, tx:{id} per cleared id.
+# ARGV: ttl, max members, expiry horizon, pending status, number of status sets, number of pushed entries,
+# the status of each set, then id, entry, score ("" when not queued) and status per pushed entry, then cleared ids.
+# Returns the number of entries queued.
+_PUSH_FLAGGED_LUA = """
+local ttl, max_flagged, horizon, pending = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3], ARGV[4]
+local ns, np = tonumber(ARGV[5]), tonumber(ARGV[6])
+local sets, by_status = {KEYS[1]}, {}
+for s = 1, ns do
+  sets[#sets + 1] = KEYS[1 + s]
+  by_status[ARGV[6 + s]] = KEYS[1 + s]
+end
+local function chunked(cmd, key, items)
+  for i = 1, #items, %(chunk)d do
+    if key then
+      redis.call(cmd, key, unpack(items, i, math.min(i + %(chunk)d - 1, #items)))
+    else
+      redis.call(cmd, unpack(items, i, math.min(i + %(chunk)d - 1, #items)))
+    end
+  end
+end
+local queued = 0
+for i = 1, np do
+  local key = KEYS[1 + ns + i]
+  local a = 6 + ns + (i - 1) * 4
+  local id, entry, score, status = ARGV[a + 1], ARGV[a + 2], ARGV[a + 3], ARGV[a + 4]
+  -- A review that reached Redis first stands; pending entries never replace it
+  local reviewed = false
+  if status == pending then
+    local cur = redis.call("GET", key)
+    if cur then
+      local ok, old = pcall(cjson.decode, cur)
+      reviewed = ok and type(old) == "table" and type(old.status) == "string" and old.status ~= pending
+    end
+  end
+  if not reviewed then
+    redis.call("SET", key, entry, "EX", ttl)
+    if score ~= "" then
+      redis.call("ZADD", KEYS[1], score, id)
+      for s, set in pairs(by_status) do
+        if s == status then
+          redis.call("ZADD", set, score, id)
+        else
+          redis.call("ZREM", set, id)
+        end
+      end
+      queued = queued + 1
+    end
+  end
+end
+local cleared, cleared_keys = {}, {}
+for i = 7 + ns + np * 4, #ARGV do
+  cleared[#cleared + 1] = ARGV[i]
+  cleared_keys[#cleared_keys + 1] = KEYS[2 + ns + np + #cleared_keys]
+end
+if #cleared > 0 then
+  for _, set in ipairs(sets) do
+    chunked("ZREM", set, cleared)
+  end
+  chunked("DEL", nil, cleared_keys)
+end
+if queued > 0 then
+  -- Members whose tx:{id} has expired or that fell off the end of the queue
+  for _, set in ipairs(sets) do
+    redis.call("ZREMRANGEBYSCORE", set, "-inf", horizon)
+    redis.call("ZREMRANGEBYRANK", set, 0, -max_flagged - 1)
+  end
+end
+return queued
+""" % {"chunk": _LUA_CHUNK}
 
 
 class RedisCache:
-    def __init__(self, url: str):
+    """
+    Redis-side copy of the head of the flagged queue. Each flagged
+    transaction is kept at tx:{id} (JSON, expiring after `tx_ttl` seconds)
+    and in sorted sets scored by event time: one for the whole queue and one
+    per review status. Sets hold the newest `max_flagged` members; Postgres
+    remains the source of truth for anything older or missing. While
+    flagged:stale is set, pushes have been lost and readers go to Postgres.
+    """
+
+    KEY_FLAGGED = "flagged:all"
+    KEY_STALE = "flagged:stale"
+
+    def __init__(self, url: str, max_flagged: int = 10_000, tx_ttl: int = 7 * 86400):
         self.client = redis.from_url(url, decode_responses=True)
-        self.key_recent = "flagged_recent"
-        self.max_recent = 100
+        self.max_flagged = max_flagged
+        self.tx_ttl = tx_ttl
+        self._down_until = 0.0
+        # Reviewed ids whose status update this process could not write; see flagged.repair_redis_queue
+        self.lost_reviews: Set[str] = set()
+
+    def available(self) -> bool:
+        """False while backing off after a failure reported through mark_down()."""
+        return time.monotonic() >= self._down_until
+
+    def mark_down(self, retry_after: float) -> None:
+        self._down_until = time.monotonic() + retry_after
+
+    @staticmethod
+    def status_key(status: str) -> str:
+        return f"flagged:status:{status}"
 
     async def push_flagged(self, tx_id: str, payload: Optional[dict] = None) -> None:
-        pipe = self.client.pipeline()
-        await pipe.lpush(self.key_recent, tx_id)
-        await pipe.ltrim(self.key_recent, 0, self.max_recent - 1)
-        if payload is not None:
-            await pipe.set(f"tx:{tx_id}", json.dumps(payload))
-        await pipe.execute()
+        await self.push_flagged_many([(tx_id, payload)])
+
+    async def push_flagged_many(
+        self, items: Iterable[Tuple[str, Optional[dict]]], cleared: Sequence[str] = ()
+    ) -> None:
+        """
+        Add a batch of flagged transactions, as (id, entry) with entries
+        carrying at least `timestamp` (ISO) and `status`, and drop the
+        `cleared` ids (no longer flagged) from the queue and tx:{id}, in one
+        atomic script call. Entries without a timestamp are stored but not
+        queued. A PENDING_REVIEW entry does not replace one a review has
+        already moved on, so a replay racing a review cannot undo it.
+        """
+        statuses = [s.value for s in TransactionStatus]
+        pushed: List[Tuple[str, dict]] = [(tx_id, payload) for tx_id, payload in items if payload is not None]
+        if not pushed and not cleared:
+            return
+        keys = [self.KEY_FLAGGED] + [self.status_key(s) for s in statuses]
+        args: List[Any] = [
+            self.tx_ttl,
+            self.max_flagged,
+            time.time() - self.tx_ttl,
+            TransactionStatus.PENDING_REVIEW.value,
+            len(statuses),
+            len(pushed),
+            *statuses,
+        ]
+        for tx_id, payload in pushed:
+            queued = payload.get("timestamp") and self.max_flagged
+            keys.append(f"tx:{tx_id}")
+            args.extend((
+                tx_id,
+                orjson.dumps(payload),
+                repr(datetime.fromisoformat(payload["timestamp"]).timestamp()) if queued else "",
+                payload.get("status") or "",
+            ))
+        keys.extend(f"tx:{tx_id}" for tx_id in cleared)
+        args.extend(cleared)
+        script = self.client.register_script(_PUSH_FLAGGED_LUA)
+        with metrics.REDIS_LATENCY.labels(op="push_flagged").time():
+            await script(keys=keys, args=args)
+
+    async def mark_flagged_stale(self) -> None:
+        await self.client.set(self.KEY_STALE, 1)
+
+    async def clear_flagged_stale(self) -> None:
+        await self.client.delete(self.KEY_STALE)
+
+    async def flagged_stale(self) -> bool:
+        return bool(await self.client.exists(self.KEY_STALE))
 
     async def recent_flagged_ids(self, limit: int = 50) -> List[str]:
-        return await self.client.lrange(self.key_recent, 0, max(0, limit - 1))
+        return await self.client.zrevrange(self.KEY_FLAGGED, 0, max(0, limit - 1))
+
+    async def flagged_page_ids(
+        self, limit: int, status: Optional[str] = None, after: Optional[Tuple[float, str]] = None
+    ) -> Optional[List[Tuple[str, float]]]:
+        """
+        Up to `limit` (id, score) pairs, score then id descending, strictly
+        after the position `after` = (score, id). Equal scores are ordered by
+        member, so the order matches the SQL keyset (timestamp DESC, id DESC).
+        None while the queue is marked stale.
+        """
+        key = self.status_key(status) if status else self.KEY_FLAGGED
+        pipe = self.client.pipeline(transaction=False)
+        pipe.exists(self.KEY_STALE)
+        if after is None:
+            pipe.zrevrangebyscore(key, "+inf", "-inf", start=0, num=limit, withscores=True)
+            with metrics.REDIS_LATENCY.labels(op="flagged_page").time():
+                stale, members = await pipe.execute()
+            return None if stale else members
+        score, tx_id = after
+        pipe.zrevrangebyscore(key, score, score, withscores=True)
+        pipe.zrevrangebyscore(key, f"({score!r}", "-inf", start=0, num=limit, withscores=True)
+        with metrics.REDIS_LATENCY.labels(op="flagged_page").time():
+            stale, ties, older = await pipe.execute()
+        if stale:
+            return None
+        return ([(m, s) for m, s in ties if m < tx_id] + older)[:limit]
+
+    async def get_entries(self, ids: Sequence[str]) -> List[Optional[dict]]:
+        if not ids:
+            return []
+        with metrics.REDIS_LATENCY.labels(op="get_entries").time():
+            values = await self.client.mget([f"tx:{i}" for i in ids])
+        return [orjson.loads(v) if v is not None else None for v in values]
+
+    async def set_flagged_status(self, tx_id: str, status: str) -> None:
+        """Move a reviewed transaction between the status sets and rewrite its entry's status."""
+        score = await self.client.zscore(self.KEY_FLAGGED, tx_id)
+        raw = await self.client.get(f"tx:{tx_id}")
+        pipe = self.client.pipeline()
+        for s in TransactionStatus:
+            if s.value != status:
+                pipe.zrem(self.status_key(s.value), tx_id)
+        if score is not None:
+            pipe.zadd(self.status_key(status), {tx_id: score})
+        if raw is not None:
+            entry = orjson.loads(raw)
+            entry["status"] = status
+            pipe.set(f"tx:{tx_id}", orjson.dumps(entry), keepttl=True)
+        with metrics.REDIS_LATENCY.labels(op="set_status").time():
+            await pipe.execute()
+
+
+# Bucket width per velocity window, in seconds
+WINDOW_RESOLUTIONS: Dict[str, int] = {"1m": 5, "1h": 60, "24h": 3600}
+# Every resolution is a multiple of the finest, so events in one finest bucket share all their buckets
+_FINEST = min(WINDOW_RESOLUTIONS.values())
+assert all(r % _FINEST == 0 for r in WINDOW_RESOLUTIONS.values())
+
+# KEYS: one hash per (dimension value, window), grouped per id in WINDOWS order.
+# ARGV: (event time, count, amount) per id; count 0 reads without recording.
+# Returns per id: count, sum (as string) for every window, as of its event time.
+_VELOCITY_LUA = """
+local spans = {%(spans)s}
+local res = {%(res)s}
+local nw = #spans
+local out = {}
+for i = 1, #KEYS / nw do
+  local now = tonumber(ARGV[3 * i - 2])
+  local cnt = tonumber(ARGV[3 * i - 1])
+  local amt = ARGV[3 * i]
+  local row = {}
+  for w = 1, nw do
+    local key = KEYS[(i - 1) * nw + w]
+    local b = math.floor(now / res[w])
+    local n = math.floor(spans[w] / res[w])
+    if cnt > 0 then
+      redis.call("HINCRBY", key, "c" .. b, cnt)
+      redis.call("HINCRBYFLOAT", key, "s" .. b, amt)
+      -- Buckets that left the window since the last write; anything older expired with the key
+      local stale = {}
+      for k = b - 2 * n + 1, b - n do
+        stale[#stale + 1] = "c" .. k
+        stale[#stale + 1] = "s" .. k
+      end
+      redis.call("HDEL", key, unpack(stale))
+      redis.call("EXPIRE", key, spans[w] + res[w])
+    end
+    local fields = {}
+    for k = b - n + 1, b do
+      fields[#fields + 1] = "c" .. k
+      fields[#fields + 1] = "s" .. k
+    end
+    local vals = redis.call("HMGET", key, unpack(fields))
+    local c, s = 0, 0
+    for j = 1, #vals, 2 do
+      if vals[j] then
+        c = c + tonumber(vals[j])
+        s = s + tonumber(vals[j + 1])
+      end
+    end
+    row[#row + 1] = c
+    row[#row + 1] = tostring(s)
+  end
+  out[i] = row
+end
+return out
+""" % {
+    "spans": ", ".join(str(int(span)) for _, span in WINDOWS),
+    "res": ", ".join(str(WINDOW_RESOLUTIONS[name]) for name, _ in WINDOWS),
+}
+
+
+# (velocity base key, start of the finest bucket of the event time)
+Slot = Tuple[str, float]
+
+
+def _amount(payload: dict) -> float:
+    try:
+        return float(payload.get("amount", 0.0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class SharedVelocityCounters:
+    """
+    Velocity counts and sums shared by every API replica and consumer.
+
+    Each (dimension value, window) is a Redis hash of time buckets with a TTL
+    of one window. A batch is recorded and read back with a single atomic Lua
+    call; repeated keys in a batch are merged per 5s bucket first. Like the
+    in-process store, events are bucketed and windows evaluated at the
+    transaction's event time (bucket-aligned, 5s/60s/1h), so a replayed
+    backlog lands in its own buckets instead of counting as current traffic. Reads go through a
+    small local cache with a short TTL so hot keys do not hit Redis per lookup.
+    """
+
+    def __init__(self, client, local_ttl: float = 1.0, max_local_keys: int = 10_000):
+        self.client = client
+        self.local_ttl = local_ttl
+        self.max_local_keys = max_local_keys
+        self._script = client.register_script(_VELOCITY_LUA)
+        # (base key, slot) -> (expires_at, [(count, sum) per window])
+        self._local: "OrderedDict[Slot, Tuple[float, List[Tuple[int, float]]]]" = OrderedDict()
+
+    @staticmethod
+    def _row_keys(payload: dict) -> List[Optional[str]]:
+        keys: List[Optional[str]] = []
+        for field, prefix in DIMENSIONS:
+            value = payload.get(field)
+            keys.append(f"vel:{prefix}:{value}" if value is not None else None)
+        return keys
+
+    @staticmethod
+    def _slot(payload: dict, now: Optional[float]) -> float:
+        """Start of the finest bucket holding the transaction's event time (or `now` when given)."""
+        t = event_time(payload) if now is None else now
+        return t - t % _FINEST
+
+    async def _run(self, agg: Dict[Slot, Tuple[int, float]]) -> Dict[Slot, List[Tuple[int, float]]]:
+        slots = list(agg)
+        keys = [f"{base}:{name}" for base, _ in slots for name, _ in WINDOWS]
+        args: List[Any] = []
+        for slot in slots:
+            count, total = agg[slot]
+            args.extend((repr(slot[1]), count, repr(total)))
+        with metrics.REDIS_LATENCY.labels(op="velocity").time():
+            rows = await self._script(keys=keys, args=args)
+        result: Dict[Slot, List[Tuple[int, float]]] = {}
+        expires = time.monotonic() + self.local_ttl
+        for slot, row in zip(slots, rows):
+            stats = [(int(row[2 * w]), float(row[2 * w + 1])) for w in range(len(WINDOWS))]
+            result[slot] = stats
+            self._remember(slot, expires, stats)
+        return result
+
+    def _remember(self, slot: Slot, expires: float, stats: List[Tuple[int, float]]) -> None:
+        if self.local_ttl <= 0:
+            return
+        self._local[slot] = (expires, stats)
+        self._local.move_to_end(slot)
+        while len(self._local) > self.max_local_keys:
+            self._local.popitem(last=False)
+
+    @staticmethod
+    def _emit(out: Dict[str, float], prefix: str, stats: Optional[List[Tuple[int, float]]], count: int, total: float) -> None:
+        for w, (name, _) in enumerate(WINDOWS):
+            c, s = stats[w] if stats is not None else (0, 0.0)
+            out[f"{prefix}_count_{name}"] = c + count
+            out[f"{prefix}_sum_{name}"] = s + total
+
+    async def observe_batch(self, payloads: Sequence[dict], now: Optional[float] = None) -> List[Dict[str, float]]:
+        """
+        Record a batch in one round-trip; each row's features include the rows
+        before it. Rows are placed at their event time unless `now` is given.
+        """
+        agg: Dict[Slot, Tuple[int, float]] = {}
+        rows = []
+        for p in payloads:
+            t = self._slot(p, now)
+            slots = [(key, t) if key is not None else None for key in self._row_keys(p)]
+            amount = _amount(p)
+            for slot in slots:
+                if slot is not None:
+                    c, s = agg.get(slot, (0, 0.0))
+                    agg[slot] = (c + 1, s + amount)
+            rows.append((slots, amount))
+        totals = await self._run(agg) if agg else {}
+
+        # Totals include the slot's whole batch; rewind each slot to just after the current row
+        seen: Dict[Slot, Tuple[int, float]] = {}
+        out: List[Dict[str, float]] = []
+        for slots, amount in rows:
+            f: Dict[str, float] = {}
+            for (_, prefix), slot in zip(DIMENSIONS, slots):
+                if slot is None:
+                    self._emit(f, prefix, None, 0, 0.0)
+                    continue
+                c, s = seen.get(slot, (0, 0.0))
+                seen[slot] = (c + 1, s + amount)
+                batch_c, batch_s = agg[slot]
+                self._emit(f, prefix, totals[slot], c + 1 - batch_c, s + amount - batch_s)
+            out.append(f)
+        return out
+
+    async def read(self, payloads: Sequence[dict], now: Optional[float] = None) -> List[Dict[str, float]]:
+        """Features as if each transaction were recorded at its event time (or `now`), without recording it."""
+        clock = time.monotonic()
+        stats: Dict[Slot, List[Tuple[int, float]]] = {}
+        misses: Dict[Slot, Tuple[int, float]] = {}
+        row_slots = []
+        for p in payloads:
+            t = self._slot(p, now)
+            slots = [(key, t) if key is not None else None for key in self._row_keys(p)]
+            row_slots.append(slots)
+            for slot in slots:
+                if slot is None or slot in stats or slot in misses:
+                    continue
+                hit = self._local.get(slot)
+                if hit is not None and hit[0] > clock:
+                    stats[slot] = hit[1]
+                else:
+                    misses[slot] = (0, 0.0)
+        if misses:
+            stats.update(await self._run(misses))
+
+        out: List[Dict[str, float]] = []
+        for p, slots in zip(payloads, row_slots):
+            f: Dict[str, float] = {}
+            amount = _amount(p)
+            for (_, prefix), slot in zip(DIMENSIONS, slots):
+                self._emit(f, prefix, stats.get(slot) if slot is not None else None, 1, amount)
+            out.append(f)
+        return out
+
+
+_UNAVAILABLE = object()
+
+# KEYS: tx:{id}, tx:rev:{id}. ARGV: body, ttl, the revision read before the body was loaded.
+# Writes the body unless an entry exists or a review bumped the revision meanwhile; returns 1 when written.
+_FILL_DETAIL_LUA = """
+if (redis.call("GET", KEYS[2]) or "0") ~= ARGV[3] then
+  return 0
+end
+if redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[2], "NX") then
+  return 1
+end
+return 0
+"""
+
+
+class StatsResponseCache:
+    """
+    compute_stats results keyed by window, in process and in Redis, for
+    `ttl` seconds. Entries are tagged with a data version that writers bump
+    (consumer batches, reviews), so a bump invalidates every replica's
+    entries at once. Concurrent misses for the same key share one compute.
+    Without Redis the version and entries are per process; Redis is retried
+    `retry_after` seconds after a failure.
+    """
+
+    VERSION_KEY = "stats:version"
+
+    def __init__(self, redis_cache: Optional[RedisCache], ttl: float = 5.0, retry_after: float = 5.0):
+        self.redis_cache = redis_cache
+        self.ttl = ttl
+        self.retry_after = retry_after
+        # window -> (expires_at, version, value)
+        self._local: Dict[str, Tuple[float, str, dict]] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._local_version = 0
+
+    async def _redis(self, op: Callable[[Any], Awaitable[Any]]) -> Any:
+        if self.redis_cache is None or not self.redis_cache.available():
+            return _UNAVAILABLE
+        try:
+            with metrics.REDIS_LATENCY.labels(op="stats_cache").time():
+                return await op(self.redis_cache.client)
+        except Exception as e:
+            self.redis_cache.mark_down(self.retry_after)
+            logger.warning("stats cache: Redis unavailable (%s); using in-process entries", e)
+            return _UNAVAILABLE
+
+    async def version(self) -> str:
+        v = await self._redis(lambda c: c.get(self.VERSION_KEY))
+        return f"l{self._local_version}" if v is _UNAVAILABLE else f"r{v or 0}"
+
+    async def bump(self) -> None:
+        """Invalidate cached stats after a write to transactions or reviews."""
+        self._local_version += 1
+        self._local.clear()
+        await self._redis(lambda c: c.incr(self.VERSION_KEY))
+
+    async def get(self, window: str, compute: Callable[[], Awaitable[dict]]) -> Tuple[dict, str]:
+        """Returns (stats, source) with source one of local, redis, coalesced or miss."""
+        start = time.perf_counter()
+        if self.ttl <= 0:
+            value, source = await compute(), "miss"
+        else:
+            value, source = await self._get(window, compute)
+        metrics.STATS_CACHE_REQUESTS.labels(source).inc()
+        metrics.STATS_CACHE_LATENCY.labels(source).observe(time.perf_counter() - start)
+        return value, source
+
+    async def _get(self, window: str, compute: Callable[[], Awaitable[dict]]) -> Tuple[dict, str]:
+        version = await self.version()
+        hit = self._local.get(window)
+        if hit is not None and hit[0] > time.monotonic() and hit[1] == version:
+            return hit[2], "local"
+
+        key = f"stats:{window}:{version}"
+        raw = await self._redis(lambda c: c.get(key))
+        if raw is not _UNAVAILABLE and raw is not None:
+            value = json.loads(raw)
+            self._local[window] = (time.monotonic() + self.ttl, version, value)
+            return value, "redis"
+
+        flight = self._inflight.get((window, version))
+        if flight is not None:
+            return await asyncio.shield(flight), "coalesced"
+        flight = self._inflight[(window, version)] = asyncio.get_running_loop().create_future()
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            # Mark retrieved: waiters, if any, re-raise it themselves
+            flight.exception()
+            raise
+        finally:
+            self._inflight.pop((window, version), None)
+        flight.set_result(value)
+        self._local[window] = (time.monotonic() + self.ttl, version, value)
+        await self._redis(lambda c: c.set(key, json.dumps(value), px=max(1, int(self.ttl * 1000))))
+        return value, "miss"
+
+
+class TransactionDetailCache:
+    """
+    Serialized GET /fraud/tx/{id} bodies, read through two tiers: an
+    in-process LRU of up to `max_entries` bodies kept `ttl` seconds, then the
+    tx:{id} entries in Redis. Misses are loaded from the database and written
+    to Redis for `fill_ttl` seconds unless the consumer's entry is already
+    there or a review committed while they loaded: reviews bump tx:rev:{id},
+    and a fill only lands if the revision it read first is unchanged. A
+    review drops the local copy here and rewrites the Redis entry; other
+    replicas pick it up within `ttl`.
+    """
+
+    def __init__(
+        self,
+        redis_cache: Optional[RedisCache],
+        max_entries: int = 10_000,
+        ttl: float = 5.0,
+        fill_ttl: int = 300,
+        retry_after: float = 5.0,
+    ):
+        self.redis_cache = redis_cache
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.fill_ttl = fill_ttl
+        self.retry_after = retry_after
+        # id -> (expires_at, body), least recently used first
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    async def _redis(self, op: Callable[[Any], Awaitable[Any]]) -> Any:
+        if self.redis_cache is None or not self.redis_cache.available():
+            return _UNAVAILABLE
+        try:
+            with metrics.REDIS_LATENCY.labels(op="detail_cache").time():
+                return await op(self.redis_cache.client)
+        except Exception as e:
+            self.redis_cache.mark_down(self.retry_after)
+            logger.warning("detail cache: Redis unavailable (%s); reading the database", e)
+            return _UNAVAILABLE
+
+    def _remember(self, tx_id: str, body: str) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        self._local[tx_id] = (time.monotonic() + self.ttl, body)
+        self._local.move_to_end(tx_id)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def invalidate(self, tx_id: str) -> None:
+        """Call after a review commits: drops the local copy and voids fills that loaded before it."""
+        self._local.pop(tx_id, None)
+        rev_key = f"tx:rev:{tx_id}"
+
+        async def bump(c: Any) -> None:
+            pipe = c.pipeline()
+            pipe.incr(rev_key)
+            # Outlives any fill that could have started before the review
+            pipe.expire(rev_key, max(1, int(self.fill_ttl)))
+            await pipe.execute()
+
+        if await self._redis(bump) is _UNAVAILABLE and self.redis_cache is not None:
+            # An in-flight fill could still land; the flagged queue repair deletes tx:{id}
+            self.redis_cache.lost_reviews.add(tx_id)
+
+    async def get(self, tx_id: str, load: Callable[[], Awaitable[Optional[dict]]]) -> Tuple[Optional[str], str]:
+        """
+        (JSON body or None if the transaction does not exist, source), with
+        source one of "local", "redis" or "miss".
+        """
+        hit = self._local.get(tx_id)
+        if hit is not None:
+            if hit[0] > time.monotonic():
+                self._local.move_to_end(tx_id)
+                metrics.DETAIL_CACHE_REQUESTS.labels(result="local").inc()
+                return hit[1], "local"
+            del self._local[tx_id]
+
+        key, rev_key = f"tx:{tx_id}", f"tx:rev:{tx_id}"
+        read = await self._redis(lambda c: c.mget(key, rev_key))
+        body, rev = (None, None) if read is _UNAVAILABLE else read
+        if body is not None:
+            self._remember(tx_id, body)
+            metrics.DETAIL_CACHE_REQUESTS.labels(result="redis").inc()
+            return body, "redis"
+
+        metrics.DETAIL_CACHE_REQUESTS.labels(result="miss").inc()
+        entry = await load()
+        if entry is None:
+            return None, "miss"
+        filled = orjson.dumps(entry).decode()
+        self._remember(tx_id, filled)
+        if read is not _UNAVAILABLE:
+            # Never replace an entry the consumer or a review wrote meanwhile, nor fill a pre-review body
+            args = [filled, self.fill_ttl, rev or "0"]
+            await self._redis(lambda c: c.register_script(_FILL_DETAIL_LUA)(keys=[key, rev_key], args=args))
+        return filled, "miss"
 
 
 _cache: Optional[RedisCache] = None
+_counters: Optional[SharedVelocityCounters] = None
+_stats_cache: Optional[StatsResponseCache] = None
+_detail_cache: Optional[TransactionDetailCache] = None
 
 
 def get_cache() -> RedisCache:
     global _cache
     if _cache is None:
         settings = get_settings()
-        _cache = RedisCache(settings.REDIS_URL)
+        _cache = RedisCache(
+            settings.REDIS_URL, max_flagged=settings.FLAGGED_CACHE_MAX, tx_ttl=settings.FLAGGED_TX_TTL_S
+        )
     return _cache
+
+
+def get_shared_counters() -> SharedVelocityCounters:
+    global _counters
+    if _counters is None:
+        settings = get_settings()
+        _counters = SharedVelocityCounters(get_cache().client, local_ttl=settings.VELOCITY_LOCAL_TTL_S)
+    return _counters
+
+
+def get_stats_cache() -> StatsResponseCache:
+    global _stats_cache
+    if _stats_cache is None:
+        settings = get_settings()
+        _stats_cache = StatsResponseCache(get_cache(), ttl=settings.STATS_CACHE_TTL_S)
+    return _stats_cache
+
+
+def get_detail_cache() -> TransactionDetailCache:
+    global _detail_cache
+    if _detail_cache is None:
+        settings = get_settings()
+        _detail_cache = TransactionDetailCache(
+            get_cache(),
+            max_entries=settings.DETAIL_CACHE_MAX,
+            ttl=settings.DETAIL_CACHE_TTL_S,
+            fill_ttl=settings.DETAIL_CACHE_FILL_TTL_S,
+        )
+    return _detail_cache
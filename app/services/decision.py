@@ -0,0 +1,101 @@
+from __future__ import annotations
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.services import rules
+from app.services.features import VELOCITY_LOCAL, VELOCITY_NONE
+from app.services.inference import FraudModel
+
+# Kafka header names; values are ASCII
+H_SCORE = "x-score"
+H_FRAUD = "x-fraud"
+H_RULE_BITS = "x-rule-bits"
+H_MODEL_VERSION = "x-model-version"
+H_RULES_VERSION = "x-rules-version"
+H_VELOCITY = "x-velocity"
+
+Headers = List[Tuple[str, bytes]]
+
+
+class Decision(NamedTuple):
+    """The verdict the API reached for one transaction, carried to the consumer in Kafka headers."""
+
+    score: float
+    is_fraud: bool
+    rule_bits: int
+    model_version: str
+    rules_version: str
+    # features.VELOCITY_*: the store the velocity features were read from
+    velocity_source: str = VELOCITY_NONE
+
+    def headers(self) -> Headers:
+        return [
+            (H_SCORE, repr(self.score).encode()),
+            (H_FRAUD, b"1" if self.is_fraud else b"0"),
+            (H_RULE_BITS, str(self.rule_bits).encode()),
+            (H_MODEL_VERSION, self.model_version.encode()),
+            (H_RULES_VERSION, self.rules_version.encode()),
+            (H_VELOCITY, self.velocity_source.encode()),
+        ]
+
+    def is_current(self, model: FraudModel, ruleset: rules.RuleSet) -> bool:
+        """
+        True when this process would score with the same model and rules, and
+        any velocity used came from a store that saw every process's traffic.
+        A local store only holds what its own process observed.
+        """
+        return (
+            self.model_version == model.version
+            and self.rules_version == ruleset.version
+            and self.velocity_source != VELOCITY_LOCAL
+        )
+
+
+def from_headers(headers: Optional[Iterable[Tuple[str, bytes]]]) -> Optional[Decision]:
+    """The Decision in a record's headers, or None when absent or malformed."""
+    values = dict(headers or ())
+    try:
+        return Decision(
+            score=float(values[H_SCORE]),
+            is_fraud=values[H_FRAUD] == b"1",
+            rule_bits=int(values[H_RULE_BITS]),
+            model_version=values[H_MODEL_VERSION].decode(),
+            rules_version=values[H_RULES_VERSION].decode(),
+            velocity_source=values[H_VELOCITY].decode(),
+        )
+    except (KeyError, ValueError, AttributeError):
+        return None
+
+
+def _source(velocity: object, velocity_source: Optional[str]) -> str:
+    # Features of unknown origin are treated as local
+    return velocity_source or (VELOCITY_NONE if velocity is None else VELOCITY_LOCAL)
+
+
+def decide_one(
+    payload: dict, velocity: Optional[dict], model: FraudModel, velocity_source: Optional[str] = None
+) -> Tuple[Decision, List[str]]:
+    """Rules and model for one payload; returns the decision and the rule reasons."""
+    ruleset, bits, reasons = rules.evaluate_row(payload, velocity)
+    scores, model_flags = model.predict_batch([payload], [velocity] if velocity is not None else None)
+    score = float(scores[0])
+    source = _source(velocity, velocity_source)
+    decision = Decision(score, bool(bits or model_flags[0]), bits, model.version, ruleset.version, source)
+    return decision, reasons
+
+
+def decide_batch(
+    payloads: Sequence[dict],
+    velocity: Optional[Sequence[dict]],
+    model: FraudModel,
+    velocity_source: Optional[str] = None,
+) -> List[Decision]:
+    """Rules and model for a batch, one columnar evaluation and one model call."""
+    results = rules.evaluate_batch(payloads, velocity)
+    scores, model_flags = model.predict_batch(payloads, velocity)
+    fraud = (results.flags | model_flags).tolist()
+    version = results.ruleset.version
+    source = _source(velocity, velocity_source)
+    return [
+        Decision(score, flag, bits, model.version, version, source)
+        for score, flag, bits in zip(scores.tolist(), fraud, results.bits.tolist())
+    ]
@@ -0,0 +1,260 @@
+from __future__ import annotations
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.config import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+# Sliding windows, smallest first: name -> seconds
+WINDOWS: Tuple[Tuple[str, float], ...] = (("1m", 60.0), ("1h", 3600.0), ("24h", 86400.0))
+# Payload field -> feature prefix
+DIMENSIONS: Tuple[Tuple[str, str], ...] = (("user_id", "user"), ("device_id", "device"), ("merchant_id", "merchant"))
+
+FEATURE_NAMES: Tuple[str, ...] = tuple(
+    f"{prefix}_{stat}_{window}" for _, prefix in DIMENSIONS for window, _ in WINDOWS for stat in ("count", "sum")
+)
+
+# Where edge velocity features were read from
+VELOCITY_NONE = "none"
+VELOCITY_SHARED = "shared"
+VELOCITY_LOCAL = "local"
+
+
+def event_time(payload: dict) -> float:
+    """Epoch seconds of the transaction timestamp, falling back to wall-clock time."""
+    ts = payload.get("timestamp")
+    if isinstance(ts, datetime):
+        return ts.timestamp()
+    if isinstance(ts, str) and ts:
+        try:
+            return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+class _Ring:
+    """
+    Recent (timestamp, amount) events for one key, oldest first.
+
+    Events live in two flat lists with a moving start index; each window keeps
+    the index of its first event and a running sum, so advancing time and
+    reading a window are O(1) amortized. Timestamps are clamped to be
+    non-decreasing per key so late events never reorder the buffer.
+    """
+
+    __slots__ = ("ts", "amt", "heads", "sums", "last")
+
+    def __init__(self) -> None:
+        self.ts: List[float] = []
+        self.amt: List[float] = []
+        self.heads = [0] * len(WINDOWS)
+        self.sums = [0.0] * len(WINDOWS)
+        self.last = -math.inf
+
+    def advance(self, now: float) -> None:
+        ts, amt = self.ts, self.amt
+        n = len(ts)
+        for i, (_, span) in enumerate(WINDOWS):
+            h, s, cutoff = self.heads[i], self.sums[i], now - span
+            while h < n and ts[h] <= cutoff:
+                s -= amt[h]
+                h += 1
+            self.heads[i], self.sums[i] = h, s
+        # Nothing before the widest window's head is visible any more
+        start = self.heads[-1]
+        if start > 64 and start * 2 > n:
+            self._shift(start)
+
+    def _shift(self, start: int) -> None:
+        del self.ts[:start]
+        del self.amt[:start]
+        self.heads = [h - start for h in self.heads]
+        # Re-derive sums exactly so subtraction drift cannot accumulate
+        self.sums = [math.fsum(self.amt[h:]) for h in self.heads]
+
+    def add(self, ts: float, amount: float, max_events: int) -> None:
+        ts = max(ts, self.last)
+        self.last = ts
+        self.advance(ts)
+        self.ts.append(ts)
+        self.amt.append(amount)
+        for i in range(len(WINDOWS)):
+            self.sums[i] += amount
+        if len(self.ts) - self.heads[-1] > max_events:
+            oldest = self.heads[-1]
+            for i in range(len(WINDOWS)):
+                if self.heads[i] <= oldest:
+                    self.sums[i] -= self.amt[oldest]
+                    self.heads[i] = oldest + 1
+
+    def stats(self) -> List[Tuple[int, float]]:
+        n = len(self.ts)
+        return [(n - h, s) for h, s in zip(self.heads, self.sums)]
+
+    def __len__(self) -> int:
+        return len(self.ts) - self.heads[-1]
+
+
+class VelocityStore:
+    """
+    In-memory sliding-window counts and sums of transaction amounts per
+    user_id, device_id and merchant_id over the last 1m/1h/24h.
+
+    Memory is bounded by max_keys rings per dimension (least recently used
+    keys are evicted) and max_events_per_key events per ring; under that cap
+    a key's oldest events are dropped, so its long-window figures saturate.
+    Reads and writes never perform I/O.
+    """
+
+    def __init__(
+        self,
+        max_keys: Optional[int] = None,
+        max_events_per_key: Optional[int] = None,
+        compact_every: Optional[int] = None,
+    ):
+        settings = get_settings()
+        self.max_keys = max_keys or settings.VELOCITY_MAX_KEYS
+        self.max_events = max_events_per_key or settings.VELOCITY_MAX_EVENTS_PER_KEY
+        self.compact_every = compact_every or settings.VELOCITY_COMPACT_EVERY
+        self._rings: Dict[str, "OrderedDict[str, _Ring]"] = {field: OrderedDict() for field, _ in DIMENSIONS}
+        self._since_compact = 0
+        self._clock = -math.inf
+
+    def _ring(self, field: str, key: str, create: bool) -> Optional[_Ring]:
+        rings = self._rings[field]
+        ring = rings.get(key)
+        if ring is not None:
+            rings.move_to_end(key)
+        elif create:
+            ring = rings[key] = _Ring()
+            if len(rings) > self.max_keys:
+                rings.popitem(last=False)
+        return ring
+
+    def observe(self, payload: dict) -> Dict[str, float]:
+        """Record a transaction and return the velocity features including it."""
+        ts = event_time(payload)
+        self._clock = max(self._clock, ts)
+        try:
+            amount = float(payload.get("amount", 0.0))
+        except (TypeError, ValueError):
+            amount = 0.0
+        out: Dict[str, float] = {}
+        for field, prefix in DIMENSIONS:
+            key = payload.get(field)
+            ring = self._ring(field, str(key), create=True) if key is not None else None
+            if ring is not None:
+                ring.add(ts, amount, self.max_events)
+            self._emit(out, prefix, ring)
+
+        self._since_compact += 1
+        if self._since_compact >= self.compact_every:
+            self.compact()
+        return out
+
+    def observe_batch(self, payloads: Sequence[dict]) -> List[Dict[str, float]]:
+        """Observe payloads in order; each row's features include the rows before it."""
+        return [self.observe(p) for p in payloads]
+
+    def features(self, payload: dict) -> Dict[str, float]:
+        """
+        Features as if the transaction were recorded, without recording it.
+        Used on paths that score a transaction another component will observe.
+        """
+        ts = event_time(payload)
+        try:
+            amount = float(payload.get("amount", 0.0))
+        except (TypeError, ValueError):
+            amount = 0.0
+        out: Dict[str, float] = {}
+        for field, prefix in DIMENSIONS:
+            key = payload.get(field)
+            ring = self._ring(field, str(key), create=False) if key is not None else None
+            if ring is not None:
+                ring.advance(max(ts, ring.last))
+            self._emit(out, prefix, ring, extra=(1, amount))
+        return out
+
+    @staticmethod
+    def _emit(out: Dict[str, float], prefix: str, ring: Optional[_Ring], extra: Tuple[int, float] = (0, 0.0)) -> None:
+        stats = ring.stats() if ring is not None else [(0, 0.0)] * len(WINDOWS)
+        for (window, _), (count, total) in zip(WINDOWS, stats):
+            out[f"{prefix}_count_{window}"] = count + extra[0]
+            out[f"{prefix}_sum_{window}"] = total + extra[1]
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """Drop keys with no event inside the widest window; returns how many were removed."""
+        self._since_compact = 0
+        now = self._clock if now is None else now
+        cutoff = now - WINDOWS[-1][1]
+        removed = 0
+        for rings in self._rings.values():
+            # LRU order: stale keys sit at the front, stop at the first live one
+            while rings:
+                key, ring = next(iter(rings.items()))
+                if ring.last > cutoff:
+                    break
+                rings.popitem(last=False)
+                removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(r) for r in self._rings.values())
+
+
+_store: Optional[VelocityStore] = None
+
+
+def get_velocity_store() -> VelocityStore:
+    global _store
+    if _store is None:
+        _store = VelocityStore()
+    return _store
+
+
+def velocity_needed() -> bool:
+    """True when a rule or the model reads velocity features on the scoring path."""
+    from app.services.rules import get_ruleset
+
+    return get_ruleset().needs_velocity or any(
+        f.strip() not in ("", "amount") for f in get_settings().MODEL_FEATURES.split(",")
+    )
+
+
+async def observe_velocity(payloads: Sequence[dict]) -> List[Dict[str, float]]:
+    """Record scored transactions (consumer side) with the configured VELOCITY_BACKEND."""
+    if get_settings().VELOCITY_BACKEND == "redis":
+        from app.services.cache import get_shared_counters
+
+        try:
+            return await get_shared_counters().observe_batch(payloads)
+        except Exception:
+            logger.warning("shared velocity counters unavailable; using in-process store", exc_info=True)
+    return get_velocity_store().observe_batch(payloads)
+
+
+async def read_velocity_with_source(payloads: Sequence[dict]) -> Tuple[Optional[List[Dict[str, float]]], str]:
+    """
+    Velocity features for edge scoring (None when nothing on the scoring path
+    needs them) and where they came from: VELOCITY_NONE, VELOCITY_SHARED (the
+    Redis counters every process writes) or VELOCITY_LOCAL (this process's
+    store, which holds only what it observed).
+    """
+    if not velocity_needed():
+        return None, VELOCITY_NONE
+    if get_settings().VELOCITY_BACKEND == "redis":
+        from app.services.cache import get_shared_counters
+
+        try:
+            return await get_shared_counters().read(payloads), VELOCITY_SHARED
+        except Exception:
+            logger.warning("shared velocity counters unavailable; using in-process store", exc_info=True)
+    store = get_velocity_store()
+    return [store.features(p) for p in payloads], VELOCITY_LOCAL
@@ -0,0 +1,242 @@
+from __future__ import annotations
+import asyncio
+import base64
+import contextlib
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional, Sequence, Tuple
+
+import orjson
+from sqlalchemy import Row, Select, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Transaction, TransactionStatus
+from app.models.db import SessionLocal
+from app.services.cache import RedisCache, get_cache
+from app.services.rollups import as_utc
+
+
+logger = logging.getLogger(__name__)
+
+# Fields of the tx:{id} entries in Redis, as served by GET /fraud/tx/{id}
+ENTRY_FIELDS = (
+    "id",
+    "user_id",
+    "amount",
+    "currency",
+    "merchant_id",
+    "merchant_category",
+    "timestamp",
+    "channel",
+    "ip",
+    "lat",
+    "lon",
+    "device_id",
+    "score",
+    "is_fraud",
+    "status",
+)
+# Fields of a flagged page item, as in TransactionListItem
+LIST_FIELDS = ("id", "user_id", "amount", "currency", "merchant_id", "merchant_category", "timestamp", "score", "status")
+_ENTRY_COLUMNS = tuple(Transaction.__table__.c[name] for name in ENTRY_FIELDS)
+# Seconds to serve from Postgres only after a Redis error
+REDIS_RETRY_S = 5.0
+# Entries per push while rebuilding the Redis queue
+REBUILD_CHUNK = 1000
+
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that this service did not issue."""
+
+
+def encode_cursor(timestamp: datetime, tx_id: str) -> str:
+    """Opaque position after the row (timestamp, id) in the flagged queue's DESC order."""
+    raw = json.dumps([as_utc(timestamp).isoformat(), tx_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, tx_id = json.loads(raw)
+        return as_utc(datetime.fromisoformat(ts)), str(tx_id)
+    except Exception as e:
+        raise InvalidCursor("invalid cursor") from e
+
+
+def flagged_query(limit: int, status: Optional[TransactionStatus] = None, cursor: Optional[str] = None) -> Select:
+    """Keyset page over (timestamp, id) DESC, answered by the partial ix_flagged_* indexes."""
+    t = Transaction
+    q = select(*_ENTRY_COLUMNS).where(t.is_fraud.is_(True), t.timestamp.is_not(None))
+    if status is not None:
+        q = q.where(t.status == status)
+    if cursor is not None:
+        q = q.where(tuple_(t.timestamp, t.id) < tuple_(*decode_cursor(cursor)))
+    return q.order_by(t.timestamp.desc(), t.id.desc()).limit(limit)
+
+
+def query_flagged(
+    db: Session,
+    limit: int,
+    status: Optional[TransactionStatus] = None,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Row], Optional[str]]:
+    """
+    One page of flagged transactions, newest first, as ENTRY_FIELDS column
+    tuples, and the cursor for the next page (None on the last one). A deep
+    page is an index seek, so it costs the same as the first. Rows without a
+    timestamp are not queued.
+    """
+    # One extra row tells whether another page exists
+    rows = db.execute(flagged_query(limit + 1, status, cursor)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+
+def cache_entry(row) -> dict:
+    """JSON form of a transaction (a persistence row dict, a column tuple or a Transaction) as kept at tx:{id}."""
+    entry = {}
+    for name in ENTRY_FIELDS:
+        value = row.get(name) if isinstance(row, dict) else getattr(row, name)
+        if isinstance(value, Decimal):
+            value = float(value)
+        elif isinstance(value, datetime):
+            value = as_utc(value).isoformat()
+        elif isinstance(value, TransactionStatus):
+            value = value.value
+        entry[name] = value
+    return entry
+
+
+def load_entry(db: Session, tx_id: str) -> Optional[dict]:
+    """The tx:{id} entry for a transaction, read as a column tuple without building ORM objects."""
+    row = db.execute(select(*_ENTRY_COLUMNS).where(Transaction.id == tx_id)).one_or_none()
+    return cache_entry(row) if row is not None else None
+
+
+def page_body(entries: List[dict]) -> bytes:
+    """A flagged page as TransactionListItem JSON, encoded straight from the entries without re-validation."""
+    return orjson.dumps([{name: e[name] for name in LIST_FIELDS} for e in entries])
+
+
+async def _redis_page(
+    cache: RedisCache,
+    limit: int,
+    status: Optional[TransactionStatus],
+    position: Optional[Tuple[datetime, str]],
+) -> Optional[Tuple[List[dict], str]]:
+    after = (position[0].timestamp(), position[1]) if position is not None else None
+    members = await cache.flagged_page_ids(limit + 1, status.value if status else None, after)
+    if members is None:
+        return None
+    # Past the end of the Redis copy only Postgres knows whether older rows exist
+    if len(members) <= limit:
+        return None
+    entries = await cache.get_entries([tx_id for tx_id, _ in members[:limit]])
+    if any(e is None for e in entries):
+        return None
+    if status is not None and any(e["status"] != status.value for e in entries):
+        return None
+    last = entries[-1]
+    return entries, encode_cursor(datetime.fromisoformat(last["timestamp"]), last["id"])
+
+
+async def flagged_page(
+    db: AsyncSession,
+    limit: int,
+    status: Optional[TransactionStatus] = None,
+    cursor: Optional[str] = None,
+    cache: Optional[RedisCache] = None,
+) -> Tuple[List[dict], Optional[str], str]:
+    """
+    Like query_flagged, but as cache entries and served from the Redis
+    sorted sets when they hold the whole page; returns (entries, next
+    cursor, "redis" or "db"). Cursors are interchangeable between the two,
+    so a client paging past the Redis copy continues in Postgres.
+    """
+    position = decode_cursor(cursor) if cursor is not None else None
+    cache = cache or get_cache()
+    if cache.max_flagged and await repair_redis_queue(cache):
+        try:
+            page = await _redis_page(cache, limit, status, position)
+        except Exception as e:
+            cache.mark_down(REDIS_RETRY_S)
+            logger.warning("flagged queue: Redis unavailable (%s); reading Postgres", e)
+            page = None
+        if page is not None:
+            return page[0], page[1], "redis"
+    rows, next_cursor = await db.run_sync(query_flagged, limit, status, cursor)
+    return [cache_entry(t) for t in rows], next_cursor, "db"
+
+
+def _queue_head(limit: int) -> List[Tuple[str, dict]]:
+    with SessionLocal() as db:
+        rows, _ = query_flagged(db, limit)
+    return [(r.id, cache_entry(r)) for r in rows]
+
+
+async def rebuild_redis_queue(cache: Optional[RedisCache] = None, dropped: Sequence[str] = ()) -> int:
+    """
+    Refill the Redis queue with the newest `max_flagged` flagged rows from
+    Postgres, after pushes to it were lost. The queue is marked stale first,
+    so readers use Postgres instead of a queue with holes until it is whole
+    again. `dropped` ids, whose Redis copies may be out of date, are removed
+    before the refill. Returns the number of entries pushed.
+    """
+    cache = cache or get_cache()
+    await cache.mark_flagged_stale()
+    for start in range(0, len(dropped), REBUILD_CHUNK):
+        await cache.push_flagged_many([], cleared=dropped[start : start + REBUILD_CHUNK])
+    entries = await asyncio.to_thread(_queue_head, cache.max_flagged) if cache.max_flagged else []
+    for start in range(0, len(entries), REBUILD_CHUNK):
+        await cache.push_flagged_many(entries[start : start + REBUILD_CHUNK])
+    await cache.clear_flagged_stale()
+    return len(entries)
+
+
+async def repair_redis_queue(cache: Optional[RedisCache] = None) -> bool:
+    """
+    Once Redis answers again after reviews could not be written there, drop
+    their Redis copies and rebuild the queue. Returns False while Redis is
+    unavailable.
+    """
+    cache = cache or get_cache()
+    if not cache.available():
+        return False
+    if not cache.lost_reviews:
+        return True
+    lost = list(cache.lost_reviews)
+    try:
+        await rebuild_redis_queue(cache, dropped=lost)
+    except Exception as e:
+        cache.mark_down(REDIS_RETRY_S)
+        logger.warning("flagged queue: rebuild after %d lost reviews failed (%s)", len(lost), e)
+        return False
+    cache.lost_reviews.difference_update(lost)
+    logger.info("flagged queue: rebuilt after %d lost reviews", len(lost))
+    return True
+
+
+async def set_cached_status(tx_id: str, status: TransactionStatus, cache: Optional[RedisCache] = None) -> None:
+    """
+    Reflect a committed review in the Redis queue; Postgres stays
+    authoritative. A review that cannot be written is remembered, and
+    repair_redis_queue replaces its Redis copies once Redis answers.
+    """
+    cache = cache or get_cache()
+    if await repair_redis_queue(cache):
+        try:
+            await cache.set_flagged_status(tx_id, status.value)
+            return
+        except Exception as e:
+            # Send page reads to Postgres now if Redis still takes writes; the repair clears it
+            with contextlib.suppress(Exception):
+                await cache.mark_flagged_stale()
+            cache.mark_down(REDIS_RETRY_S)
+            logger.warning("flagged queue: failed to update %s in Redis (%s); rebuilding it later", tx_id, e)
+    cache.lost_reviews.add(tx_id)
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import numpy as np
+
+
+def _average_path_length(n_samples: np.ndarray) -> np.ndarray:
+    """Average path length of an unsuccessful BST search; same formula as scikit-learn."""
+    n = np.asarray(n_samples, dtype=np.float64)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+class CompiledIsolationForest:
+    """
+    A fitted IsolationForest flattened into NumPy node arrays.
+
+    All trees share one set of arrays (feature, threshold, left, right, leaf path
+    length) indexed by global node id. Leaves point to themselves, so every row
+    walks every tree for exactly ``max_depth`` steps with no per-node branching,
+    and a whole batch is scored with a handful of vectorized gathers.
+    """
+
+    # Rows scored per traversal chunk; keeps the (rows x trees) index matrix cache-resident
+    CHUNK_ROWS = 256
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        path_length: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        denominator: float,
+        offset: float,
+        n_features: int,
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.path_length = path_length
+        self.roots = roots
+        self.max_depth = max_depth
+        self.denominator = denominator
+        self.offset = offset
+        self.n_features = n_features
+        # Interleaved (left, right) pairs: child = children[2 * node + went_right]
+        self._children = np.stack([left, right], axis=1).astype(np.int32).ravel()
+        self._roots = roots.astype(np.int32)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompiledIsolationForest":
+        features, thresholds, lefts, rights, lengths, roots = [], [], [], [], [], []
+        base = 0
+        max_depth = 0
+        for est, est_features in zip(model.estimators_, model.estimators_features_):
+            tree = est.tree_
+            n = tree.node_count
+            left = tree.children_left.astype(np.int64)
+            right = tree.children_right.astype(np.int64)
+            is_leaf = left == -1
+
+            # Node depth (root = 0), filled top-down; children always follow parents
+            depth = np.zeros(n, dtype=np.int64)
+            for node in range(n):
+                if not is_leaf[node]:
+                    depth[left[node]] = depth[node] + 1
+                    depth[right[node]] = depth[node] + 1
+            max_depth = max(max_depth, int(depth.max()))
+
+            ids = np.arange(n, dtype=np.int64)
+            # Map tree-local feature ids back to columns of the full input matrix
+            feat = np.where(is_leaf, 0, np.asarray(est_features)[np.maximum(tree.feature, 0)])
+            features.append(feat.astype(np.intp))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(np.where(is_leaf, ids, left) + base)
+            rights.append(np.where(is_leaf, ids, right) + base)
+            lengths.append(np.where(is_leaf, depth + _average_path_length(tree.n_node_samples), 0.0))
+            roots.append(base)
+            base += n
+
+        denominator = len(model.estimators_) * float(_average_path_length(np.array([model._max_samples]))[0])
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.intp),
+            right=np.concatenate(rights).astype(np.intp),
+            path_length=np.concatenate(lengths),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            denominator=denominator,
+            offset=float(model.offset_),
+            n_features=int(model.n_features_in_),
+        )
+
+    def _depths(self, X: np.ndarray) -> np.ndarray:
+        nodes = np.broadcast_to(self._roots, (X.shape[0], self._roots.shape[0]))
+        for _ in range(self.max_depth):
+            if self.n_features == 1:
+                values = X  # (n, 1) broadcasts across trees
+            else:
+                values = np.take_along_axis(X, self.feature[nodes], axis=1)
+            nodes = self._children[2 * nodes + (values > self.threshold[nodes])]
+        return self.path_length[nodes].sum(axis=1)
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        # scikit-learn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"expected (n, {self.n_features}) features, got {X.shape}")
+        depths = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], self.CHUNK_ROWS):
+            stop = start + self.CHUNK_ROWS
+            depths[start:stop] = self._depths(X[start:stop])
+        if self.denominator == 0:
+            return -np.ones_like(depths)
+        return -(2.0 ** (-depths / self.denominator))
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        return self.score_samples(X) - self.offset
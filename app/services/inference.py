@@ -1,36 +1,107 @@
 from __future__ import annotations
+import hashlib
+import logging
 import os
+import threading
 import joblib
 import numpy as np
-from typing import Tuple
+from typing import Dict, Optional, Sequence, Tuple
 
 from app.config import get_settings
+from app.services import metrics
+from app.services.features import FEATURE_NAMES, get_velocity_store
+from app.services.iforest_compiled import CompiledIsolationForest
+
+
+logger = logging.getLogger(__name__)
+
+
+def model_version(model_path: str, feature_names: Sequence[str], threshold: float) -> str:
+    """Identifies what a score and flag depend on: the artifact bytes, the feature columns and the threshold."""
+    digest = hashlib.sha1()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    digest.update(f"|{','.join(feature_names)}|{threshold!r}".encode())
+    return digest.hexdigest()[:12]
 
 
 class FraudModel:
     _instance: "FraudModel" | None = None
+    _load_lock = threading.Lock()
 
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, backend: Optional[str] = None):
         self.model_path = model_path
         self.model = joblib.load(model_path)
         self.settings = get_settings()
+        self.compiled: Optional[CompiledIsolationForest] = None
+        requested = (backend or self.settings.IFOREST_BACKEND).strip().lower()
+        if requested == "compiled":
+            try:
+                self.compiled = CompiledIsolationForest.from_sklearn(self.model)
+            except Exception:
+                logger.warning("Could not compile %s; scoring with sklearn", model_path, exc_info=True)
+        self.backend = "compiled" if self.compiled is not None else "sklearn"
+        self.feature_names = tuple(f.strip() for f in self.settings.MODEL_FEATURES.split(",") if f.strip())
+        unknown = [f for f in self.feature_names if f != "amount" and f not in FEATURE_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown MODEL_FEATURES: {', '.join(unknown)}")
+        self.version = model_version(model_path, self.feature_names, self.settings.IFOREST_THRESHOLD)
 
     @classmethod
     def instance(cls) -> "FraudModel":
         if cls._instance is None:
-            settings = get_settings()
-            cls._instance = FraudModel(settings.MODEL_PATH)
+            # The startup loader thread and a first request may both get here; only one loads
+            with cls._load_lock:
+                if cls._instance is None:
+                    cls._instance = FraudModel(get_settings().MODEL_PATH)
         return cls._instance
 
+    @classmethod
+    def is_loaded(cls) -> bool:
+        return cls._instance is not None
+
     def score(self, features: np.ndarray) -> float:
         # scikit IsolationForest: decision_function, higher -> more normal
-        s = float(self.model.decision_function(features)[0])
+        s = float(self.score_batch(features)[0])
         return s
 
+    def score_batch(self, features: np.ndarray) -> np.ndarray:
+        # One decision_function call for the whole (n_rows, n_features) matrix
+        if self.compiled is not None:
+            return self.compiled.decision_function(features)
+        return self.model.decision_function(features)
+
+    def featurize(
+        self, payloads: Sequence[dict], velocity: Optional[Sequence[Dict[str, float]]] = None
+    ) -> np.ndarray:
+        """
+        Build one C-contiguous float64 matrix of shape (len(payloads), n_features)
+        with the MODEL_FEATURES columns. Velocity columns come from the given
+        per-row features, or are read from the in-process velocity store.
+        """
+        n = len(payloads)
+        X = np.empty((n, len(self.feature_names)), dtype=np.float64)
+        for j, name in enumerate(self.feature_names):
+            if name == "amount":
+                X[:, j] = np.fromiter((float(p.get("amount", 0.0)) for p in payloads), dtype=np.float64, count=n)
+                continue
+            if velocity is None:
+                store = get_velocity_store()
+                velocity = [store.features(p) for p in payloads]
+            X[:, j] = np.fromiter((v[name] for v in velocity), dtype=np.float64, count=n)
+        return X
+
+    def predict_batch(
+        self, payloads: Sequence[dict], velocity: Optional[Sequence[Dict[str, float]]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Score many payloads in a single model call; returns (scores, is_fraud flags)."""
+        if not payloads:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=bool)
+        with metrics.MODEL_LATENCY.time():
+            scores = self.score_batch(self.featurize(payloads, velocity))
+        return scores, scores < self.settings.IFOREST_THRESHOLD
+
     def predict_from_transaction(self, payload: dict) -> Tuple[float, bool]:
-        # Minimal featureization: amount only for demo
-        amt = float(payload.get("amount", 0.0))
-        x = np.array([[amt]], dtype=float)
-        score = self.score(x)
-        is_fraud = score < self.settings.IFOREST_THRESHOLD
-        return score, is_fraud
+        scores, flags = self.predict_batch([payload])
+        return float(scores[0]), bool(flags[0])
@@ -0,0 +1,131 @@
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Latency buckets for hot-path steps that usually take well under a millisecond
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# Kafka producer
+KAFKA_PRODUCE_ENQUEUED = Counter(
+    "fraud_kafka_produce_enqueued_total", "Messages handed to the Kafka producer batch"
+)
+KAFKA_PRODUCE_DELIVERED = Counter(
+    "fraud_kafka_produce_delivered_total", "Messages acknowledged by the broker"
+)
+KAFKA_PRODUCE_DEAD_LETTERED = Counter(
+    "fraud_kafka_produce_dead_lettered_total", "Messages routed to the dead-letter topic after the client's retries failed"
+)
+KAFKA_PRODUCE_LOST = Counter(
+    "fraud_kafka_produce_lost_total", "Messages that could not be delivered to the topic or the dead-letter topic"
+)
+KAFKA_PRODUCE_REJECTED = Counter(
+    "fraud_kafka_produce_rejected_total", "Sends refused because the in-flight window stayed full"
+)
+KAFKA_PRODUCE_IN_FLIGHT = Gauge(
+    "fraud_kafka_produce_in_flight", "Messages sent but not yet acknowledged"
+)
+KAFKA_PRODUCE_LATENCY = Histogram(
+    "fraud_kafka_produce_latency_seconds", "Time from send to broker ack, including retries"
+)
+
+# Kafka consumer
+KAFKA_CONSUME_LATENCY = Histogram(
+    "fraud_kafka_consume_latency_seconds",
+    "Age of the oldest record in a batch (record timestamp to committed), per batch",
+)
+KAFKA_CONSUMER_LAG = Gauge(
+    "fraud_kafka_consumer_lag", "Records between the committed position and the high watermark", ["partition"]
+)
+CONSUMER_STAGE_LATENCY = Histogram(
+    "fraud_consumer_stage_seconds", "Time per consumer batch stage", ["stage"], buckets=FAST_BUCKETS
+)
+CONSUMER_DECISIONS = Counter(
+    "fraud_consumer_decisions_total", "Consumed transactions by where their verdict came from", ["source"]
+)
+CONSUMER_DEAD_LETTERED = Counter(
+    "fraud_consumer_dead_lettered_total",
+    "Consumed messages that could not be processed, dead-lettered or dropped, by reason",
+    ["reason"],
+)
+
+# Hot path
+HTTP_REQUEST_LATENCY = Histogram(
+    "fraud_http_request_duration_seconds",
+    "Request latency by route template and status class",
+    ["method", "route", "status"],
+    buckets=FAST_BUCKETS,
+)
+RULES_LATENCY = Histogram(
+    "fraud_rules_eval_seconds", "Rule evaluation time; mode is row or batch", ["mode"], buckets=FAST_BUCKETS
+)
+MODEL_LATENCY = Histogram("fraud_model_score_seconds", "Featurize and score time per call", buckets=FAST_BUCKETS)
+DB_UPSERT_LATENCY = Histogram(
+    "fraud_db_upsert_seconds",
+    "Transaction upsert time per batch, including rollups; method is values or copy",
+    ["method"],
+)
+ADMISSION_REJECTED = Counter(
+    "fraud_admission_rejected_total", "Ingest requests shed with 429, by reason", ["reason"]
+)
+REDIS_LATENCY = Histogram("fraud_redis_seconds", "Redis round-trip time by operation", ["op"], buckets=FAST_BUCKETS)
+
+# Stats response cache; result is local, redis, coalesced or miss
+STATS_CACHE_REQUESTS = Counter(
+    "fraud_stats_cache_requests_total", "Stats requests by cache result", ["result"]
+)
+STATS_CACHE_LATENCY = Histogram(
+    "fraud_stats_cache_latency_seconds", "Time to serve stats by cache result", ["result"]
+)
+DETAIL_CACHE_REQUESTS = Counter(
+    "fraud_detail_cache_requests_total", "Transaction detail requests by cache tier", ["result"]
+)
+
+# Database connection pools; pool is api or writer
+DB_POOL_WAIT = Histogram(
+    "fraud_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    ["pool"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+)
+DB_POOL_IN_USE = Gauge("fraud_db_pool_in_use", "Connections currently checked out", ["pool"])
+DB_POOL_OVERFLOW = Gauge("fraud_db_pool_overflow", "Connections open beyond the pool size", ["pool"])
+DB_POOL_OVERFLOW_OPENED = Counter(
+    "fraud_db_pool_overflow_opened_total", "Connections opened beyond the pool size", ["pool"]
+)
+DB_POOL_TIMEOUTS = Counter(
+    "fraud_db_pool_timeouts_total", "Checkouts that gave up waiting for a connection", ["pool"]
+)
+DB_LIVENESS_FAILURES = Counter(
+    "fraud_db_liveness_failures_total", "Background liveness probes that failed and reset the pool", ["pool"]
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware observing HTTP_REQUEST_LATENCY per route template (not
+    raw path, to bound label cardinality); unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_LATENCY.labels(scope["method"], route, f"{status // 100}xx").observe(
+                time.perf_counter() - start
+            )
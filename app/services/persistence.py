@@ -0,0 +1,198 @@
+from __future__ import annotations
+import csv
+import io
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Union
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+
+from app.config import get_settings
+from app.models import Transaction, TransactionStatus
+from app.models.db import engine
+from app.services import metrics, rollups
+
+
+_table = Transaction.__table__
+COLUMNS = [c.name for c in _table.columns]
+# Columns refreshed when a transaction id is seen again; the rest keep their first value
+UPDATE_COLUMNS = ("score", "is_fraud", "status")
+# Rows per multi-VALUES page; keeps bind parameters under SQLite/driver limits
+VALUES_CHUNK = 1000
+
+_COPY_NULL = "\\N"
+# Conflict updates skip reviewed rows: a reviewer's verdict is final and replayed messages leave it alone.
+# Plain SQL because SQLAlchemy does not correlate subqueries of ON CONFLICT with the INSERT target.
+_NOT_REVIEWED = "NOT EXISTS (SELECT 1 FROM reviews WHERE reviews.transaction_id = transactions.id)"
+
+
+def parse_ts(s: Union[str, datetime, None]) -> Optional[datetime]:
+    if not s:
+        return None
+    if isinstance(s, datetime):
+        return s.astimezone(timezone.utc) if s.tzinfo is not None else s
+    try:
+        if s.endswith("Z"):
+            s = s.replace("Z", "+00:00")
+        ts = datetime.fromisoformat(s)
+    except Exception:
+        return None
+    # Store aware timestamps in UTC so hourly rollup buckets match the raw rows
+    return ts.astimezone(timezone.utc) if ts.tzinfo is not None else ts
+
+
+def build_rows(payloads: Sequence[dict], scores: Sequence[float], is_fraud: Sequence[bool]) -> List[dict]:
+    """Turn scored payloads into transaction rows, last write wins for repeated ids."""
+    rows: Dict[str, dict] = {}
+    for payload, score, fraud in zip(payloads, scores, is_fraud):
+        tx_id = str(payload.get("transaction_id"))
+        geo = payload.get("geo", {}) or {}
+        rows[tx_id] = dict(
+            id=tx_id,
+            user_id=str(payload.get("user_id")),
+            amount=payload.get("amount"),
+            currency=payload.get("currency"),
+            merchant_id=payload.get("merchant_id"),
+            merchant_category=payload.get("merchant_category"),
+            timestamp=parse_ts(payload.get("timestamp")),
+            channel=payload.get("channel"),
+            ip=payload.get("ip"),
+            lat=geo.get("lat"),
+            lon=geo.get("lon"),
+            device_id=payload.get("device_id"),
+            score=float(score),
+            is_fraud=bool(fraud),
+            # Auto-approve clean transactions for demo
+            status=TransactionStatus.PENDING_REVIEW if fraud else TransactionStatus.APPROVED,
+        )
+    return list(rows.values())
+
+
+def _upsert_stmt(dialect_name: str):
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    stmt = dialect.insert(_table)
+    return stmt.on_conflict_do_update(
+        index_elements=[_table.c.id],
+        set_={name: stmt.excluded[name] for name in UPDATE_COLUMNS},
+        where=text(_NOT_REVIEWED),
+    )
+
+
+def _upsert_values(conn: Connection, rows: Sequence[dict]) -> None:
+    # One cached statement executed per page of up to VALUES_CHUNK rows. On Postgres,
+    # insertmanyvalues sends each page as one multi-row VALUES statement; SQLite
+    # does not use it without RETURNING, so the pages are cut here for every dialect
+    stmt = _upsert_stmt(conn.dialect.name).execution_options(insertmanyvalues_page_size=VALUES_CHUNK)
+    rows = list(rows)
+    for i in range(0, len(rows), VALUES_CHUNK):
+        conn.execute(stmt, rows[i : i + VALUES_CHUNK])
+
+
+def _copy_value(value) -> object:
+    if value is None:
+        return _COPY_NULL
+    if isinstance(value, TransactionStatus):
+        return value.name
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return value
+
+
+def _upsert_copy(conn: Connection, rows: Sequence[dict]) -> None:
+    """COPY rows into a session-local staging table, then merge with one INSERT ... SELECT."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([_copy_value(row.get(name)) for name in COLUMNS])
+    buf.seek(0)
+
+    cols = ", ".join(COLUMNS)
+    updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in UPDATE_COLUMNS)
+    cur = conn.connection.dbapi_connection.cursor()
+    try:
+        cur.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS transactions_staging "
+            "(LIKE transactions INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        cur.copy_expert(
+            f"COPY transactions_staging ({cols}) FROM STDIN WITH (FORMAT csv, NULL '{_COPY_NULL}')", buf
+        )
+        cur.execute(
+            f"INSERT INTO transactions ({cols}) SELECT {cols} FROM transactions_staging "
+            f"ON CONFLICT (id) DO UPDATE SET {updates} "
+            f"WHERE {_NOT_REVIEWED}"
+        )
+    finally:
+        cur.close()
+
+
+def _stored_rows(conn: Connection, rows: Sequence[dict], existing: Dict[str, dict]) -> List[dict]:
+    """Rows as they stand after the upsert: new ids as written, ids seen before read back."""
+    seen = [r["id"] for r in rows if r["id"] in existing]
+    if not seen:
+        return list(rows)
+    current: Dict[str, dict] = {}
+    for start in range(0, len(seen), rollups.LOOKUP_CHUNK):
+        chunk = seen[start : start + rollups.LOOKUP_CHUNK]
+        for row in conn.execute(select(_table).where(_table.c.id.in_(chunk))).mappings():
+            current[row["id"]] = dict(row)
+    return [current.get(r["id"], r) for r in rows]
+
+
+def upsert_transactions(
+    conn: Connection, rows: Sequence[dict], copy_threshold: Optional[int] = None
+) -> List[dict]:
+    """
+    Write rows with INSERT ... ON CONFLICT (id) DO UPDATE inside the caller's
+    transaction. Writing the same rows again is a no-op, and rows that have
+    been reviewed keep their score and status, so replaying the topic is safe.
+    On Postgres, batches of at least copy_threshold rows (default
+    PERSIST_COPY_THRESHOLD, 0 disables) go through COPY into a staging table.
+    The hourly stats rollups are adjusted in the same transaction.
+
+    Returns the rows as stored, which differ from `rows` for ids written
+    before: those keep their first descriptive values and, once reviewed,
+    their verdict.
+    """
+    if not rows:
+        return []
+    if copy_threshold is None:
+        copy_threshold = get_settings().PERSIST_COPY_THRESHOLD
+    use_copy = (
+        conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2" and 0 < copy_threshold <= len(rows)
+    )
+    with metrics.DB_UPSERT_LATENCY.labels(method="copy" if use_copy else "values").time():
+        existing = rollups.existing_rows(conn, [r["id"] for r in rows])
+        if use_copy:
+            _upsert_copy(conn, rows)
+        else:
+            _upsert_values(conn, rows)
+        rollups.apply_deltas(conn, rollups.upsert_deltas(rows, existing))
+        return _stored_rows(conn, rows, existing)
+
+
+def persist_batch(
+    payloads: Sequence[dict],
+    scores: Sequence[float],
+    is_fraud: Sequence[bool],
+    bind: Optional[Engine] = None,
+) -> List[dict]:
+    """Persist a scored batch in one transaction; returns the distinct rows as stored."""
+    rows = build_rows(payloads, scores, is_fraud)
+    if not rows:
+        return []
+    with (bind or engine).begin() as conn:
+        return upsert_transactions(conn, rows)
+
+
+def persist_scored(
+    payloads: Sequence[dict],
+    scores: Sequence[float],
+    is_fraud: Sequence[bool],
+    bind: Optional[Engine] = None,
+) -> int:
+    """Persist a scored batch in one transaction; returns the number of distinct rows written."""
+    return len(persist_batch(payloads, scores, is_fraud, bind))
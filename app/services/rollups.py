@@ -0,0 +1,276 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, case, delete, exists, func, literal_column, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+
+from app.models import Review, StatsRollup, Transaction, TransactionStatus
+
+
+_table = StatsRollup.__table__
+_tx = Transaction.__table__
+# Rollup counters, in the order of contribution()
+COUNTERS = ("count_fraud", "count_clean", "count_approved", "count_pending", "count_rejected")
+# Columns rollups are broken down by
+DIMENSIONS = ("merchant_category", "channel", "currency")
+# Maintained rollup granularities, coarsest first
+LEVELS = ("day", "hour")
+UNIT_SECONDS = {"day": 86400, "hour": 3600, "minute": 60}
+_STATUS_COUNTER = {
+    TransactionStatus.APPROVED: 2,
+    TransactionStatus.PENDING_REVIEW: 3,
+    TransactionStatus.REJECTED: 4,
+}
+# Ids per existing-row lookup; keeps bind parameters under SQLite/driver limits
+LOOKUP_CHUNK = 900
+
+Dims = Tuple[str, ...]
+# (granularity, bucket, *dims) -> counters
+Deltas = Dict[Tuple, List[int]]
+# (bucket, *group-by dims) -> counters
+Series = Dict[Tuple, List[int]]
+
+
+def as_utc(ts: datetime) -> datetime:
+    """Naive timestamps are taken as UTC."""
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+def truncate(ts: Optional[datetime], unit: str) -> Optional[datetime]:
+    """Start of the UTC minute/hour/day containing ts."""
+    if ts is None:
+        return None
+    ts = as_utc(ts).replace(second=0, microsecond=0)
+    if unit in ("hour", "day"):
+        ts = ts.replace(minute=0)
+    if unit == "day":
+        ts = ts.replace(hour=0)
+    return ts
+
+
+def ceil(ts: datetime, unit: str) -> datetime:
+    start = truncate(ts, unit)
+    return start if start == as_utc(ts) else start + timedelta(seconds=UNIT_SECONDS[unit])
+
+
+def bucket_of(ts: Optional[datetime]) -> Optional[datetime]:
+    """The UTC hour a timestamp is counted in."""
+    return truncate(ts, "hour")
+
+
+def dims_of(row) -> Dims:
+    return tuple(row[name] or "" for name in DIMENSIONS)
+
+
+def contribution(is_fraud, status) -> List[int]:
+    counts = [0] * len(COUNTERS)
+    counts[0 if is_fraud else 1] = 1
+    if status is not None:
+        counts[_STATUS_COUNTER[TransactionStatus(status)]] = 1
+    return counts
+
+
+def _add(deltas: Deltas, ts: Optional[datetime], dims: Dims, counts: Sequence[int], sign: int) -> None:
+    if ts is None:
+        return
+    for level in LEVELS:
+        acc = deltas.setdefault((level, truncate(ts, level)) + dims, [0] * len(COUNTERS))
+        for i, c in enumerate(counts):
+            acc[i] += sign * c
+
+
+def existing_rows(conn: Connection, ids: Sequence[str]) -> Dict[str, dict]:
+    """
+    id -> {timestamp, is_fraud, status, reviewed, *DIMENSIONS} for the ids
+    already in `transactions`. On Postgres the rows stay locked until the caller commits,
+    so concurrent writers of the same ids cannot both apply a delta against
+    the same state.
+    """
+    found: Dict[str, dict] = {}
+    reviewed = exists().where(Review.transaction_id == _tx.c.id).label("reviewed")
+    cols = [_tx.c.id, _tx.c.timestamp, _tx.c.is_fraud, _tx.c.status, reviewed]
+    cols += [_tx.c[name] for name in DIMENSIONS]
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        chunk = ids[start : start + LOOKUP_CHUNK]
+        for row in conn.execute(select(*cols).where(_tx.c.id.in_(chunk)).with_for_update()).mappings():
+            found[row["id"]] = dict(row)
+    return found
+
+
+def upsert_deltas(rows: Sequence[dict], existing: Dict[str, dict]) -> Deltas:
+    """
+    Rollup changes for upserting rows over `existing`. Conflicting rows keep
+    their original timestamp and dimensions, so both sides of an update land
+    in the same buckets. Reviewed rows are not updated, so they change nothing.
+    """
+    deltas: Deltas = {}
+    for row in rows:
+        old = existing.get(row["id"])
+        if old is None:
+            _add(deltas, row["timestamp"], dims_of(row), contribution(row["is_fraud"], row["status"]), 1)
+            continue
+        if old.get("reviewed"):
+            continue
+        dims = dims_of(old)
+        _add(deltas, old["timestamp"], dims, contribution(old["is_fraud"], old["status"]), -1)
+        _add(deltas, old["timestamp"], dims, contribution(row["is_fraud"], row["status"]), 1)
+    return deltas
+
+
+def status_delta(t: Transaction, old: Optional[TransactionStatus], new: TransactionStatus) -> Deltas:
+    """Rollup change for transaction t moving from status `old` to `new`."""
+    deltas: Deltas = {}
+    if old != new:
+        counts = [0] * len(COUNTERS)
+        if old is not None:
+            counts[_STATUS_COUNTER[TransactionStatus(old)]] -= 1
+        counts[_STATUS_COUNTER[TransactionStatus(new)]] += 1
+        _add(deltas, t.timestamp, tuple(getattr(t, name) or "" for name in DIMENSIONS), counts, 1)
+    return deltas
+
+
+def _values(deltas: Deltas) -> List[dict]:
+    keys = ("granularity", "bucket") + DIMENSIONS
+    return [dict(zip(keys, key), **dict(zip(COUNTERS, counts))) for key, counts in sorted(deltas.items()) if any(counts)]
+
+
+def apply_deltas(conn: Connection, deltas: Deltas) -> None:
+    """Add deltas to the rollup rows inside the caller's transaction, creating buckets as needed."""
+    values = _values(deltas)
+    if not values:
+        return
+    dialect = postgresql if conn.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(_table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(_table.primary_key.columns),
+        set_={name: _table.c[name] + stmt.excluded[name] for name in COUNTERS},
+    )
+    conn.execute(stmt, values)
+
+
+_SQLITE_TRUNC = {"minute": "%Y-%m-%d %H:%M:00", "hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+
+
+def _trunc_expr(conn: Connection, unit: str):
+    ts = _tx.c.timestamp
+    if conn.dialect.name == "postgresql":
+        return func.date_trunc(unit, ts.op("AT TIME ZONE")(literal_column("'UTC'")))
+    return func.strftime(_SQLITE_TRUNC[unit], ts)
+
+
+def to_series(rows) -> Series:
+    """Counters keyed by (bucket, *dims) from (bucket, *dims, *counters) rows; all-zero buckets are dropped."""
+    result: Series = {}
+    for row in rows:
+        bucket = row[0]
+        if isinstance(bucket, str):
+            bucket = datetime.fromisoformat(bucket)
+        counts = [int(v or 0) for v in row[-len(COUNTERS):]]
+        # Buckets whose counters all went back to zero are the same as missing ones
+        if any(counts):
+            result[(as_utc(bucket),) + tuple(v or "" for v in row[1 : -len(COUNTERS)])] = counts
+    return result
+
+
+def raw_query(
+    conn: Connection,
+    unit: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: Sequence[str] = DIMENSIONS,
+) -> Select:
+    """Counters per `unit` bucket and group_by dims aggregated from `transactions` in [start, end)."""
+    bucket = _trunc_expr(conn, unit).label("bucket")
+    dims = [func.coalesce(_tx.c[name], "").label(name) for name in group_by]
+    cols = [
+        func.sum(case((_tx.c.is_fraud.is_(True), 1), else_=0)),
+        func.sum(case((_tx.c.is_fraud.is_(True), 0), else_=1)),
+        func.sum(case((_tx.c.status == TransactionStatus.APPROVED, 1), else_=0)),
+        func.sum(case((_tx.c.status == TransactionStatus.PENDING_REVIEW, 1), else_=0)),
+        func.sum(case((_tx.c.status == TransactionStatus.REJECTED, 1), else_=0)),
+    ]
+    q = select(bucket, *dims, *cols).where(_tx.c.timestamp.is_not(None)).group_by(bucket, *dims)
+    if start is not None:
+        q = q.where(_tx.c.timestamp >= start)
+    if end is not None:
+        q = q.where(_tx.c.timestamp < end)
+    return q
+
+
+def raw_series(
+    conn: Connection,
+    unit: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: Sequence[str] = DIMENSIONS,
+) -> Series:
+    """raw_query run and keyed by (bucket, *dims)."""
+    return to_series(conn.execute(raw_query(conn, unit, start, end, group_by)))
+
+
+def rollup_query(
+    level: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: Sequence[str] = DIMENSIONS,
+) -> Select:
+    """Counters per `level` bucket and group_by dims read from the rollups in [start, end)."""
+    dims = [_table.c[name] for name in group_by]
+    q = (
+        select(_table.c.bucket, *dims, *(func.sum(_table.c[name]) for name in COUNTERS))
+        .where(_table.c.granularity == level)
+        .group_by(_table.c.bucket, *dims)
+    )
+    if start is not None:
+        q = q.where(_table.c.bucket >= start)
+    if end is not None:
+        q = q.where(_table.c.bucket < end)
+    return q
+
+
+def rollup_series(
+    conn: Connection,
+    level: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: Sequence[str] = DIMENSIONS,
+) -> Series:
+    """rollup_query run and keyed by (bucket, *dims)."""
+    return to_series(conn.execute(rollup_query(level, start, end, group_by)))
+
+
+def rebuild(conn: Connection, since: Optional[datetime] = None) -> int:
+    """
+    Recompute rollups from `transactions` (all buckets, or those from the UTC
+    day containing `since` on) inside the caller's transaction; returns the
+    number of rollup rows written.
+    """
+    cutoff = truncate(since, "day")
+    wipe = delete(_table)
+    if cutoff is not None:
+        wipe = wipe.where(_table.c.bucket >= cutoff)
+    conn.execute(wipe)
+    written = 0
+    for level in LEVELS:
+        deltas = {(level,) + key: counts for key, counts in raw_series(conn, level, cutoff).items()}
+        if deltas:
+            conn.execute(_table.insert(), _values(deltas))
+            written += len(deltas)
+    return written
+
+
+def check(conn: Connection, since: Optional[datetime] = None) -> List[Tuple[Tuple, List[int], List[int]]]:
+    """Rollup rows that disagree with the raw table, as ((granularity, bucket, *dims), rollup, raw)."""
+    cutoff = truncate(since, "day")
+    empty = [0] * len(COUNTERS)
+    drift = []
+    for level in LEVELS:
+        rolled, raw = rollup_series(conn, level, cutoff), raw_series(conn, level, cutoff)
+        for key in sorted(set(rolled) | set(raw)):
+            if rolled.get(key, empty) != raw.get(key, empty):
+                drift.append(((level,) + key, rolled.get(key, empty), raw.get(key, empty)))
+    return drift
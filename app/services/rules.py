@@ -1,7 +1,26 @@
 from __future__ import annotations
-from typing import List, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, FrozenSet, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
 
 from app.config import get_settings
+from app.services import metrics
+from app.services.features import FEATURE_NAMES, get_velocity_store
+
+
+logger = logging.getLogger(__name__)
+
+# Amount from which a high-risk category is flagged, unless a definition says otherwise
+DEFAULT_CATEGORY_MIN_AMOUNT = 1000.0
+
+
+class RuleDefinitionError(ValueError):
+    """A rule definition is malformed; the rule set it belongs to is not applied."""
 
 
 def _normalize_category(cat: str | None) -> str:
@@ -10,35 +29,440 @@ def _normalize_category(cat: str | None) -> str:
     return cat.strip().lower()
 
 
-def evaluate_transaction(payload: dict) -> Tuple[bool, List[str]]:
+def _normalize_currency(cur: str | None) -> str:
+    if not cur:
+        return ""
+    return cur.strip().upper()
+
+
+def _amount(payload: dict) -> float:
+    try:
+        return float(payload.get("amount", 0.0))
+    except Exception:
+        return 0.0
+
+
+# Rule ids are bit positions in a uint64 mask
+MAX_RULES = 64
+
+
+class Columns(NamedTuple):
+    """
+    A columnar batch: float amounts, category/currency codes from the rule
+    set's vocabulary (-1 when a value no rule mentions) and velocity feature
+    arrays keyed by name.
     """
-    Simple rule-based checks to complement ML.
 
-    Rules:
-    - Amount hard max: if amount > AMOUNT_HARD_MAX => fraud
-    - High-risk categories: if category in HIGH_RISK_CATEGORIES and amount >= 1000 => fraud
+    amount: np.ndarray
+    category: np.ndarray
+    currency: np.ndarray
+    velocity: Dict[str, np.ndarray]
 
-    Returns (is_fraud_by_rules, reasons)
+    def __len__(self) -> int:
+        return len(self.amount)
+
+
+# Compiled rules. Everything derivable from the definition (sets, limits,
+# reason strings, code lookup tables) is computed once at compile/bind time.
+# check() evaluates one row and returns its reason or None; mask() evaluates
+# a Columns batch; reason() formats the reason of a flagged row on demand.
+class _AmountMax:
+    __slots__ = ("bound", "_reason")
+    categories: FrozenSet[str] = frozenset()
+    currencies: FrozenSet[str] = frozenset()
+    feature: Optional[str] = None
+
+    def __init__(self, d: dict):
+        limit = d["max"]
+        self.bound, self._reason = float(limit), f"amount>{limit}"
+
+    def bind(self, ruleset: "RuleSet") -> None:
+        pass
+
+    def check(self, amount, category, currency, velocity):
+        return self._reason if amount > self.bound else None
+
+    def mask(self, cols: Columns) -> np.ndarray:
+        return cols.amount > self.bound
+
+    def reason(self, cols: Columns, i: int) -> str:
+        return self._reason
+
+
+class _Category:
+    __slots__ = ("categories", "min_amount", "_reasons", "_table", "_vocab")
+    currencies: FrozenSet[str] = frozenset()
+    feature: Optional[str] = None
+
+    def __init__(self, d: dict):
+        self.categories = frozenset(_normalize_category(c) for c in d["categories"]) - {""}
+        self.min_amount = float(d.get("min_amount", DEFAULT_CATEGORY_MIN_AMOUNT))
+        self._reasons = {c: f"high_risk_category:{c}" for c in self.categories}
+
+    def bind(self, ruleset: "RuleSet") -> None:
+        # One slot per vocabulary code plus a trailing False for code -1
+        self._vocab = ruleset.category_vocab
+        self._table = np.array([c in self.categories for c in self._vocab] + [False])
+
+    def check(self, amount, category, currency, velocity):
+        return self._reasons.get(category) if amount >= self.min_amount else None
+
+    def mask(self, cols: Columns) -> np.ndarray:
+        return self._table[cols.category] & (cols.amount >= self.min_amount)
+
+    def reason(self, cols: Columns, i: int) -> str:
+        return self._reasons[self._vocab[cols.category[i]]]
+
+
+class _CurrencyLimit:
+    __slots__ = ("currencies", "_limits", "_reasons", "_table", "_vocab")
+    categories: FrozenSet[str] = frozenset()
+    feature: Optional[str] = None
+
+    def __init__(self, d: dict):
+        self._limits: Dict[str, float] = {}
+        self._reasons: Dict[str, str] = {}
+        for cur, limit in d["limits"].items():
+            cur = _normalize_currency(cur)
+            self._limits[cur], self._reasons[cur] = float(limit), f"currency_limit:{cur}>{limit}"
+        self.currencies = frozenset(self._limits)
+
+    def bind(self, ruleset: "RuleSet") -> None:
+        # Unlimited currencies (and code -1) compare against +inf
+        self._vocab = ruleset.currency_vocab
+        self._table = np.array([self._limits.get(c, np.inf) for c in self._vocab] + [np.inf])
+
+    def check(self, amount, category, currency, velocity):
+        limit = self._limits.get(currency)
+        return self._reasons[currency] if limit is not None and amount > limit else None
+
+    def mask(self, cols: Columns) -> np.ndarray:
+        return cols.amount > self._table[cols.currency]
+
+    def reason(self, cols: Columns, i: int) -> str:
+        return self._reasons[self._vocab[cols.currency[i]]]
+
+
+class _Velocity:
+    __slots__ = ("feature", "bound", "_reason")
+    categories: FrozenSet[str] = frozenset()
+    currencies: FrozenSet[str] = frozenset()
+
+    def __init__(self, d: dict):
+        feature, limit = d["feature"], d["max"]
+        if feature not in FEATURE_NAMES:
+            raise RuleDefinitionError(f"unknown velocity feature {feature!r}")
+        self.feature, self.bound, self._reason = feature, float(limit), f"velocity:{feature}>{limit}"
+
+    def bind(self, ruleset: "RuleSet") -> None:
+        pass
+
+    def check(self, amount, category, currency, velocity):
+        return self._reason if velocity is not None and velocity[self.feature] > self.bound else None
+
+    def mask(self, cols: Columns) -> np.ndarray:
+        values = cols.velocity.get(self.feature)
+        if values is None:
+            return np.zeros(len(cols), dtype=bool)
+        return values > self.bound
+
+    def reason(self, cols: Columns, i: int) -> str:
+        return self._reason
+
+
+_COMPILERS = {
+    "amount_max": _AmountMax,
+    "category": _Category,
+    "currency_limit": _CurrencyLimit,
+    "velocity": _Velocity,
+}
+
+
+class RuleResults:
+    """
+    Outcome of a columnar evaluation: `flags[i]` is True when any rule hit row
+    i, and bit k of `bits[i]` is set when rule k (RuleSet.names[k]) did.
+    Reason strings are only built when asked for.
     """
+
+    def __init__(self, ruleset: "RuleSet", cols: Columns, bits: np.ndarray):
+        self.ruleset = ruleset
+        self.columns = cols
+        self.bits = bits
+        self.flags = bits != 0
+
+    def __len__(self) -> int:
+        return len(self.bits)
+
+    def reasons(self, i: int) -> List[str]:
+        bits = int(self.bits[i])
+        rules = self.ruleset.rules
+        return [rules[k].reason(self.columns, i) for k in range(len(rules)) if bits >> k & 1]
+
+    def pairs(self) -> List[Tuple[bool, List[str]]]:
+        """(is_fraud_by_rules, reasons) per row, the evaluate_transaction shape."""
+        return [(True, self.reasons(i)) if flag else (False, []) for i, flag in enumerate(self.flags.tolist())]
+
+
+class RuleSet:
+    """
+    An immutable, compiled list of rules. Reasons are reported in definition
+    order. Built once per (re)load and shared by every request and batch.
+    """
+
+    def __init__(self, definitions: Sequence[dict]):
+        compiled = []
+        names: List[str] = []
+        for i, d in enumerate(definitions):
+            if not d.get("enabled", True):
+                continue
+            compiler = _COMPILERS.get(d.get("type"))
+            if compiler is None:
+                raise RuleDefinitionError(f"rule {i}: unknown type {d.get('type')!r}")
+            try:
+                compiled.append(compiler(d))
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                raise RuleDefinitionError(f"rule {i} ({d.get('type')}): {e!r}") from e
+            names.append(str(d.get("name") or d["type"]))
+        if len(compiled) > MAX_RULES:
+            raise RuleDefinitionError(f"{len(compiled)} active rules; at most {MAX_RULES} are supported")
+        self.definitions: Tuple[dict, ...] = tuple(definitions)
+        self.names: Tuple[str, ...] = tuple(names)
+        self.rules = tuple(compiled)
+        self.version = _version(definitions)
+
+        # Only values some rule mentions get a code; everything else is -1
+        self.category_vocab: Tuple[str, ...] = tuple(sorted(set().union(*(r.categories for r in compiled))))
+        self.currency_vocab: Tuple[str, ...] = tuple(sorted(set().union(*(r.currencies for r in compiled))))
+        self._category_codes = {c: i for i, c in enumerate(self.category_vocab)}
+        self._currency_codes = {c: i for i, c in enumerate(self.currency_vocab)}
+        self.velocity_features: Tuple[str, ...] = tuple(dict.fromkeys(r.feature for r in compiled if r.feature))
+        self.needs_velocity = bool(self.velocity_features)
+        for rule in compiled:
+            rule.bind(self)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def evaluate(self, payload: dict, velocity: Optional[Mapping[str, float]] = None) -> Tuple[bool, List[str]]:
+        bits, reasons = self.evaluate_bits(payload, velocity)
+        return bits != 0, reasons
+
+    def evaluate_bits(
+        self, payload: dict, velocity: Optional[Mapping[str, float]] = None
+    ) -> Tuple[int, List[str]]:
+        """evaluate() for one row, returning the rule bitmask (bit k = rule k hit) instead of a flag."""
+        if not self.rules:
+            return 0, []
+        if velocity is None and self.needs_velocity:
+            velocity = get_velocity_store().features(payload)
+        amount = _amount(payload)
+        category = _normalize_category(payload.get("merchant_category"))
+        currency = _normalize_currency(payload.get("currency"))
+        bits, reasons = 0, []
+        for k, rule in enumerate(self.rules):
+            reason = rule.check(amount, category, currency, velocity)
+            if reason is not None:
+                bits |= 1 << k
+                reasons.append(reason)
+        return bits, reasons
+
+    def encode_categories(self, values: Iterable[Optional[str]]) -> np.ndarray:
+        codes = self._category_codes
+        return np.fromiter((codes.get(_normalize_category(v), -1) for v in values), dtype=np.int32)
+
+    def encode_currencies(self, values: Iterable[Optional[str]]) -> np.ndarray:
+        codes = self._currency_codes
+        return np.fromiter((codes.get(_normalize_currency(v), -1) for v in values), dtype=np.int32)
+
+    def columns(
+        self, payloads: Sequence[dict], velocity: Optional[Sequence[Mapping[str, float]]] = None
+    ) -> Columns:
+        """Extract a Columns batch from payloads, touching each dict once per needed field."""
+        n = len(payloads)
+        features: Dict[str, np.ndarray] = {}
+        if self.velocity_features:
+            if velocity is None:
+                store = get_velocity_store()
+                velocity = [store.features(p) for p in payloads]
+            for name in self.velocity_features:
+                features[name] = np.fromiter((v[name] for v in velocity), dtype=np.float64, count=n)
+        return Columns(
+            amount=np.fromiter((_amount(p) for p in payloads), dtype=np.float64, count=n),
+            category=self.encode_categories(p.get("merchant_category") for p in payloads),
+            currency=self.encode_currencies(p.get("currency") for p in payloads),
+            velocity=features,
+        )
+
+    def evaluate_columns(self, cols: Columns) -> RuleResults:
+        """Evaluate every rule as an array mask over the batch."""
+        bits = np.zeros(len(cols), dtype=np.uint64)
+        for k, rule in enumerate(self.rules):
+            bits |= rule.mask(cols).astype(np.uint64) << np.uint64(k)
+        return RuleResults(self, cols, bits)
+
+    def evaluate_batch(
+        self, payloads: Sequence[dict], velocity: Optional[Sequence[Mapping[str, float]]] = None
+    ) -> RuleResults:
+        return self.evaluate_columns(self.columns(payloads, velocity))
+
+
+def _version(definitions: Sequence[dict]) -> str:
+    blob = json.dumps(list(definitions), sort_keys=True, default=str).encode()
+    return hashlib.sha1(blob).hexdigest()[:12]
+
+
+def definitions_from_settings() -> List[dict]:
+    """The built-in rules, configured by AMOUNT_HARD_MAX, HIGH_RISK_CATEGORIES and VELOCITY_USER_MAX_1M."""
+    settings = get_settings()
+    definitions: List[dict] = [
+        {"name": "amount_hard_max", "type": "amount_max", "max": settings.AMOUNT_HARD_MAX},
+        {
+            "name": "high_risk_category",
+            "type": "category",
+            "categories": [c for c in settings.HIGH_RISK_CATEGORIES.split(",") if c.strip()],
+            "min_amount": DEFAULT_CATEGORY_MIN_AMOUNT,
+        },
+    ]
+    if settings.VELOCITY_USER_MAX_1M > 0:
+        definitions.append(
+            {"name": "user_velocity_1m", "type": "velocity", "feature": "user_count_1m", "max": settings.VELOCITY_USER_MAX_1M}
+        )
+    return definitions
+
+
+def definitions_from_file(path: str) -> List[dict]:
+    """A JSON list of rule definitions, or an object with a "rules" list."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("rules", [])
+    if not isinstance(data, list) or not all(isinstance(d, dict) for d in data):
+        raise RuleDefinitionError(f"{path}: expected a list of rule objects")
+    return data
+
+
+def definitions_from_db(bind=None) -> List[dict]:
+    """Rule definitions stored in the rule_definitions table, in position order."""
+    from sqlalchemy import select
+
+    from app.models import RuleDefinition
+    from app.models.db import engine
+
+    with (bind or engine).connect() as conn:
+        rows = conn.execute(
+            select(RuleDefinition.name, RuleDefinition.definition, RuleDefinition.enabled).order_by(
+                RuleDefinition.position, RuleDefinition.name
+            )
+        ).all()
+    definitions = []
+    for name, definition, enabled in rows:
+        d = json.loads(definition)
+        if not isinstance(d, dict):
+            raise RuleDefinitionError(f"rule {name!r}: expected a JSON object")
+        definitions.append({**d, "name": name, "enabled": bool(enabled) and d.get("enabled", True)})
+    return definitions
+
+
+def load_definitions() -> List[dict]:
     settings = get_settings()
     if not settings.ENABLE_RULES:
-        return False, []
+        return []
+    source = settings.RULES_SOURCE
+    if source == "file":
+        return definitions_from_file(settings.RULES_PATH)
+    if source == "db":
+        return definitions_from_db()
+    return definitions_from_settings()
 
-    reasons: List[str] = []
-    try:
-        amount = float(payload.get("amount", 0.0))
-    except Exception:
-        amount = 0.0
 
-    category = _normalize_category(payload.get("merchant_category"))
-    high_risk_categories = {c.strip().lower() for c in settings.HIGH_RISK_CATEGORIES.split(",") if c.strip()}
+_ruleset: Optional[RuleSet] = None
+_file_mtime: Optional[float] = None
+_ROW_LATENCY = metrics.RULES_LATENCY.labels(mode="row")
+_BATCH_LATENCY = metrics.RULES_LATENCY.labels(mode="batch")
+
+
+def get_ruleset() -> RuleSet:
+    global _ruleset
+    if _ruleset is None:
+        try:
+            reload_rules()
+        except Exception:
+            logger.exception("failed to load rules from %s; using built-in rules", get_settings().RULES_SOURCE)
+            _ruleset = RuleSet(definitions_from_settings() if get_settings().ENABLE_RULES else [])
+    return _ruleset
+
+
+def reload_rules(definitions: Optional[Sequence[dict]] = None) -> RuleSet:
+    """
+    Compile definitions (default: from RULES_SOURCE) and swap them in. The new
+    set is fully built before the single reference assignment, so concurrent
+    evaluations see either the old or the new rules, never a mix. Raises on
+    invalid definitions, leaving the current set in place.
+    """
+    global _ruleset, _file_mtime
+    settings = get_settings()
+    if definitions is None and settings.ENABLE_RULES and settings.RULES_SOURCE == "file":
+        _file_mtime = os.path.getmtime(settings.RULES_PATH)
+    ruleset = RuleSet(load_definitions() if definitions is None else definitions)
+    if _ruleset is None or ruleset.version != _ruleset.version:
+        logger.info("rules version %s loaded (%d active)", ruleset.version, len(ruleset))
+    _ruleset = ruleset
+    return ruleset
+
+
+def reload_if_changed() -> bool:
+    """Reload when the rule source changed; returns True when a new version was swapped in."""
+    settings = get_settings()
+    if settings.ENABLE_RULES and settings.RULES_SOURCE == "file":
+        if _ruleset is not None and os.path.getmtime(settings.RULES_PATH) == _file_mtime:
+            return False
+    previous = _ruleset.version if _ruleset is not None else None
+    return reload_rules().version != previous
+
 
-    # Rule 1: amount exceeds hard maximum
-    if amount > float(settings.AMOUNT_HARD_MAX):
-        reasons.append(f"amount>{settings.AMOUNT_HARD_MAX}")
+async def watch_rules(interval: Optional[float] = None) -> None:
+    """Poll the rule source until cancelled; bad definitions are logged and skipped."""
+    interval = interval or get_settings().RULES_RELOAD_INTERVAL_S
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(reload_if_changed)
+        except Exception:
+            logger.exception("rules reload failed; keeping version %s", get_ruleset().version)
 
-    # Rule 2: high-risk category with significant amount
-    if category and category in high_risk_categories and amount >= 1000:
-        reasons.append(f"high_risk_category:{category}")
 
-    return (len(reasons) > 0), reasons
+def evaluate_transaction(payload: dict, velocity: Optional[Dict[str, float]] = None) -> Tuple[bool, List[str]]:
+    """
+    Rule-based checks to complement ML, using the current compiled rule set.
+
+    Built-in rules (RULES_SOURCE=settings):
+    - Amount hard max: if amount > AMOUNT_HARD_MAX => fraud
+    - High-risk categories: if category in HIGH_RISK_CATEGORIES and amount >= 1000 => fraud
+    - User velocity: if VELOCITY_USER_MAX_1M > 0 and the user has more transactions than
+      that in the last minute => fraud (features read from the in-process velocity store
+      unless given)
+
+    Returns (is_fraud_by_rules, reasons)
+    """
+    with _ROW_LATENCY.time():
+        return get_ruleset().evaluate(payload, velocity)
+
+
+def evaluate_row(payload: dict, velocity: Optional[Dict[str, float]] = None) -> Tuple[RuleSet, int, List[str]]:
+    """evaluate_transaction, also returning the rule set used and the rule bitmask."""
+    with _ROW_LATENCY.time():
+        ruleset = get_ruleset()
+        bits, reasons = ruleset.evaluate_bits(payload, velocity)
+    return ruleset, bits, reasons
+
+
+def evaluate_batch(
+    payloads: Sequence[dict], velocity: Optional[Sequence[Dict[str, float]]] = None
+) -> RuleResults:
+    """
+    Columnar evaluate_transaction for a batch: `.flags` and the per-row rule
+    bitmask `.bits` are arrays; `.reasons(i)` formats reasons for one row.
+    """
+    with _BATCH_LATENCY.time():
+        return get_ruleset().evaluate_batch(payloads, velocity)
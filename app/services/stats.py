@@ -1,62 +1,180 @@
 from __future__ import annotations
-from datetime import datetime, timedelta
-from typing import Dict
-from sqlalchemy import text
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
 from sqlalchemy.orm import Session
 
+from app.services import rollups
+
 
 WINDOW_TO_INTERVAL = {
-    "7d": "7 days",
-    "30d": "30 days",
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30),
 }
+_WINDOW_RE = re.compile(r"^(\d+)([mhd])$")
+_WINDOW_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+GRANULARITIES = ("minute", "hour", "day")
+GROUP_BY_DIMENSIONS = rollups.DIMENSIONS
+# Bounds the number of timeseries points a single request can ask for
+MAX_BUCKETS = 100_000
+
+# (source, start, end): source is a rollup granularity or "raw"
+Segment = Tuple[str, datetime, datetime]
+
+
+class StatsQueryError(ValueError):
+    """The requested range, granularity or grouping cannot be answered."""
+
+
+def parse_window(window: str) -> timedelta:
+    """`7d`, `30d`, or any `<n>m`/`<n>h`/`<n>d`."""
+    if window in WINDOW_TO_INTERVAL:
+        return WINDOW_TO_INTERVAL[window]
+    m = _WINDOW_RE.match(window or "")
+    if not m or int(m.group(1)) == 0:
+        raise StatsQueryError(f"invalid window {window!r}; use e.g. 90m, 12h or 30d")
+    return timedelta(**{_WINDOW_UNITS[m.group(2)]: int(m.group(1))})
+
+
+def plan(start: datetime, end: datetime, granularity: str) -> List[Segment]:
+    """
+    Split [start, end) into segments answered by the coarsest rollup whose
+    buckets fit inside both the range and the output granularity; the
+    unaligned edges fall back to finer rollups and finally raw rows.
+    """
+    usable = [level for level in rollups.LEVELS if rollups.UNIT_SECONDS[level] <= rollups.UNIT_SECONDS[granularity]]
+
+    def split(s: datetime, e: datetime, levels: Sequence[str]) -> List[Segment]:
+        if s >= e:
+            return []
+        if not levels:
+            return [("raw", s, e)]
+        level = levels[0]
+        a, b = rollups.ceil(s, level), rollups.truncate(e, level)
+        if a >= b:
+            return split(s, e, levels[1:])
+        return split(s, a, levels[1:]) + [(level, a, b)] + split(b, e, levels[1:])
+
+    return split(start, end, usable)
+
 
+class StatsRows(NamedTuple):
+    """The validated request and the rows each plan segment returned, before shaping."""
 
-def compute_stats(db: Session, window: str = "7d") -> Dict:
-    interval = WINDOW_TO_INTERVAL.get(window, "7 days")
-
-    timeseries_sql = text(
-        """
-        SELECT
-          date_trunc('day', timestamp) AS ts,
-          SUM(CASE WHEN is_fraud THEN 1 ELSE 0 END) AS count_fraud,
-          SUM(CASE WHEN is_fraud THEN 0 ELSE 1 END) AS count_clean,
-          SUM(CASE WHEN status = 'APPROVED' THEN 1 ELSE 0 END) AS count_approved,
-          SUM(CASE WHEN status = 'PENDING_REVIEW' THEN 1 ELSE 0 END) AS count_pending,
-          SUM(CASE WHEN status = 'REJECTED' THEN 1 ELSE 0 END) AS count_rejected
-        FROM transactions
-        WHERE timestamp >= now() - INTERVAL :interval
-        GROUP BY 1
-        ORDER BY 1
-        """
-    )
-
-    totals_sql = text(
-        """
-        SELECT
-          SUM(CASE WHEN is_fraud THEN 1 ELSE 0 END) AS fraud_total,
-          SUM(CASE WHEN is_fraud THEN 0 ELSE 1 END) AS clean_total,
-          SUM(CASE WHEN status = 'PENDING_REVIEW' THEN 1 ELSE 0 END) AS pending_total,
-          SUM(CASE WHEN status = 'APPROVED' THEN 1 ELSE 0 END) AS approved_total,
-          SUM(CASE WHEN status = 'REJECTED' THEN 1 ELSE 0 END) AS rejected_total
-        FROM transactions
-        WHERE timestamp >= now() - INTERVAL :interval
-        """
-    )
-
-    rows = db.execute(timeseries_sql, {"interval": interval}).mappings().all()
-    totals = db.execute(totals_sql, {"interval": interval}).mappings().one()
+    start: datetime
+    end: datetime
+    granularity: str
+    group_by: Tuple[str, ...]
+    segments: List[Segment]
+    parts: List[list]
 
+
+def fetch_range(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    granularity: str = "day",
+    group_by: Sequence[str] = (),
+) -> StatsRows:
+    """Validate the request and run one query per plan segment; the rows are returned unprocessed."""
+    if granularity not in GRANULARITIES:
+        raise StatsQueryError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    unknown = [g for g in group_by if g not in GROUP_BY_DIMENSIONS]
+    if unknown:
+        raise StatsQueryError(f"cannot group by {', '.join(unknown)}; use {', '.join(GROUP_BY_DIMENSIONS)}")
+    group_by = tuple(dict.fromkeys(group_by))
+    start, end = rollups.as_utc(start), rollups.as_utc(end)
+    if start >= end:
+        raise StatsQueryError("`from` must be before `to`")
+    if (end - start).total_seconds() / rollups.UNIT_SECONDS[granularity] > MAX_BUCKETS:
+        raise StatsQueryError(f"more than {MAX_BUCKETS} {granularity} buckets requested; use a coarser granularity")
+
+    segments = plan(start, end, granularity)
+    conn = db.connection()
+    parts = []
+    for source, s, e in segments:
+        if source == "raw":
+            q = rollups.raw_query(conn, granularity, s, e, group_by)
+        else:
+            q = rollups.rollup_query(source, s, e, group_by)
+        parts.append(conn.execute(q).all())
+    return StatsRows(start, end, granularity, group_by, segments, parts)
+
+
+def shape_stats(rows: StatsRows) -> Dict:
+    """
+    Merge the segment rows into the response. Pure Python and up to
+    MAX_BUCKETS points, so async callers run it in a worker thread.
+    """
+    granularity, group_by = rows.granularity, rows.group_by
+    series: Dict[Tuple, List[int]] = {}
+    for part in rows.parts:
+        for (bucket, *dims), counts in rollups.to_series(part).items():
+            acc = series.setdefault((rollups.truncate(bucket, granularity), *dims), [0] * len(rollups.COUNTERS))
+            for i, c in enumerate(counts):
+                acc[i] += c
+
+    totals = [sum(c[i] for c in series.values()) for i in range(len(rollups.COUNTERS))]
     return {
+        "from": rows.start.isoformat(),
+        "to": rows.end.isoformat(),
+        "granularity": granularity,
+        "group_by": list(group_by),
+        "plan": [{"source": source, "from": s.isoformat(), "to": e.isoformat()} for source, s, e in rows.segments],
         "timeseries": [
             {
-                "ts": r["ts"].isoformat(),
-                "count_fraud": int(r["count_fraud"] or 0),
-                "count_clean": int(r["count_clean"] or 0),
-                "count_approved": int(r.get("count_approved", 0) or 0),
-                "count_pending": int(r.get("count_pending", 0) or 0),
-                "count_rejected": int(r.get("count_rejected", 0) or 0),
+                "ts": bucket.isoformat(),
+                **dict(zip(group_by, dims)),
+                **dict(zip(rollups.COUNTERS, counts)),
             }
-            for r in rows
+            for (bucket, *dims), counts in sorted(series.items())
         ],
-        "totals": {k: int(v or 0) for k, v in totals.items()},
+        "totals": {
+            "fraud_total": totals[0],
+            "clean_total": totals[1],
+            "pending_total": totals[3],
+            "approved_total": totals[2],
+            "rejected_total": totals[4],
+        },
     }
+
+
+def query_stats(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    granularity: str = "day",
+    group_by: Sequence[str] = (),
+) -> Dict:
+    """Fraud/clean and review-status counts per granularity bucket (and group) in [start, end)."""
+    return shape_stats(fetch_range(db, start, end, granularity, group_by))
+
+
+def fetch_stats(
+    db: Session,
+    window: str = "7d",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = "day",
+    group_by: Sequence[str] = (),
+) -> StatsRows:
+    """
+    fetch_range for [start, end), defaulting to the trailing `window` ending
+    now. Naive datetimes are taken as UTC.
+    """
+    now = datetime.now(timezone.utc)
+    end = rollups.as_utc(end) if end is not None else now
+    start = rollups.as_utc(start) if start is not None else end - parse_window(window)
+    return fetch_range(db, start, end, granularity, group_by)
+
+
+def compute_stats(
+    db: Session,
+    window: str = "7d",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = "day",
+    group_by: Sequence[str] = (),
+) -> Dict:
+    """Stats for [start, end), defaulting to the trailing `window` ending now."""
+    return shape_stats(fetch_stats(db, window, start, end, granularity, group_by))
@@ -0,0 +1,193 @@
+"""
+Wire format of the transactions topic.
+
+Schema 1 is a fixed struct layout, little endian, followed by the strings:
+
+    magic 0xFA | schema id u8 | flags u8 | timestamp i64 (epoch microseconds) | amount f64
+    | strings length u16
+    [lat f64 | lon f64]                        if FLAG_GEO; NaN stands for a missing coordinate
+    [transaction_id: 16 bytes]                 if FLAG_TX_UUID
+    [user_id: 16 bytes]                        if FLAG_USER_UUID
+    UTF-8 strings joined by NUL: [transaction_id] [user_id] currency merchant_id
+    merchant_category channel ip [device_id]
+
+Ids are packed as 16 bytes only when they are canonical (lowercase,
+hyphenated) UUIDs, so decoding gives back the same string; otherwise they
+are the leading strings. Strings cannot contain NUL. Decoding is one struct
+unpack, one UTF-8 decode and one split. A timestamp without an offset keeps
+FLAG_NAIVE_TS and decodes naive again; aware ones decode as UTC.
+
+Anything not starting with the magic byte is decoded as legacy JSON.
+"""
+from __future__ import annotations
+import json
+import math
+import struct
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Mapping, Optional
+
+MAGIC = 0xFA
+_MAGIC_BYTE = bytes([MAGIC])
+SCHEMA_V1 = 1
+
+FLAG_NAIVE_TS = 1
+FLAG_GEO = 2
+FLAG_TX_UUID = 4
+FLAG_USER_UUID = 8
+FLAG_DEVICE = 16
+
+FORMATS = ("binary", "json")
+
+_HEAD = struct.Struct("<BBBqdH")
+_GEO = struct.Struct("<dd")
+_MICROSECOND = timedelta(microseconds=1)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EPOCH_NAIVE = datetime(1970, 1, 1)
+_STRINGS = ("currency", "merchant_id", "merchant_category", "channel", "ip")
+# Bytes before the strings, by flags
+_FIXED_SIZE = [
+    _HEAD.size
+    + (_GEO.size if f & FLAG_GEO else 0)
+    + (16 if f & FLAG_TX_UUID else 0)
+    + (16 if f & FLAG_USER_UUID else 0)
+    for f in range(32)
+]
+
+
+class WireFormatError(ValueError):
+    pass
+
+
+def _uuid_bytes(value: str) -> Optional[bytes]:
+    if len(value) != 36:
+        return None
+    try:
+        u = uuid.UUID(value)
+    except ValueError:
+        return None
+    return u.bytes if str(u) == value else None
+
+
+def _uuid_str(raw: bytes) -> str:
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _coordinate(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+def encode_binary(payload: Mapping) -> bytes:
+    """Schema 1 encoding of a TransactionIn payload (timestamp as datetime or ISO string)."""
+    ts = payload["timestamp"]
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    flags = 0
+    if ts.tzinfo is None:
+        flags |= FLAG_NAIVE_TS
+        micros = (ts - _EPOCH_NAIVE) // _MICROSECOND
+    else:
+        micros = (ts - _EPOCH) // _MICROSECOND
+
+    fixed = []
+    geo = payload.get("geo")
+    if geo is not None:
+        flags |= FLAG_GEO
+        fixed.append(_GEO.pack(_coordinate(geo.get("lat")), _coordinate(geo.get("lon"))))
+    strings = []
+    for field, flag in (("transaction_id", FLAG_TX_UUID), ("user_id", FLAG_USER_UUID)):
+        value = str(payload[field])
+        packed = _uuid_bytes(value)
+        if packed is not None:
+            flags |= flag
+            fixed.append(packed)
+        else:
+            strings.append(value)
+    strings.extend(str(v) if (v := payload.get(field)) is not None else "" for field in _STRINGS)
+    device = payload.get("device_id")
+    if device is not None:
+        flags |= FLAG_DEVICE
+        strings.append(str(device))
+    if any("\x00" in v for v in strings):
+        raise WireFormatError("string fields cannot contain NUL")
+    tail = "\x00".join(strings).encode()
+    if len(tail) > 0xFFFF:
+        raise WireFormatError(f"{len(tail)} bytes of strings do not fit the wire format")
+    head = _HEAD.pack(MAGIC, SCHEMA_V1, flags, micros, float(payload["amount"]), len(tail))
+    return head + b"".join(fixed) + tail
+
+
+def decode_binary(buf: bytes) -> dict:
+    """Payload dict from a schema 1 message; `timestamp` is a datetime."""
+    try:
+        magic, schema, flags, micros, amount, tail = _HEAD.unpack_from(buf, 0)
+    except struct.error as e:
+        raise WireFormatError(f"truncated binary message: {e}") from e
+    if magic != MAGIC:
+        raise WireFormatError("not a binary transaction message")
+    if schema != SCHEMA_V1:
+        raise WireFormatError(f"unknown wire schema {schema}")
+    pos = _HEAD.size
+    size = _FIXED_SIZE[flags & 0x1F] + tail
+    if len(buf) != size:
+        raise WireFormatError(f"binary message of {len(buf)} bytes, expected {size}")
+    geo = None
+    if flags & FLAG_GEO:
+        lat, lon = _GEO.unpack_from(buf, pos)
+        pos += _GEO.size
+        geo = {"lat": None if math.isnan(lat) else lat, "lon": None if math.isnan(lon) else lon}
+    tx_id = user_id = None
+    if flags & FLAG_TX_UUID:
+        tx_id = _uuid_str(buf[pos:pos + 16])
+        pos += 16
+    if flags & FLAG_USER_UUID:
+        user_id = _uuid_str(buf[pos:pos + 16])
+        pos += 16
+    try:
+        strings = buf[pos:].decode().split("\x00")
+    except UnicodeDecodeError as e:
+        raise WireFormatError(f"corrupt binary message: {e}") from e
+    lead = (tx_id is None) + (user_id is None)
+    has_device = bool(flags & FLAG_DEVICE)
+    if len(strings) != lead + len(_STRINGS) + has_device:
+        raise WireFormatError(f"binary message has {len(strings)} strings, not {lead + len(_STRINGS) + has_device}")
+    if tx_id is None:
+        tx_id = strings[0]
+    if user_id is None:
+        user_id = strings[lead - 1]
+    currency, merchant_id, merchant_category, channel, ip = strings[lead:lead + len(_STRINGS)]
+    return {
+        "transaction_id": tx_id,
+        "user_id": user_id,
+        "amount": amount,
+        "currency": currency,
+        "merchant_id": merchant_id,
+        "merchant_category": merchant_category,
+        "timestamp": (_EPOCH_NAIVE if flags & FLAG_NAIVE_TS else _EPOCH) + timedelta(microseconds=micros),
+        "channel": channel,
+        "ip": ip,
+        "geo": geo,
+        "device_id": strings[-1] if has_device else None,
+    }
+
+
+def is_binary(value: bytes) -> bool:
+    return value[:1] == _MAGIC_BYTE
+
+
+def encode(payload: Mapping, wire_format: str = "binary") -> bytes:
+    """Encode a payload for the transactions topic in KAFKA_WIRE_FORMAT."""
+    if wire_format == "json":
+        return json.dumps(payload, default=str).encode()
+    return encode_binary(payload)
+
+
+def decode(value: bytes) -> dict:
+    """Decode either wire format; raises ValueError (WireFormatError or JSONDecodeError) on garbage."""
+    if is_binary(value):
+        return decode_binary(value)
+    payload = json.loads(value)
+    if not isinstance(payload, dict):
+        raise WireFormatError("JSON message is not an object")
+    return payload
@@ -0,0 +1,133 @@
+"""
+Standalone Kafka consumer, separate from the API process:
+
+    python -m app.worker [--workers N]
+
+Starts N worker processes in the CONSUMER_GROUP_ID group. Kafka assigns each
+one a share of the topic's partitions. Producers key messages by user_id, so
+each user's transactions stay in one partition and are processed in order by
+the single worker owning it. Every worker scores its batches in its own
+process, with its own model and core. A worker that crashes is restarted.
+SIGTERM or SIGINT drains each worker (the batch in progress is persisted and
+committed) before it leaves the group.
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from typing import Dict, Optional
+
+from prometheus_client import start_http_server
+
+from app.config import get_settings
+from app.kafka_consumer import KafkaConsumerService
+from app.models.db import Base, engine, watch_pools
+from app.services import rules
+
+logger = logging.getLogger("app.worker")
+
+
+async def _consume(index: int) -> None:
+    settings = get_settings()
+    if settings.CONSUMER_METRICS_PORT > 0:
+        start_http_server(settings.CONSUMER_METRICS_PORT + index)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    logger.info("consumer worker %d (pid %d) starting", index, os.getpid())
+    # The same watchers the API runs, so edge verdicts keep matching this worker's rules version
+    rules.get_ruleset()
+    watchers = [asyncio.create_task(rules.watch_rules())]
+    if settings.DB_LIVENESS_INTERVAL_S > 0:
+        watchers.append(asyncio.create_task(watch_pools(settings.DB_LIVENESS_INTERVAL_S)))
+    try:
+        await KafkaConsumerService().run(stop)
+    finally:
+        for task in watchers:
+            task.cancel()
+            with contextlib.suppress(Exception, asyncio.CancelledError):
+                await task
+    logger.info("consumer worker %d drained", index)
+
+
+def run_worker(index: int) -> None:
+    settings = get_settings()
+    logging.basicConfig(level=getattr(logging, settings.LOG_LEVEL, logging.INFO))
+    asyncio.run(_consume(index))
+
+
+class Supervisor:
+    """Keeps N worker processes running and drains them on shutdown."""
+
+    def __init__(self, workers: int, drain_timeout: float, restart_delay: float = 1.0):
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self.restart_delay = restart_delay
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: Dict[int, multiprocessing.process.BaseProcess] = {}
+        self._stopping = False
+
+    def _spawn(self, index: int) -> None:
+        proc = self._ctx.Process(target=run_worker, args=(index,), name=f"fraud-consumer-{index}")
+        proc.start()
+        self._procs[index] = proc
+
+    def stop(self, *_: object) -> None:
+        self._stopping = True
+
+    def run(self) -> int:
+        for index in range(self.workers):
+            self._spawn(index)
+        while not self._stopping:
+            time.sleep(0.5)
+            for index, proc in list(self._procs.items()):
+                if proc.is_alive() or self._stopping:
+                    continue
+                logger.warning("consumer worker %d exited with %s; restarting", index, proc.exitcode)
+                time.sleep(self.restart_delay)
+                self._spawn(index)
+        return self._drain()
+
+    def _drain(self) -> int:
+        for proc in self._procs.values():
+            if proc.is_alive():
+                proc.terminate()  # SIGTERM: the worker finishes its batch and commits
+        deadline = time.monotonic() + self.drain_timeout
+        failed = 0
+        for index, proc in self._procs.items():
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                logger.error("consumer worker %d did not drain in %.0fs; killing it", index, self.drain_timeout)
+                proc.kill()
+                proc.join()
+                failed += 1
+        return 1 if failed else 0
+
+
+def main(argv: Optional[list] = None) -> int:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run the transaction consumer as N worker processes")
+    parser.add_argument(
+        "--workers", type=int, default=settings.CONSUMER_WORKERS, help="Worker processes (0: one per CPU)"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=getattr(logging, settings.LOG_LEVEL, logging.INFO))
+
+    workers = args.workers if args.workers > 0 else os.cpu_count() or 1
+    # Once here rather than racing in every worker
+    Base.metadata.create_all(bind=engine)
+    supervisor = Supervisor(workers, settings.CONSUMER_DRAIN_TIMEOUT_S)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    logger.info("starting %d consumer workers", workers)
+    return supervisor.run()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Transaction
+from app.schemas.transaction import TransactionDetail
+from app.services import flagged, persistence
+from app.services.cache import RedisCache, TransactionDetailCache
+from bench_persistence import make_batch
+
+
+def orm_detail(db, tx_id: str) -> str:
+    """The previous GET /fraud/tx/{id} path: ORM object, Pydantic model, then JSON."""
+    t = db.query(Transaction).filter(Transaction.id == tx_id).one_or_none()
+    return TransactionDetail(
+        id=t.id,
+        user_id=t.user_id,
+        amount=float(t.amount) if t.amount is not None else None,
+        currency=t.currency,
+        merchant_id=t.merchant_id,
+        merchant_category=t.merchant_category,
+        timestamp=t.timestamp,
+        channel=t.channel,
+        ip=t.ip,
+        lat=float(t.lat) if t.lat is not None else None,
+        lon=float(t.lon) if t.lon is not None else None,
+        device_id=t.device_id,
+        score=t.score,
+        is_fraud=t.is_fraud,
+        status=t.status,
+    ).model_dump_json()
+
+
+def percentiles(samples: list) -> tuple:
+    q = statistics.quantiles(samples, n=100)
+    return q[49] * 1e6, q[98] * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="p50/p99 of transaction detail lookups with and without the cache")
+    parser.add_argument("--dsn", default=os.environ.get("BENCH_DSN", "sqlite:///./bench_detail_cache.db"))
+    parser.add_argument("--redis", default=os.environ.get("BENCH_REDIS_URL", ""), help="Redis URL; fakeredis if empty")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--hot", type=float, default=0.05, help="Share of rows receiving 80%% of the views")
+    args = parser.parse_args()
+
+    engine = create_engine(args.dsn, future=True)
+    Base.metadata.create_all(bind=engine)
+    batch = make_batch(args.rows)
+    with engine.begin() as conn:
+        persistence.upsert_transactions(conn, persistence.build_rows(*batch), copy_threshold=0)
+    ids = [p["transaction_id"] for p in batch[0]]
+
+    # Detail views concentrate on recently flagged transactions
+    rng = random.Random(7)
+    hot = ids[: max(1, int(len(ids) * args.hot))]
+    stream = [rng.choice(hot) if rng.random() < 0.8 else rng.choice(ids) for _ in range(args.requests)]
+
+    redis_cache = RedisCache(args.redis or "redis://unused:6379/0")
+    if not args.redis:
+        import fakeredis
+
+        redis_cache.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    cache = TransactionDetailCache(redis_cache, max_entries=len(hot) * 2, ttl=60)
+
+    Session = sessionmaker(bind=engine, future=True)
+    with Session() as db:
+        off = []
+        for tx_id in stream:
+            t0 = time.perf_counter()
+            orm_detail(db, tx_id)
+            off.append(time.perf_counter() - t0)
+            db.expunge_all()
+
+        on = []
+        for tx_id in stream:
+            async def load(tx_id=tx_id):
+                return flagged.load_entry(db, tx_id)
+
+            t0 = time.perf_counter()
+            await cache.get(tx_id, load)
+            on.append(time.perf_counter() - t0)
+
+    print(f"dsn={engine.url.render_as_string(hide_password=True)} redis={args.redis or 'fakeredis'}")
+    print(f"{'path':>10} {'p50 us':>9} {'p99 us':>9}")
+    for name, samples in (("uncached", off), ("cached", on)):
+        p50, p99 = percentiles(samples)
+        print(f"{name:>10} {p50:>9.1f} {p99:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("ENABLE_KAFKA", "false")
+os.environ.setdefault("POSTGRES_DSN", "sqlite:///./bench_event_loop.db")
+os.environ.setdefault(
+    "MODEL_PATH", os.path.join(os.path.dirname(__file__), "..", "app", "models", "artifacts", "iforest.pkl")
+)
+
+import httpx  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.models.db import engine  # noqa: E402
+from app.services import stats as stats_service  # noqa: E402
+from app.services.auth import create_access_token  # noqa: E402
+
+# A query that keeps the database busy for a while without needing any data
+SLOW_SQL = text(
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :n) SELECT count(*) FROM c"
+)
+if engine.dialect.name == "postgresql":
+    SLOW_SQL = text("SELECT count(*) FROM generate_series(1, :n)")
+
+TX = {
+    "transaction_id": "bench-loop",
+    "user_id": "u1",
+    "amount": 12.5,
+    "currency": "USD",
+    "merchant_id": "m_1",
+    "merchant_category": "grocery",
+    "timestamp": "2024-01-01T00:00:00Z",
+    "channel": "web",
+    "ip": "10.0.0.1",
+}
+
+
+def bucket_rows(buckets: int) -> stats_service.StatsRows:
+    """`buckets` minute points for two channels, the result shape a long range at minute granularity returns."""
+    end = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    start = end - timedelta(minutes=buckets)
+    rows = [
+        (start + timedelta(minutes=i), channel, 1, 0, 0, 1, 0)
+        for i in range(buckets)
+        for channel in ("web", "pos")
+    ]
+    return stats_service.StatsRows(start, end, "minute", ("channel",), [("raw", start, end)], [rows])
+
+
+def slow_stats(rows: int, buckets: int, mode: str):
+    """fetch_stats replacement: the slow query, then the rows of `buckets` points."""
+    fetched = bucket_rows(buckets)
+
+    def fetch(db, window, **kwargs):
+        if mode == "blocking":
+            # The original route: a sync Session queried and shaped inline on the event loop thread
+            with engine.connect() as conn:
+                conn.execute(SLOW_SQL, {"n": rows}).scalar()
+        else:
+            db.execute(SLOW_SQL, {"n": rows}).scalar()
+        # run_sync calls this on the loop thread, so shaping here stalls it as before the split
+        return real_shape(fetched) if mode != "async" else fetched
+
+    return fetch
+
+
+real_shape = stats_service.shape_stats
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, samples: dict) -> None:
+    while not stop.is_set():
+        for name, send in (
+            ("/health", lambda: client.get("/health")),
+            ("/transactions", lambda: client.post("/transactions", json=TX)),
+        ):
+            t0 = time.perf_counter()
+            await send()
+            samples[name].append(time.perf_counter() - t0)
+        await asyncio.sleep(0.005)
+
+
+async def loop_lag(stop: asyncio.Event, samples: dict) -> None:
+    """How late a 1 ms sleep wakes up: the longest time the loop was held by one callback."""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.001)
+        samples["lag"].append(time.perf_counter() - t0 - 0.001)
+
+
+async def run(mode: str, rows: int, buckets: int, concurrency: int, first_window: int) -> dict:
+    stats_service.fetch_stats = slow_stats(rows, buckets, mode)
+    stats_service.shape_stats = real_shape if mode == "async" else (lambda shaped: shaped)
+    headers = {"Authorization": f"Bearer {create_access_token('bench')}"}
+    samples = {"/health": [], "/transactions": [], "lag": []}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe(client, stop, samples))
+        lag = asyncio.create_task(loop_lag(stop, samples))
+        t0 = time.perf_counter()
+        # Windows no other request used, so every slow query misses the stats cache
+        windows = [f"{first_window + i}d" for i in range(concurrency)]
+        await asyncio.gather(*(client.get("/fraud/stats", params={"window": w}, headers=headers) for w in windows))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await prober
+        await lag
+    return {"elapsed": elapsed, **samples}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="/health and /transactions latency while slow stats queries run")
+    parser.add_argument("--rows", type=int, default=3_000_000, help="Size of the slow query")
+    parser.add_argument("--buckets", type=int, default=50_000, help="Timeseries points each stats response shapes")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent slow /fraud/stats requests")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    print(f"dsn={engine.url.render_as_string(hide_password=True)}")
+    # blocking: sync query and shaping on the loop; loop-shape: awaited query, shaping on the loop;
+    # async: awaited query, shaping in a worker thread (the route as it is)
+    print(
+        f"{'mode':>10} {'stats s':>8} {'lag max ms':>10} {'endpoint':>14} {'probes':>7} {'p50 ms':>8} {'max ms':>8}"
+    )
+    for n, mode in enumerate(("blocking", "loop-shape", "async")):
+        result = await run(mode, args.rows, args.buckets, args.concurrency, 1 + n * args.concurrency)
+        for name in ("/health", "/transactions"):
+            s = result[name]
+            p50 = statistics.median(s) * 1000 if s else float("nan")
+            worst = max(s) * 1000 if s else float("nan")
+            lag = max(result["lag"]) * 1000
+            print(f"{mode:>10} {result['elapsed']:>8.2f} {lag:>10.1f} {name:>14} {len(s):>7} {p50:>8.1f} {worst:>8.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
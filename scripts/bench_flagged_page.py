@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Transaction
+from app.schemas.transaction import TransactionListItem
+from app.services import flagged, persistence
+from bench_persistence import make_batch
+
+LIST_ADAPTER = TypeAdapter(List[TransactionListItem])
+
+
+def orm_page(db, limit: int) -> bytes:
+    """The previous GET /fraud/flagged path: ORM objects, response_model validation, jsonable_encoder, json."""
+    t = Transaction
+    q = select(t).where(t.is_fraud.is_(True), t.timestamp.is_not(None))
+    rows = list(db.execute(q.order_by(t.timestamp.desc(), t.id.desc()).limit(limit + 1)).scalars())[:limit]
+    items = LIST_ADAPTER.validate_python([flagged.cache_entry(r) for r in rows])
+    return json.dumps(jsonable_encoder(items)).encode()
+
+
+def tuple_page(db, limit: int) -> bytes:
+    """The current path: column tuples, entries, orjson."""
+    rows, _ = flagged.query_flagged(db, limit)
+    return flagged.page_body([flagged.cache_entry(r) for r in rows])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p50/p99 of one flagged page, ORM + Pydantic vs tuples + orjson")
+    parser.add_argument("--dsn", default=os.environ.get("BENCH_DSN", "sqlite:///./bench_flagged_page.db"))
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    engine = create_engine(args.dsn, future=True)
+    Base.metadata.create_all(bind=engine)
+    payloads, scores, _ = make_batch(args.rows)
+    with engine.begin() as conn:
+        persistence.upsert_transactions(
+            conn, persistence.build_rows(payloads, scores, [True] * len(payloads)), copy_threshold=0
+        )
+
+    Session = sessionmaker(bind=engine, future=True)
+    print(f"dsn={engine.url.render_as_string(hide_password=True)} limit={args.limit}")
+    print(f"{'path':>15} {'p50 ms':>8} {'p99 ms':>8} {'bytes':>8}")
+    with Session() as db:
+        for name, page in (("orm+pydantic", orm_page), ("tuples+orjson", tuple_page)):
+            samples = []
+            for _ in range(args.requests):
+                t0 = time.perf_counter()
+                body = page(db, args.limit)
+                samples.append(time.perf_counter() - t0)
+                db.expunge_all()
+            q = statistics.quantiles(samples, n=100)
+            print(f"{name:>15} {q[49] * 1e3:>8.2f} {q[98] * 1e3:>8.2f} {len(body):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import os
+import time
+import uuid
+
+import numpy as np
+
+from app.services.inference import FraudModel
+
+
+def make_payloads(n: int, rng: np.random.Generator) -> list:
+    amounts = rng.lognormal(mean=4.0, sigma=1.0, size=n)
+    return [
+        {
+            "transaction_id": str(uuid.uuid4()),
+            "user_id": f"u_{i % 1000}",
+            "amount": float(a),
+            "currency": "USD",
+            "merchant_id": f"m_{i % 50}",
+            "merchant_category": "electronics",
+            "timestamp": "2024-01-01T00:00:00+00:00",
+            "channel": "web",
+            "ip": "127.0.0.1",
+        }
+        for i, a in enumerate(amounts)
+    ]
+
+
+def bench(fn, rows: int, min_seconds: float) -> float:
+    """Return the best observed seconds per row for fn()."""
+    fn()  # warm-up
+    best = float("inf")
+    deadline = time.perf_counter() + min_seconds
+    while True:
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+        if time.perf_counter() >= deadline:
+            break
+    return best / rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-row model scoring cost by batch size and backend")
+    parser.add_argument("--model", default=os.environ.get("MODEL_PATH", "./app/models/artifacts/iforest.pkl"))
+    parser.add_argument("--sizes", default="1,16,256,4096")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Time budget per measurement")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for backend in ("sklearn", "compiled"):
+        model = FraudModel(args.model, backend=backend)
+        print(f"backend={model.backend}")
+        print(f"{'batch':>6} {'per-row loop (us)':>18} {'per-row batch (us)':>19} {'speedup':>8}")
+        for size in (int(s) for s in args.sizes.split(",")):
+            payloads = make_payloads(size, rng)
+            loop = bench(lambda: [model.predict_from_transaction(p) for p in payloads], size, args.seconds)
+            batch = bench(lambda: model.predict_batch(payloads), size, args.seconds)
+            print(f"{size:>6} {loop * 1e6:>18.2f} {batch * 1e6:>19.2f} {loop / batch:>7.1f}x")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+os.environ.setdefault("ENABLE_KAFKA", "false")
+os.environ.setdefault("POSTGRES_DSN", "sqlite:///./bench_metrics_overhead.db")
+os.environ.setdefault(
+    "MODEL_PATH", os.path.join(os.path.dirname(__file__), "..", "app", "models", "artifacts", "iforest.pkl")
+)
+
+import httpx  # noqa: E402
+
+from app.kafka_consumer import ThroughputCounter  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Base  # noqa: E402
+from app.models.db import engine  # noqa: E402
+from app.services import metrics, persistence, rules  # noqa: E402
+from app.services.inference import FraudModel  # noqa: E402
+from bench_persistence import make_batch  # noqa: E402
+
+TX = {
+    "transaction_id": "bench-metrics",
+    "user_id": "u1",
+    "amount": 12.5,
+    "currency": "USD",
+    "merchant_id": "m_1",
+    "merchant_category": "grocery",
+    "timestamp": "2024-01-01T00:00:00Z",
+    "channel": "web",
+    "ip": "10.0.0.1",
+}
+# Timed hooks a single POST /transactions passes besides the middleware: rules (row) and model
+REQUEST_HOOKS = 2
+# Per consumer batch: rules, model, upsert, one observation per stage, record age, lag for one partition
+BATCH_HOOKS = 3 + len(ThroughputCounter.STAGES) + 2
+
+
+async def request_time(n: int) -> float:
+    """Median end-to-end POST /transactions time through the instrumented app."""
+    transport = httpx.ASGITransport(app=app)
+    samples = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(n):
+            t0 = time.perf_counter()
+            await client.post("/transactions", json=TX)
+            samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def batch_time(model: FraudModel, batch_size: int, rounds: int) -> float:
+    """Median consumer-path time (rules, model, upsert) for one batch."""
+    samples = []
+    for _ in range(rounds):
+        payloads, scores, flags = make_batch(batch_size)
+        t0 = time.perf_counter()
+        rules.evaluate_batch(payloads)
+        model.predict_batch(payloads)
+        with engine.begin() as conn:
+            persistence.upsert_transactions(conn, persistence.build_rows(payloads, scores, flags), copy_threshold=0)
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+async def middleware_cost(n: int) -> float:
+    """Per-request time RequestMetricsMiddleware adds around a trivial ASGI app."""
+
+    async def bare(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop(message):
+        pass
+
+    scope = {"type": "http", "method": "GET"}
+    wrapped = metrics.RequestMetricsMiddleware(bare)
+    timings = []
+    for target in (bare, wrapped, bare, wrapped):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            await target(scope, None, noop)
+        timings.append((time.perf_counter() - t0) / n)
+    return max(0.0, min(timings[1], timings[3]) - min(timings[0], timings[2]))
+
+
+def hook_cost(n: int) -> float:
+    """Time of one timed observation, as used by the rules, model, upsert and Redis hooks."""
+    child = metrics.RULES_LATENCY.labels(mode="batch")
+    t0 = time.perf_counter()
+    for _ in range(n):
+        with child.time():
+            pass
+    return (time.perf_counter() - t0) / n
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Ingest-path cost of the Prometheus middleware and hooks")
+    parser.add_argument("--requests", type=int, default=2000, help="POST /transactions to time")
+    parser.add_argument("--batch", type=int, default=500, help="Rows per consumer batch")
+    parser.add_argument("--rounds", type=int, default=20, help="Consumer batches to time")
+    parser.add_argument("--iterations", type=int, default=100_000, help="Calls per instrumentation micro-benchmark")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    Base.metadata.create_all(bind=engine)
+    model = FraudModel.instance()
+    await request_time(50)  # warm-up
+    request = await request_time(args.requests)
+    batch = batch_time(model, args.batch, args.rounds)
+    middleware = await middleware_cost(args.iterations)
+    hook = hook_cost(args.iterations)
+
+    per_request = middleware + REQUEST_HOOKS * hook
+    per_batch = BATCH_HOOKS * hook
+    print(f"middleware {middleware * 1e6:.2f} us/request, timed hook {hook * 1e6:.2f} us")
+    print(f"{'path':>28} {'path us':>10} {'metrics us':>11} {'overhead':>9}")
+    for name, path, cost in (
+        ("POST /transactions", request, per_request),
+        (f"consumer batch of {args.batch}", batch, per_batch),
+    ):
+        print(f"{name:>28} {path * 1e6:>10.1f} {cost * 1e6:>11.2f} {100 * cost / path:>8.2f}%")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
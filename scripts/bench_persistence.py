@@ -0,0 +1,102 @@
+import argparse
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Transaction, TransactionStatus
+from app.services import persistence
+
+
+def make_batch(n: int) -> tuple:
+    now = datetime.now(timezone.utc).isoformat()
+    payloads = [
+        {
+            "transaction_id": str(uuid.uuid4()),
+            "user_id": f"u_{i % 1000}",
+            "amount": 10.0 + i % 500,
+            "currency": "USD",
+            "merchant_id": f"m_{i % 50}",
+            "merchant_category": "electronics",
+            "timestamp": now,
+            "channel": "web",
+            "ip": "127.0.0.1",
+            "geo": {"lat": 37.7, "lon": -122.4},
+            "device_id": f"dev_{i % 300}",
+        }
+        for i in range(n)
+    ]
+    return payloads, [0.1] * n, [i % 20 == 0 for i in range(n)]
+
+
+def per_row_upsert(Session, payloads, scores, is_fraud) -> None:
+    """The previous consumer path: one session, SELECT and commit per transaction."""
+    for payload, score, fraud in zip(payloads, scores, is_fraud):
+        db = Session()
+        try:
+            tx_id = str(payload.get("transaction_id"))
+            t = db.query(Transaction).filter(Transaction.id == tx_id).one_or_none()
+            if t is None:
+                geo = payload.get("geo", {}) or {}
+                t = Transaction(
+                    id=tx_id,
+                    user_id=str(payload.get("user_id")),
+                    amount=payload.get("amount"),
+                    currency=payload.get("currency"),
+                    merchant_id=payload.get("merchant_id"),
+                    merchant_category=payload.get("merchant_category"),
+                    timestamp=persistence.parse_ts(payload.get("timestamp")),
+                    channel=payload.get("channel"),
+                    ip=payload.get("ip"),
+                    lat=geo.get("lat"),
+                    lon=geo.get("lon"),
+                    device_id=payload.get("device_id"),
+                )
+                db.add(t)
+            t.score = score
+            t.is_fraud = fraud
+            t.status = TransactionStatus.PENDING_REVIEW if fraud else TransactionStatus.APPROVED
+            db.commit()
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rows/sec of per-row ORM upserts vs batched upserts")
+    parser.add_argument("--dsn", default=os.environ.get("BENCH_DSN", "sqlite:///./bench_persistence.db"))
+    parser.add_argument("--sizes", default="100,1000,10000")
+    args = parser.parse_args()
+
+    engine = create_engine(args.dsn, future=True)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, future=True)
+
+    print(f"dsn={engine.url.render_as_string(hide_password=True)}")
+    print(f"{'rows':>6} {'per-row rows/s':>15} {'batch rows/s':>13} {'copy rows/s':>12}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        batch = make_batch(n)
+        t0 = time.perf_counter()
+        per_row_upsert(Session, *batch)
+        per_row = n / (time.perf_counter() - t0)
+
+        batch = make_batch(n)
+        t0 = time.perf_counter()
+        with engine.begin() as conn:
+            persistence.upsert_transactions(conn, persistence.build_rows(*batch), copy_threshold=0)
+        values = n / (time.perf_counter() - t0)
+
+        copy = "n/a"
+        if engine.dialect.name == "postgresql":
+            batch = make_batch(n)
+            t0 = time.perf_counter()
+            with engine.begin() as conn:
+                persistence.upsert_transactions(conn, persistence.build_rows(*batch), copy_threshold=1)
+            copy = f"{n / (time.perf_counter() - t0):.0f}"
+        print(f"{n:>6} {per_row:>15.0f} {values:>13.0f} {copy:>12}")
+
+
+if __name__ == "__main__":
+    main()
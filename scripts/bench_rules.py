@@ -0,0 +1,67 @@
+import argparse
+import time
+
+import numpy as np
+
+from app.services import rules
+
+CATEGORIES = ["electronics", "grocery", "travel", "jewelry", "crypto", "books"]
+CURRENCIES = ["USD", "EUR", "GBP", "JPY"]
+
+DEFINITIONS = [
+    {"type": "amount_max", "max": 1_000_000},
+    {"type": "category", "categories": ["jewelry", "crypto"], "min_amount": 1000},
+    {"type": "currency_limit", "limits": {"EUR": 20_000, "JPY": 3_000_000}},
+    {"type": "velocity", "feature": "user_count_1m", "max": 10},
+]
+
+
+def make_batch(n: int, rng: np.random.Generator):
+    amounts = rng.lognormal(mean=5.0, sigma=1.5, size=n)
+    cats = rng.choice(CATEGORIES, size=n)
+    curs = rng.choice(CURRENCIES, size=n)
+    counts = rng.integers(0, 15, size=n)
+    payloads = [
+        {"amount": float(a), "merchant_category": str(c), "currency": str(k)} for a, c, k in zip(amounts, cats, curs)
+    ]
+    velocity = [{"user_count_1m": int(v)} for v in counts]
+    return payloads, velocity
+
+
+def bench(fn, rows: int, min_seconds: float) -> float:
+    """Return the best observed seconds per row for fn()."""
+    fn()  # warm-up
+    best = float("inf")
+    deadline = time.perf_counter() + min_seconds
+    while True:
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+        if time.perf_counter() >= deadline:
+            break
+    return best / rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-row vs columnar rule evaluation")
+    parser.add_argument("--sizes", default="1,16,256,4096,65536")
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    ruleset = rules.RuleSet(DEFINITIONS)
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>6} {'per-row us':>11} {'payloads us':>12} {'columns us':>11} {'speedup':>8}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        payloads, velocity = make_batch(n, rng)
+        cols = ruleset.columns(payloads, velocity)
+        per_row = bench(lambda: [ruleset.evaluate(p, v) for p, v in zip(payloads, velocity)], n, args.seconds)
+        from_payloads = bench(lambda: ruleset.evaluate_batch(payloads, velocity), n, args.seconds)
+        columnar = bench(lambda: ruleset.evaluate_columns(cols), n, args.seconds)
+        print(
+            f"{n:>6} {per_row * 1e6:>11.3f} {from_payloads * 1e6:>12.3f} {columnar * 1e6:>11.3f} "
+            f"{per_row / columnar:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
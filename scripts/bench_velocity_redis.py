@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+import os
+import time
+
+from app.services.cache import SharedVelocityCounters
+
+
+def make_payloads(n: int, users: int) -> list:
+    return [
+        {"amount": 10.0 + i % 90, "user_id": f"u_{i % users}", "device_id": f"d_{i % users}", "merchant_id": f"m_{i % 50}"}
+        for i in range(n)
+    ]
+
+
+async def bench(fn, seconds: float) -> tuple:
+    await fn()  # warm-up (loads the script)
+    calls, t0 = 0, time.perf_counter()
+    while time.perf_counter() - t0 < seconds:
+        await fn()
+        calls += 1
+    return calls, time.perf_counter() - t0
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Velocity counter lookups served per Redis round-trip")
+    parser.add_argument("--redis", default=os.environ.get("BENCH_REDIS_URL", ""), help="Redis URL; fakeredis if empty")
+    parser.add_argument("--sizes", default="1,10,100,1000")
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.redis:
+        import redis.asyncio as redis
+
+        client = redis.from_url(args.redis, decode_responses=True)
+    else:
+        import fakeredis
+
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    counters = SharedVelocityCounters(client, local_ttl=0)
+
+    print(f"backend={'redis ' + args.redis if args.redis else 'fakeredis'}")
+    print(f"{'batch':>6} {'observe lookups/s':>18} {'read lookups/s':>15} {'ms/round-trip':>14}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        payloads = make_payloads(size, users=max(1, size // 2))
+        # Each row reads 3 dimensions x 3 windows
+        lookups = size * 3
+        calls, elapsed = await bench(lambda: counters.observe_batch(payloads), args.seconds)
+        observe = calls * lookups / elapsed
+        calls, elapsed = await bench(lambda: counters.read(payloads), args.seconds)
+        read = calls * lookups / elapsed
+        print(f"{size:>6} {observe:>18.0f} {read:>15.0f} {1000 * elapsed / calls:>14.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
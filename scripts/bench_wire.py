@@ -0,0 +1,57 @@
+import argparse
+import json
+import statistics
+import time
+
+from app.services import persistence, wire
+from bench_persistence import make_batch
+
+
+def rate(fn, items) -> float:
+    """Messages per second of one pass of fn over items."""
+    t0 = time.perf_counter()
+    for item in items:
+        fn(item)
+    return len(items) / (time.perf_counter() - t0)
+
+
+def consume_json(value: bytes) -> None:
+    # The previous consumer path: parse, then parse the ISO timestamp for the row
+    payload = json.loads(value)
+    persistence.parse_ts(payload.get("timestamp"))
+
+
+def consume_binary(value: bytes) -> None:
+    payload = wire.decode(value)
+    persistence.parse_ts(payload.get("timestamp"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode/decode throughput and size of the transaction wire formats")
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    payloads, _, _ = make_batch(args.messages)
+    encoded = {
+        "json": [json.dumps(p).encode() for p in payloads],
+        "binary": [wire.encode(p) for p in payloads],
+    }
+    encoders = {"json": lambda p: json.dumps(p).encode(), "binary": wire.encode}
+    consumers = {"json": consume_json, "binary": consume_binary}
+
+    # Formats take turns each round and the best round counts, which keeps noisy neighbours out of the numbers
+    rates = {(name, op): 0.0 for name in encoded for op in ("encode", "decode")}
+    for _ in range(args.rounds):
+        for name in encoded:
+            rates[name, "encode"] = max(rates[name, "encode"], rate(encoders[name], payloads))
+            rates[name, "decode"] = max(rates[name, "decode"], rate(consumers[name], encoded[name]))
+
+    print(f"{'format':>7} {'bytes/msg':>10} {'encode msg/s':>13} {'decode msg/s':>13}")
+    for name in encoded:
+        size = statistics.mean(len(v) for v in encoded[name])
+        print(f"{name:>7} {size:>10.1f} {rates[name, 'encode']:>13,.0f} {rates[name, 'decode']:>13,.0f}")
+
+
+if __name__ == "__main__":
+    main()
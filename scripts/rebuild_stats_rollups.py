@@ -0,0 +1,35 @@
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+
+from app.models import Base
+from app.models.db import engine
+from app.services import rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or verify the hourly stats_rollups table")
+    parser.add_argument("--since-days", type=float, default=None, help="Only buckets from this many days ago (default: all)")
+    parser.add_argument("--check", action="store_true", help="Compare rollups with transactions; exit 1 on drift")
+    args = parser.parse_args()
+
+    since = None
+    if args.since_days is not None:
+        since = datetime.now(timezone.utc) - timedelta(days=args.since_days)
+
+    Base.metadata.create_all(bind=engine)
+    if args.check:
+        with engine.connect() as conn:
+            drift = rollups.check(conn, since)
+        for bucket, rolled, raw in drift:
+            print(f"{bucket.isoformat()} rollup={rolled} raw={raw}")
+        print(f"{len(drift)} bucket(s) differ ({', '.join(rollups.COUNTERS)})")
+        sys.exit(1 if drift else 0)
+
+    with engine.begin() as conn:
+        written = rollups.rebuild(conn, since)
+    print(f"rebuilt {written} hourly bucket(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+# Point the model at the repo artifact unless the environment already provides one
+os.environ.setdefault(
+    "MODEL_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "app", "models", "artifacts", "iforest.pkl"),
+)
+
+
+@pytest.fixture
+def empty_db():
+    """
+    Delete transactions, reviews and rollups from the shared ./test.db, for
+    tests that assert absolute counts and must pass on every run. Imported
+    here so the test module's POSTGRES_DSN is already set.
+    """
+    from app.models import Base, Review, StatsRollup, Transaction
+    from app.models.db import engine
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for model in (Review, StatsRollup, Transaction):
+            conn.execute(model.__table__.delete())
+    yield
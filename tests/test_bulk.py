@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+from fastapi.testclient import TestClient
+
+# Disable Kafka for tests before importing app
+os.environ["ENABLE_KAFKA"] = "false"
+os.environ["POSTGRES_DSN"] = "sqlite:///./test.db"
+
+from app.main import app  # noqa: E402
+from app import kafka_producer  # noqa: E402
+from app.services.bulk import RowError, iter_rows  # noqa: E402
+
+
+client = TestClient(app)
+
+
+def _payload(i: int) -> dict:
+    return {
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": f"u_{i}",
+        "amount": 10.0 + i,
+        "currency": "USD",
+        "merchant_id": "m_1",
+        "merchant_category": "electronics",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "channel": "web",
+        "ip": "10.0.0.1",
+    }
+
+
+def _collect(body: bytes, chunk_size: int) -> list:
+    async def chunks():
+        for i in range(0, len(body), chunk_size):
+            yield body[i : i + chunk_size]
+
+    async def run():
+        return [row async for row in iter_rows(chunks())]
+
+    return asyncio.run(run())
+
+
+def test_iter_rows_json_array_across_chunk_boundaries():
+    body = json.dumps([{"a": 1, "s": "é,]"}, 12345, {"b": [1, 2]}]).encode()
+    for size in (1, 3, 7, len(body)):
+        assert _collect(body, size) == [(0, {"a": 1, "s": "é,]"}), (1, 12345), (2, {"b": [1, 2]})]
+
+
+def test_iter_rows_ndjson_reports_bad_lines_and_continues():
+    body = b'{"a": 1}\n\nnot json\n{"a": 2}'
+    rows = _collect(body, 4)
+    assert rows[0] == (0, {"a": 1})
+    assert isinstance(rows[1][1], RowError)
+    assert rows[2] == (2, {"a": 2})
+
+
+def test_iter_rows_truncated_array():
+    rows = _collect(b'[{"a": 1}, {"a": ', 5)
+    assert rows[0] == (0, {"a": 1})
+    assert isinstance(rows[-1][1], RowError)
+
+
+def test_bulk_ndjson_per_row_results(monkeypatch):
+    sent = []
+
+    async def fake_send_batch(topic, messages):
+        sent.append(len(messages))
+        return [True] * len(messages)
+
+    monkeypatch.setattr(kafka_producer, "send_batch", fake_send_batch)
+
+    good = [_payload(i) for i in range(3)]
+    bad = dict(_payload(9), amount="lots")
+    body = "\n".join(json.dumps(p) for p in [good[0], bad, good[1], good[2]])
+
+    r = client.post("/transactions/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code == 200
+    data = r.json()
+    assert data["accepted"] == 3 and data["rejected"] == 1
+    assert [row["index"] for row in data["results"]] == [0, 1, 2, 3]
+    assert data["results"][1]["accepted"] is False and "amount" in data["results"][1]["error"]
+    assert data["results"][2]["id"] == good[1]["transaction_id"]
+    assert sum(sent) == 3
+
+
+def test_bulk_json_array_kafka_down():
+    r = client.post("/transactions/bulk", json=[_payload(0), _payload(1)])
+    assert r.status_code == 200
+    data = r.json()
+    assert data["accepted"] == 0 and data["rejected"] == 2
+    assert data["results"][0]["error"] == "Kafka unavailable"
+
+
+def test_bulk_rows_the_wire_format_cannot_carry_are_rejected_alone(monkeypatch):
+    sent = []
+
+    async def fake_send_batch(topic, messages):
+        sent.extend(messages)
+        return [True] * len(messages)
+
+    monkeypatch.setattr(kafka_producer, "send_batch", fake_send_batch)
+
+    nul = dict(_payload(1), merchant_id="m\u00001")
+    huge = dict(_payload(2), ip="x" * 70_000)
+    r = client.post("/transactions/bulk", json=[_payload(0), nul, huge, _payload(3)])
+    assert r.status_code == 200
+    data = r.json()
+    assert data["accepted"] == 2 and data["rejected"] == 2
+    assert [row["accepted"] for row in data["results"]] == [True, False, False, True]
+    assert "NUL" in data["results"][1]["error"] and data["results"][2]["id"] == huge["transaction_id"]
+    assert len(sent) == 2
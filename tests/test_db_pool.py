@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+# Disable Kafka for tests before importing app
+os.environ["ENABLE_KAFKA"] = "false"
+os.environ["POSTGRES_DSN"] = "sqlite:///./test.db"
+
+import pytest  # noqa: E402
+from prometheus_client import REGISTRY  # noqa: E402
+from sqlalchemy import create_engine, exc  # noqa: E402
+
+from app.models import db  # noqa: E402
+
+
+def _sample(name: str, pool: str) -> float:
+    return REGISTRY.get_sample_value(name, {"pool": pool}) or 0.0
+
+
+def test_pool_metrics_count_waits_overflow_and_timeouts(tmp_path):
+    dsn = f"sqlite:///{tmp_path}/pool.db"
+    opts = db.pool_options(dsn, "test", size=1, overflow=1)
+    opts["pool_timeout"] = 0.05
+    eng = create_engine(dsn, **opts)
+    waits = _sample("fraud_db_pool_checkout_wait_seconds_count", "test")
+
+    first, second = eng.connect(), eng.connect()
+    assert _sample("fraud_db_pool_overflow_opened_total", "test") == 1
+    assert eng.pool.checkedout() == 2
+    with pytest.raises(exc.TimeoutError):
+        eng.connect()
+    assert _sample("fraud_db_pool_timeouts_total", "test") == 1
+    assert _sample("fraud_db_pool_checkout_wait_seconds_count", "test") == waits + 3
+    first.close()
+    second.close()
+
+    # dispose() recreates the pool from its class, which keeps the instrumentation
+    eng.dispose()
+    assert type(eng.pool).pool_name == "test"
+
+
+def test_liveness_probe_resets_a_broken_pool(monkeypatch):
+    assert asyncio.run(db.check_pools()) is True
+
+    broken = create_engine("sqlite:////nonexistent-dir/pool.db")
+    monkeypatch.setattr(db, "engine", broken)
+    failures = _sample("fraud_db_liveness_failures_total", "writer")
+    assert asyncio.run(db.check_pools()) is False
+    assert _sample("fraud_db_liveness_failures_total", "writer") == failures + 1
@@ -0,0 +1,64 @@
+from app.services.features import FEATURE_NAMES, VelocityStore
+
+
+def _tx(ts: float, amount: float, user: str = "u1", device: str = "d1", merchant: str = "m1") -> dict:
+    return {"timestamp": _iso(ts), "amount": amount, "user_id": user, "device_id": device, "merchant_id": merchant}
+
+
+def _iso(ts: float) -> str:
+    from datetime import datetime, timezone
+
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+T0 = 1_700_000_000.0
+
+
+def test_sliding_windows_count_and_sum():
+    store = VelocityStore(max_keys=10, max_events_per_key=100, compact_every=1000)
+    store.observe(_tx(T0, 10.0))
+    store.observe(_tx(T0 + 40, 20.0))
+    f = store.observe(_tx(T0 + 90, 5.0))
+
+    assert f["user_count_1m"] == 2 and f["user_sum_1m"] == 25.0
+    assert f["user_count_1h"] == 3 and f["user_sum_1h"] == 35.0
+
+    f = store.observe(_tx(T0 + 2 * 3600, 1.0))
+    assert (f["user_count_1m"], f["user_count_1h"], f["user_count_24h"]) == (1, 1, 4)
+    assert f["user_sum_24h"] == 36.0
+    assert set(f) == set(FEATURE_NAMES)
+
+
+def test_features_reads_without_recording():
+    store = VelocityStore(max_keys=10, max_events_per_key=100, compact_every=1000)
+    store.observe(_tx(T0, 10.0))
+
+    f = store.features(_tx(T0 + 1, 7.0))
+    assert f["user_count_1m"] == 2 and f["user_sum_1m"] == 17.0
+    assert store.features(_tx(T0 + 1, 7.0))["user_count_1m"] == 2
+    assert store.features(_tx(T0 + 1, 7.0, user="new"))["user_count_1h"] == 1
+
+
+def test_per_key_cap_and_lru_eviction():
+    store = VelocityStore(max_keys=2, max_events_per_key=3, compact_every=1000)
+    for i in range(5):
+        f = store.observe(_tx(T0 + i, 1.0))
+    assert f["user_count_1m"] == 3 and f["user_sum_1m"] == 3.0
+
+    store.observe(_tx(T0 + 10, 1.0, user="u2", device="d2", merchant="m2"))
+    store.observe(_tx(T0 + 11, 1.0, user="u3", device="d3", merchant="m3"))
+    # u1 was least recently used and got evicted
+    assert store.features(_tx(T0 + 12, 1.0))["user_count_1m"] == 1
+
+
+def test_compaction_drops_idle_keys_and_late_events_are_clamped():
+    store = VelocityStore(max_keys=100, max_events_per_key=10_000, compact_every=10**9)
+    store.observe(_tx(T0, 1.0, user="old", device="d-old", merchant="m-old"))
+    for i in range(200):
+        store.observe(_tx(T0 + 90_000 + i, 2.0))
+    # An out-of-order event counts as happening at the key's latest time
+    f = store.observe(_tx(T0 + 50, 4.0))
+    assert f["user_count_1m"] == 61 and f["user_sum_1m"] == 124.0
+
+    assert store.compact() == 3
+    assert store.features(_tx(T0 + 90_300, 1.0, user="old"))["user_count_24h"] == 1
@@ -0,0 +1,205 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# Disable Kafka for tests before importing app
+os.environ["ENABLE_KAFKA"] = "false"
+os.environ["POSTGRES_DSN"] = "sqlite:///./test.db"
+
+import fakeredis  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.dialects import sqlite  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.models import Base, Transaction, TransactionStatus  # noqa: E402
+from app.models.db import AsyncSessionLocal, SessionLocal, engine  # noqa: E402
+from app.schemas.transaction import TransactionListItem  # noqa: E402
+from app.services import flagged, persistence, rollups  # noqa: E402
+from app.services.auth import create_access_token  # noqa: E402
+from app.services.cache import RedisCache  # noqa: E402
+
+
+client = TestClient(app)
+
+
+def _headers() -> dict:
+    return {"Authorization": f"Bearer {create_access_token('tester')}"}
+
+
+def test_keyset_pages_cover_queue_once(empty_db):
+    # These rows are the whole queue; pairs share a timestamp
+    base = datetime(2100, 1, 1, tzinfo=timezone.utc)
+    payloads = [
+        {
+            "transaction_id": f"kp-{uuid.uuid4()}",
+            "user_id": "u1",
+            "amount": 1.0,
+            "timestamp": (base - timedelta(minutes=i // 2)).isoformat(),
+        }
+        for i in range(7)
+    ]
+    ids = [p["transaction_id"] for p in payloads]
+    persistence.persist_scored(payloads, [-0.5] * 7, [True] * 7)
+    assert client.post(f"/fraud/review/{ids[3]}", json={"decision": "REJECTED"}, headers=_headers()).status_code == 200
+
+    seen, cursor, pages = [], None, 0
+    while pages == 0 or cursor:
+        pages += 1
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get("/fraud/flagged", params=params, headers=_headers())
+        assert r.status_code == 200
+        for item in r.json():
+            # Encoded without the response model, but in exactly its shape
+            assert list(item) == list(TransactionListItem.model_fields)
+            TransactionListItem.model_validate(item)
+        seen.extend(item["id"] for item in r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+    assert pages == 3
+    assert sorted(seen) == sorted(ids) and len(seen) == len(set(seen))
+
+    r = client.get("/fraud/flagged", params={"limit": 200, "status": "REJECTED"}, headers=_headers())
+    assert ids[3] in [item["id"] for item in r.json()]
+
+    assert client.get("/fraud/flagged", params={"cursor": "not-a-cursor"}, headers=_headers()).status_code == 400
+
+
+def _plan(status, cursor) -> str:
+    q = flagged.flagged_query(51, status, cursor)
+    sql = str(q.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        return " | ".join(row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql)))
+
+
+def test_flagged_query_plan_uses_partial_index():
+    Base.metadata.create_all(bind=engine)
+    cursor = flagged.encode_cursor(datetime(2024, 1, 1, 12, 0), "some-id")
+    for status, index in ((None, "ix_flagged_ts_id"), (TransactionStatus.PENDING_REVIEW, "ix_flagged_status_ts_id")):
+        for c in (None, cursor):
+            plan = _plan(status, c)
+            # Walks the partial index in order: no sort step, deep pages seek instead of skipping
+            assert index in plan, plan
+            assert "TEMP B-TREE" not in plan, plan
+
+
+def _redis_queue(payloads, scores) -> RedisCache:
+    cache = RedisCache("redis://unused:6379/0")
+    cache.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    rows = persistence.build_rows(payloads, scores, [True] * len(payloads))
+    asyncio.run(cache.push_flagged_many([(r["id"], flagged.cache_entry(r)) for r in rows]))
+    return cache
+
+
+def _pages(cache, limit, status=None, count=3):
+    async def run():
+        out, cursor = [], None
+        async with AsyncSessionLocal() as db:
+            for _ in range(count):
+                items, cursor, source = await flagged.flagged_page(db, limit, status, cursor, cache=cache)
+                out.append(([i["id"] for i in items], source))
+        return out
+
+    return asyncio.run(run())
+
+
+def test_redis_queue_serves_head_then_hands_over_to_postgres():
+    Base.metadata.create_all(bind=engine)
+    # Newer than every other test row, so these five are the head of the queue
+    base = datetime(2200, 1, 1, tzinfo=timezone.utc)
+    payloads = [
+        {
+            "transaction_id": f"rq-{i}",
+            "user_id": "u1",
+            "amount": 2.0,
+            "timestamp": (base - timedelta(minutes=i // 2)).isoformat(),
+        }
+        for i in range(5)
+    ]
+    persistence.persist_scored(payloads, [-0.5] * 5, [True] * 5)
+    cache = _redis_queue(payloads, [-0.5] * 5)
+
+    pages = _pages(cache, 2)
+    assert [source for _, source in pages] == ["redis", "redis", "db"]
+    # Same order as Postgres, ties broken by id, and the cursor carries over between the two
+    assert [i for ids, _ in pages for i in ids][:5] == ["rq-1", "rq-0", "rq-3", "rq-2", "rq-4"]
+    with SessionLocal() as db:
+        rows, _ = flagged.query_flagged(db, 5)
+    assert [t.id for t in rows] == ["rq-1", "rq-0", "rq-3", "rq-2", "rq-4"]
+
+    # A reviewed row moves to its status set; the pending set no longer has it
+    asyncio.run(flagged.set_cached_status("rq-3", TransactionStatus.REJECTED, cache=cache))
+    pending = _pages(cache, 2, TransactionStatus.PENDING_REVIEW, count=1)
+    assert pending == [(["rq-1", "rq-0"], "redis")]
+    assert asyncio.run(cache.get_entries(["rq-3"]))[0]["status"] == "REJECTED"
+    assert asyncio.run(cache.client.ttl("tx:rq-3")) > 0
+
+    # An expired entry sends the page to Postgres
+    asyncio.run(cache.client.delete("tx:rq-0"))
+    assert _pages(cache, 2, count=1)[0][1] == "db"
+
+
+def test_lost_review_update_is_repaired_once_redis_answers(empty_db, monkeypatch):
+    base = datetime(2200, 1, 1, tzinfo=timezone.utc)
+    payloads = [
+        {
+            "transaction_id": f"lr-{i}",
+            "user_id": "u1",
+            "amount": 2.0,
+            "timestamp": (base - timedelta(minutes=i)).isoformat(),
+        }
+        for i in range(3)
+    ]
+    persistence.persist_scored(payloads, [-0.5] * 3, [True] * 3)
+    cache = _redis_queue(payloads, [-0.5] * 3)
+
+    # The review commits in Postgres, then its Redis write fails
+    with SessionLocal() as db:
+        t = db.get(Transaction, "lr-1")
+        rollups.apply_deltas(db.connection(), rollups.status_delta(t, t.status, TransactionStatus.REJECTED))
+        t.status = TransactionStatus.REJECTED
+        db.commit()
+
+    async def broken(tx_id, status):
+        raise ConnectionError("Redis went away")
+
+    with monkeypatch.context() as m:
+        m.setattr(cache, "set_flagged_status", broken)
+        asyncio.run(flagged.set_cached_status("lr-1", TransactionStatus.REJECTED, cache=cache))
+    assert cache.lost_reviews == {"lr-1"}
+    assert asyncio.run(cache.get_entries(["lr-1"]))[0]["status"] == "PENDING_REVIEW"
+
+    # Backing off: pages come from Postgres, and the stale flag keeps other replicas there too
+    assert _pages(cache, 5, count=1)[0][1] == "db"
+    assert asyncio.run(cache.flagged_stale())
+
+    # Once Redis answers, the next read rebuilds the queue with the reviewed status
+    cache.mark_down(0)
+    assert _pages(cache, 2, count=1) == [(["lr-0", "lr-1"], "redis")]
+    assert asyncio.run(cache.client.zrange(cache.status_key("REJECTED"), 0, -1)) == ["lr-1"]
+    assert _pages(cache, 1, TransactionStatus.PENDING_REVIEW, count=1) == [(["lr-0"], "redis")]
+    assert asyncio.run(cache.get_entries(["lr-1"]))[0]["status"] == "REJECTED"
+    assert cache.lost_reviews == set() and not asyncio.run(cache.flagged_stale())
+
+
+def test_detail_is_cached_until_reviewed():
+    Base.metadata.create_all(bind=engine)
+    tx_id = f"dc-{uuid.uuid4()}"
+    payload = {"transaction_id": tx_id, "user_id": "u1", "amount": 3.5, "timestamp": "2024-05-01T10:00:00+02:00"}
+    persistence.persist_scored([payload], [-0.5], [True])
+
+    first = client.get(f"/fraud/tx/{tx_id}", headers=_headers())
+    assert first.status_code == 200 and first.headers["X-Cache"] == "miss"
+    body = first.json()
+    assert body["amount"] == 3.5 and body["status"] == "PENDING_REVIEW" and body["is_fraud"] is True
+    assert datetime.fromisoformat(body["timestamp"]) == datetime(2024, 5, 1, 8, tzinfo=timezone.utc)
+    second = client.get(f"/fraud/tx/{tx_id}", headers=_headers())
+    assert second.headers["X-Cache"] == "local" and second.json() == body
+
+    assert client.post(f"/fraud/review/{tx_id}", json={"decision": "APPROVED"}, headers=_headers()).status_code == 200
+    after = client.get(f"/fraud/tx/{tx_id}", headers=_headers())
+    assert after.headers["X-Cache"] == "miss" and after.json()["status"] == "APPROVED"
+
+    assert client.get("/fraud/tx/does-not-exist", headers=_headers()).status_code == 404
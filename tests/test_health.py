@@ -15,3 +15,47 @@ def test_health_ok():
     r = client.get("/health")
     assert r.status_code == 200
     assert r.json() == {"status": "ok"}
+
+
+def test_metrics_exposes_route_latency():
+    client.get("/health")
+    client.get("/no-such-path")
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    body = r.text
+    assert 'fraud_http_request_duration_seconds_count{method="GET",route="/health",status="2xx"}' in body
+    assert 'route="unmatched",status="4xx"' in body
+    assert "fraud_rules_eval_seconds" in body and "fraud_redis_seconds" in body
+
+
+def test_ready_reports_each_dependency(monkeypatch):
+    import fakeredis
+
+    from app.services.cache import get_cache
+    from app.services.inference import FraudModel
+
+    monkeypatch.setattr(FraudModel, "_instance", object())
+    monkeypatch.setattr(get_cache(), "client", fakeredis.FakeAsyncRedis())
+    r = client.get("/ready")
+    assert r.status_code == 200
+    assert r.json() == {
+        "status": "ready",
+        "checks": {"model": "ok", "db": "ok", "redis": "ok", "kafka": "disabled"},
+    }
+
+    class DownRedis:
+        async def ping(self):
+            raise ConnectionError("redis down")
+
+    # Redis is optional: the instance stays in rotation
+    monkeypatch.setattr(get_cache(), "client", DownRedis())
+    r = client.get("/ready")
+    assert r.status_code == 200
+    assert r.json()["status"] == "degraded" and r.json()["checks"]["redis"] == "fail"
+
+    # The model is not: 503 until it has loaded
+    monkeypatch.setattr(FraudModel, "_instance", None)
+    r = client.get("/ready")
+    assert r.status_code == 503
+    assert r.json()["status"] == "not_ready" and r.json()["checks"]["model"] == "loading"
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+
+from app.services.inference import FraudModel
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "app", "models", "artifacts", "iforest.pkl")
+
+
+def test_predict_batch_matches_single_row():
+    model = FraudModel(MODEL_PATH)
+    payloads = [{"amount": a} for a in (5.0, 50.0, 75.0, 250.0, 10_000.0)]
+
+    scores, flags = model.predict_batch(payloads)
+
+    assert scores.shape == (5,)
+    assert flags.dtype == bool
+    for payload, s, f in zip(payloads, scores, flags):
+        single_score, single_flag = model.predict_from_transaction(payload)
+        assert np.isclose(s, single_score)
+        assert bool(f) == single_flag
+
+
+def test_featurize_is_contiguous_float_matrix():
+    model = FraudModel(MODEL_PATH)
+    X = model.featurize([{"amount": "12.5"}, {}])
+
+    assert X.flags["C_CONTIGUOUS"]
+    assert X.dtype == np.float64
+    assert X.tolist() == [[12.5], [0.0]]
+
+
+def test_predict_batch_empty():
+    scores, flags = FraudModel(MODEL_PATH).predict_batch([])
+    assert scores.shape == (0,) and flags.shape == (0,)
+
+
+def test_compiled_backend_matches_sklearn():
+    compiled = FraudModel(MODEL_PATH, backend="compiled")
+    reference = FraudModel(MODEL_PATH, backend="sklearn")
+    assert compiled.backend == "compiled" and reference.backend == "sklearn"
+
+    X = np.random.default_rng(0).normal(60.0, 80.0, size=(2000, 1))
+    np.testing.assert_allclose(compiled.score_batch(X), reference.model.decision_function(X), atol=1e-9)
+
+
+def test_compiled_forest_handles_feature_subsampling():
+    from sklearn.ensemble import IsolationForest
+    from app.services.iforest_compiled import CompiledIsolationForest
+
+    rng = np.random.default_rng(1)
+    model = IsolationForest(n_estimators=25, max_features=0.5, random_state=0).fit(rng.normal(size=(300, 4)))
+    X = rng.normal(scale=2.0, size=(200, 4))
+
+    compiled = CompiledIsolationForest.from_sklearn(model)
+    np.testing.assert_allclose(compiled.decision_function(X), model.decision_function(X), atol=1e-9)
+
+
+def test_compile_failure_falls_back_to_sklearn(monkeypatch):
+    from app.services import inference
+
+    def boom(model):
+        raise TypeError("not an IsolationForest")
+
+    monkeypatch.setattr(inference.CompiledIsolationForest, "from_sklearn", staticmethod(boom))
+    model = FraudModel(MODEL_PATH, backend="compiled")
+    assert model.backend == "sklearn"
+    assert model.predict_batch([{"amount": 50.0}])[0].shape == (1,)
+
+
+def test_instance_is_loaded_once_under_concurrent_first_use(monkeypatch):
+    import threading
+    import time
+
+    loads = []
+
+    def slow_init(self, model_path, backend=None):
+        loads.append(model_path)
+        time.sleep(0.05)
+
+    monkeypatch.setattr(FraudModel, "_instance", None)
+    monkeypatch.setattr(FraudModel, "__init__", slow_init)
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(FraudModel.instance())) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(loads) == 1
+    assert all(m is got[0] for m in got)
@@ -0,0 +1,407 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timezone
+
+# Disable Kafka for tests before importing app
+os.environ["ENABLE_KAFKA"] = "false"
+os.environ["POSTGRES_DSN"] = "sqlite:///./test.db"
+
+import fakeredis  # noqa: E402
+import pytest  # noqa: E402
+from aiokafka.structs import ConsumerRecord, TopicPartition  # noqa: E402
+from prometheus_client import REGISTRY  # noqa: E402
+
+from app.kafka_consumer import KafkaConsumerService  # noqa: E402
+from app.models import Base, Review, ReviewDecision, Transaction, TransactionStatus  # noqa: E402
+from app.models.db import AsyncSessionLocal, SessionLocal, engine  # noqa: E402
+from app.services import flagged, persistence, rollups, rules, wire  # noqa: E402
+from app.services.cache import RedisCache  # noqa: E402
+from app.services.decision import Decision  # noqa: E402
+from app.services.features import get_velocity_store  # noqa: E402
+from app.services.inference import FraudModel  # noqa: E402
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "app", "models", "artifacts", "iforest.pkl")
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.commits = 0
+        self.committed = {}
+        self.seeks = {}
+
+    async def commit(self, offsets=None):
+        self.commits += 1
+        self.committed.update(offsets or {})
+
+    def seek(self, tp, offset):
+        self.seeks[tp] = offset
+
+    def highwater(self, tp):
+        return 10
+
+
+def _record(offset: int, value: bytes, headers=()) -> ConsumerRecord:
+    return ConsumerRecord(
+        topic="transactions", partition=0, offset=offset, timestamp=0, timestamp_type=0,
+        key=None, value=value, checksum=None, serialized_key_size=0,
+        serialized_value_size=len(value), headers=headers,
+    )
+
+
+def _payload(amount: float, category: str = "grocery") -> dict:
+    return {
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "amount": amount,
+        "currency": "USD",
+        "merchant_id": "m_1",
+        "merchant_category": category,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "channel": "web",
+        "ip": "10.0.0.1",
+        "geo": {"lat": 1.0, "lon": 2.0},
+        "device_id": "dev1",
+    }
+
+
+def test_process_batch_persists_and_commits(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    svc = KafkaConsumerService()
+    svc.consumer = FakeConsumer()
+
+    pushed = []
+
+    class FakeCache:
+        async def push_flagged_many(self, items, cleared=()):
+            pushed.extend(items)
+
+        async def flagged_stale(self):
+            return False
+
+    monkeypatch.setattr("app.kafka_consumer.get_cache", lambda: FakeCache())
+
+    clean, outlier = _payload(50.0), _payload(5000.0, "crypto")
+    batch = [
+        _record(0, json.dumps(clean).encode()),
+        _record(1, b"not json"),
+        _record(2, json.dumps(outlier).encode()),
+    ]
+    asyncio.run(svc._process_batch(batch, FraudModel(MODEL_PATH)))
+
+    assert svc.consumer.commits == 1
+    assert svc.consumer.committed == {TopicPartition("transactions", 0): 3}
+    assert svc.throughput.total_messages == 3
+    assert [tx_id for tx_id, _ in pushed] == [outlier["transaction_id"]]
+    # High watermark 10, last processed offset 2
+    assert REGISTRY.get_sample_value("fraud_kafka_consumer_lag", {"partition": "0"}) == 7
+
+    with SessionLocal() as db:
+        rows = {
+            t.id: t
+            for t in db.query(Transaction).filter(
+                Transaction.id.in_([clean["transaction_id"], outlier["transaction_id"]])
+            )
+        }
+    assert rows[clean["transaction_id"]].status == TransactionStatus.APPROVED
+    assert rows[outlier["transaction_id"]].is_fraud is True
+    assert rows[outlier["transaction_id"]].status == TransactionStatus.PENDING_REVIEW
+
+
+class NullCache:
+    async def push_flagged_many(self, items, cleared=()):
+        pass
+
+    async def flagged_stale(self):
+        return False
+
+
+def test_edge_decision_is_reused_when_versions_match(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    svc = KafkaConsumerService()
+    svc.consumer = FakeConsumer()
+    monkeypatch.setattr("app.kafka_consumer.get_cache", lambda: NullCache())
+    model = FraudModel(MODEL_PATH)
+    version = rules.get_ruleset().version
+
+    # A verdict only the edge could have produced, then one from another model build
+    trusted, stale = _payload(50.0), _payload(50.0)
+    edge = Decision(-0.5, True, 0, model.version, version)
+    old = Decision(-0.5, True, 0, "old-model", version)
+    batch = [
+        _record(0, json.dumps(trusted).encode(), tuple(edge.headers())),
+        _record(1, json.dumps(stale).encode(), tuple(old.headers())),
+    ]
+
+    def count(source):
+        return REGISTRY.get_sample_value("fraud_consumer_decisions_total", {"source": source}) or 0.0
+
+    reused, rescored = count("edge"), count("rescored")
+    asyncio.run(svc._process_batch(batch, model))
+    assert count("edge") == reused + 1 and count("rescored") == rescored + 1
+
+    with SessionLocal() as db:
+        ids = [trusted["transaction_id"], stale["transaction_id"]]
+        rows = {t.id: t for t in db.query(Transaction).filter(Transaction.id.in_(ids))}
+    assert rows[trusted["transaction_id"]].is_fraud is True
+    assert float(rows[trusted["transaction_id"]].score) == -0.5
+    assert rows[stale["transaction_id"]].is_fraud is False
+
+
+def test_edge_decision_from_local_velocity_is_rescored(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    svc = KafkaConsumerService()
+    svc.consumer = FakeConsumer()
+    monkeypatch.setattr("app.kafka_consumer.get_cache", lambda: NullCache())
+    model = FraudModel(MODEL_PATH)
+    version = rules.get_ruleset().version
+
+    # An API replica's own store misses traffic other processes observed; the shared counters do not
+    local, shared = _payload(50.0), _payload(50.0)
+    batch = [
+        _record(i, json.dumps(p).encode(), tuple(Decision(-0.5, True, 0, model.version, version, source).headers()))
+        for i, (p, source) in enumerate(((local, "local"), (shared, "shared")))
+    ]
+
+    def count(source):
+        return REGISTRY.get_sample_value("fraud_consumer_decisions_total", {"source": source}) or 0.0
+
+    reused, rescored = count("edge"), count("rescored")
+    asyncio.run(svc._process_batch(batch, model))
+    assert count("edge") == reused + 1 and count("rescored") == rescored + 1
+
+    with SessionLocal() as db:
+        ids = [local["transaction_id"], shared["transaction_id"]]
+        rows = {t.id: t for t in db.query(Transaction).filter(Transaction.id.in_(ids))}
+    assert rows[local["transaction_id"]].is_fraud is False
+    assert rows[shared["transaction_id"]].is_fraud is True
+
+
+def test_binary_and_legacy_json_records_are_both_consumed(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    svc = KafkaConsumerService()
+    svc.consumer = FakeConsumer()
+    monkeypatch.setattr("app.kafka_consumer.get_cache", lambda: NullCache())
+
+    binary, legacy = _payload(50.0), _payload(60.0)
+    batch = [_record(0, wire.encode(binary)), _record(1, json.dumps(legacy).encode())]
+    asyncio.run(svc._process_batch(batch, FraudModel(MODEL_PATH)))
+
+    with SessionLocal() as db:
+        ids = [binary["transaction_id"], legacy["transaction_id"]]
+        rows = {t.id: t for t in db.query(Transaction).filter(Transaction.id.in_(ids))}
+    assert float(rows[binary["transaction_id"]].amount) == 50.0
+    assert rows[binary["transaction_id"]].device_id == "dev1"
+    assert rows[binary["transaction_id"]].timestamp.replace(tzinfo=None) == datetime.fromisoformat(
+        binary["timestamp"]
+    ).astimezone(timezone.utc).replace(tzinfo=None)
+    assert float(rows[legacy["transaction_id"]].amount) == 60.0
+
+
+class FakeProducer:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.sent = []
+
+    async def send(self, topic, key=None, value=None, headers=None):
+        future = asyncio.get_running_loop().create_future()
+        if self.fail:
+            future.set_exception(RuntimeError("broker down"))
+        else:
+            self.sent.append((topic, value, dict(headers)))
+            future.set_result(None)
+        return future
+
+
+def test_poison_messages_are_dead_lettered_before_commit(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    svc = KafkaConsumerService()
+    svc.consumer = FakeConsumer()
+    svc.dead_letters = FakeProducer()
+    monkeypatch.setattr("app.kafka_consumer.get_cache", lambda: NullCache())
+
+    good = _payload(50.0)
+    no_user = dict(_payload(50.0), user_id=None)
+    batch = [
+        _record(4, wire.encode(good)),
+        _record(5, b"\xfa\x01truncated"),
+        _record(6, json.dumps(no_user).encode()),
+    ]
+    asyncio.run(svc._process_batch(batch, FraudModel(MODEL_PATH)))
+
+    assert [(topic, value) for topic, value, _ in svc.dead_letters.sent] == [
+        ("transactions.dlq", batch[1].value),
+        ("transactions.dlq", batch[2].value),
+    ]
+    headers = svc.dead_letters.sent[1][2]
+    assert headers["x-original-offset"] == b"6" and headers["x-error"] == b"missing user_id"
+    assert svc.consumer.committed == {TopicPartition("transactions", 0): 7}
+    with SessionLocal() as db:
+        assert db.get(Transaction, good["transaction_id"]) is not None
+        assert db.get(Transaction, no_user["transaction_id"]) is None
+
+
+def test_failed_dead_letter_leaves_batch_uncommitted(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    svc = KafkaConsumerService()
+    svc.consumer = FakeConsumer()
+    svc.dead_letters = FakeProducer(fail=True)
+    monkeypatch.setattr("app.kafka_consumer.get_cache", lambda: NullCache())
+
+    good = _payload(50.0)
+    batch = [_record(0, json.dumps(good).encode()), _record(1, b"[]")]
+    with pytest.raises(RuntimeError):
+        asyncio.run(svc._process_batch(batch, FraudModel(MODEL_PATH)))
+    # The run loop rewinds and the persisted row is rewritten idempotently on redelivery
+    assert svc.consumer.commits == 0
+    asyncio.run(svc._process_batch(batch[:1], FraudModel(MODEL_PATH)))
+    assert svc.consumer.committed == {TopicPartition("transactions", 0): 1}
+
+
+def _decided(offset: int, payload: dict, fraud: bool, model: FraudModel) -> ConsumerRecord:
+    """A record carrying a current edge verdict, so the test decides what is flagged."""
+    decision = Decision(-0.5, fraud, 0, model.version, rules.get_ruleset().version)
+    return _record(offset, json.dumps(payload).encode(), tuple(decision.headers()))
+
+
+def _fake_redis_cache() -> RedisCache:
+    cache = RedisCache("redis://unused:6379/0")
+    cache.client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return cache
+
+
+def test_replay_keeps_reviews_and_clears_rescored_rows_in_redis(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    svc = KafkaConsumerService()
+    svc.consumer = FakeConsumer()
+    cache = _fake_redis_cache()
+    monkeypatch.setattr("app.kafka_consumer.get_cache", lambda: cache)
+    model = FraudModel(MODEL_PATH)
+
+    def record(offset, payload, fraud):
+        return _decided(offset, payload, fraud, model)
+
+    reviewed, rescored = _payload(50.0), _payload(60.0)
+    ids = [reviewed["transaction_id"], rescored["transaction_id"]]
+    asyncio.run(svc._process_batch([record(0, reviewed, True), record(1, rescored, True)], model))
+
+    # What POST /fraud/review does
+    with SessionLocal() as db:
+        t = db.get(Transaction, ids[0])
+        rollups.apply_deltas(db.connection(), rollups.status_delta(t, t.status, TransactionStatus.REJECTED))
+        t.status = TransactionStatus.REJECTED
+        db.add(Review(transaction_id=ids[0], reviewer="tester", decision=ReviewDecision.REJECTED))
+        db.commit()
+    asyncio.run(flagged.set_cached_status(ids[0], TransactionStatus.REJECTED, cache=cache))
+
+    # Replay from earliest; the second row now scores clean
+    asyncio.run(svc._process_batch([record(0, reviewed, True), record(1, rescored, False)], model))
+
+    async def state():
+        pending = await cache.client.zrange(cache.status_key("PENDING_REVIEW"), 0, -1)
+        rejected = await cache.client.zrange(cache.status_key("REJECTED"), 0, -1)
+        queue = await cache.client.zrange(cache.KEY_FLAGGED, 0, -1)
+        return pending, rejected, queue, await cache.get_entries(ids)
+
+    pending, rejected, queue, (entry, gone) = asyncio.run(state())
+    assert ids[0] in rejected and ids[0] not in pending and entry["status"] == "REJECTED"
+    assert ids[1] not in queue and ids[1] not in pending and gone is None
+    with SessionLocal() as db:
+        assert db.get(Transaction, ids[0]).status == TransactionStatus.REJECTED
+        assert db.get(Transaction, ids[1]).is_fraud is False
+
+    # A pending entry pushed after the review reached Redis does not undo it either
+    stale = dict(entry, status="PENDING_REVIEW")
+    asyncio.run(cache.push_flagged_many([(ids[0], stale)]))
+    pending, rejected, _, (entry, _) = asyncio.run(state())
+    assert entry["status"] == "REJECTED" and ids[0] in rejected and ids[0] not in pending
+
+
+def test_lost_push_sends_readers_to_postgres_until_rebuilt(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    svc = KafkaConsumerService()
+    svc.consumer = FakeConsumer()
+    cache = _fake_redis_cache()
+    monkeypatch.setattr("app.kafka_consumer.get_cache", lambda: cache)
+    model = FraudModel(MODEL_PATH)
+    lost, later = _payload(50.0), _payload(60.0)
+
+    async def down(items, cleared=()):
+        raise ConnectionError("Redis is down")
+
+    monkeypatch.setattr(cache, "push_flagged_many", down)
+    asyncio.run(svc._process_batch([_decided(0, lost, True, model)], model))
+    assert svc._flagged_dirty is True
+    monkeypatch.delattr(cache, "push_flagged_many")
+
+    async def page():
+        async with AsyncSessionLocal() as db:
+            items, _, source = await flagged.flagged_page(db, 1, cache=cache)
+        members = await cache.client.zrange(cache.KEY_FLAGGED, 0, -1)
+        return source, lost["transaction_id"] in members
+
+    # Marked stale first thing once Redis is back: readers get Postgres, not a queue with a hole
+    asyncio.run(cache.mark_flagged_stale())
+    assert asyncio.run(page()) == ("db", False)
+
+    asyncio.run(svc._process_batch([_decided(1, later, True, model)], model))
+    assert svc._flagged_dirty is False
+    assert asyncio.run(page()) == ("redis", True)
+    assert not asyncio.run(cache.flagged_stale())
+
+
+def test_rebalance_waits_for_batch_and_drops_revoked_records():
+    async def run():
+        svc = KafkaConsumerService()
+        svc.consumer = FakeConsumer()
+        svc.consumer.assignment = lambda: {TopicPartition("transactions", 0)}
+
+        # A batch is being processed: revocation waits until it has committed
+        await svc._batch_lock.acquire()
+        revoke = asyncio.create_task(svc.release_partitions([TopicPartition("transactions", 1)]))
+        await asyncio.sleep(0.01)
+        assert not revoke.done()
+        svc._batch_lock.release()
+        await asyncio.wait_for(revoke, 1)
+
+        # Records fetched for a partition that has since moved are left to its new owner
+        other = ConsumerRecord(
+            topic="transactions", partition=1, offset=0, timestamp=0, timestamp_type=0,
+            key=None, value=b"{}", checksum=None, serialized_key_size=0, serialized_value_size=2, headers=(),
+        )
+        kept = svc._owned([_record(0, b"{}"), other])
+        assert [(m.partition, m.offset) for m in kept] == [(0, 0)]
+
+    asyncio.run(run())
+
+
+def test_rewound_batch_does_not_count_velocity_twice(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    svc = KafkaConsumerService()
+    svc.consumer = FakeConsumer()
+    monkeypatch.setattr("app.kafka_consumer.get_cache", lambda: NullCache())
+    model = FraudModel(MODEL_PATH)
+    store = get_velocity_store()
+
+    first = _payload(10.0)
+    second = dict(_payload(20.0), user_id=first["user_id"])
+    batch = [_record(0, json.dumps(first).encode()), _record(1, json.dumps(second).encode())]
+    seen = []
+    real_persist = persistence.persist_batch
+
+    def flaky_persist(payloads, scores, is_fraud, bind=None):
+        seen.append(store.features(first)["user_count_1h"])
+        if len(seen) == 1:
+            raise RuntimeError("database went away")
+        return real_persist(payloads, scores, is_fraud, bind=bind)
+
+    monkeypatch.setattr(persistence, "persist_batch", flaky_persist)
+    with pytest.raises(RuntimeError):
+        asyncio.run(svc._process_batch(batch, model))
+    assert svc.consumer.commits == 0
+    # Redelivered after the rewind: the user's window still holds two transactions (features add the probe)
+    asyncio.run(svc._process_batch(batch, model))
+    assert seen == [3, 3]
+    assert svc.consumer.committed == {TopicPartition("transactions", 0): 2}
+    assert svc._observed == {}
@@ -0,0 +1,135 @@
+import asyncio
+
+from app import kafka_producer
+from app.config import get_settings
+from app.services import metrics
+
+
+class FakeProducer:
+    """Returns a pending future per send; the test resolves them to simulate broker acks."""
+
+    def __init__(self, fail_keys=()):
+        self.sent = []
+        self.fail_keys = set(fail_keys)
+        self.pending = []
+
+    async def send(self, topic, value=None, key=None, headers=None):
+        fut = asyncio.get_running_loop().create_future()
+        self.sent.append((topic, key))
+        if topic == "tx" and key in self.fail_keys:
+            fut.set_exception(RuntimeError("broker down"))
+        else:
+            self.pending.append(fut)
+        return fut
+
+    async def send_and_wait(self, topic, value=None, key=None, headers=None):
+        fut = await self.send(topic, value=value, key=key, headers=headers)
+        if not fut.done():
+            fut.set_result(None)
+        return await fut
+
+
+def _setup(monkeypatch, producer, window):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "KAFKA_PRODUCE_MODE", "async")
+    monkeypatch.setattr(settings, "KAFKA_IN_FLIGHT_TIMEOUT_MS", 20)
+    monkeypatch.setattr(kafka_producer, "_producer", producer)
+    monkeypatch.setattr(kafka_producer, "_window", asyncio.Semaphore(window))
+    monkeypatch.setattr(kafka_producer, "_in_flight", 0)
+
+
+def test_async_send_returns_before_ack_and_applies_backpressure(monkeypatch):
+    async def run():
+        producer = FakeProducer()
+        _setup(monkeypatch, producer, window=1)
+        rejected = metrics.KAFKA_PRODUCE_REJECTED._value.get()
+
+        assert await kafka_producer.send_transaction("tx", b"k1", b"v1") is True
+        assert kafka_producer.in_flight() == 1
+        # Window is full until the broker acks the first message
+        assert await kafka_producer.send_transaction("tx", b"k2", b"v2") is False
+        assert metrics.KAFKA_PRODUCE_REJECTED._value.get() == rejected + 1
+
+        producer.pending[0].set_result(None)
+        await asyncio.sleep(0)
+        assert kafka_producer.in_flight() == 0
+        assert await kafka_producer.send_transaction("tx", b"k3", b"v3") is True
+
+    asyncio.run(run())
+
+
+def test_failed_delivery_is_dead_lettered_without_reordering(monkeypatch):
+    async def run():
+        producer = FakeProducer(fail_keys={b"u1"})
+        _setup(monkeypatch, producer, window=4)
+        dead = metrics.KAFKA_PRODUCE_DEAD_LETTERED._value.get()
+
+        assert await kafka_producer.send_transaction("tx", b"u1", b"first") is True
+        assert await kafka_producer.send_transaction("tx", b"u2", b"second") is True
+        for fut in producer.pending:
+            if not fut.done():
+                fut.set_result(None)
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if kafka_producer.in_flight() == 0:
+                break
+
+        # The client retried in order; the app never re-sends behind later messages for the same partition
+        assert [key for topic, key in producer.sent if topic == "tx"] == [b"u1", b"u2"]
+        assert (get_settings().KAFKA_DEAD_LETTER_TOPIC, b"u1") in producer.sent
+        assert metrics.KAFKA_PRODUCE_DEAD_LETTERED._value.get() == dead + 1
+        assert kafka_producer.in_flight() == 0
+
+    asyncio.run(run())
+
+
+def test_send_batch_dead_letters_failed_acks(monkeypatch):
+    async def run():
+        producer = FakeProducer(fail_keys={b"lost"})
+        _setup(monkeypatch, producer, window=8)
+        dead = metrics.KAFKA_PRODUCE_DEAD_LETTERED._value.get()
+
+        async def ack_pending():
+            while True:
+                await asyncio.sleep(0.01)
+                for fut in producer.pending:
+                    if not fut.done():
+                        fut.set_result(None)
+
+        acker = asyncio.ensure_future(ack_pending())
+        results = await asyncio.wait_for(
+            kafka_producer.send_batch("tx", [(b"ok", b"v", None), (b"lost", b"v", None), (b"late", b"v", None)]),
+            timeout=5,
+        )
+        acker.cancel()
+
+        # A failed ack is dead-lettered and reported, never re-sent to the main topic
+        assert results == [True, False, True]
+        assert [key for topic, key in producer.sent if topic == "tx"] == [b"ok", b"lost", b"late"]
+        assert producer.sent.count((get_settings().KAFKA_DEAD_LETTER_TOPIC, b"lost")) == 1
+        assert metrics.KAFKA_PRODUCE_DEAD_LETTERED._value.get() == dead + 1
+        assert kafka_producer.in_flight() == 0
+
+    asyncio.run(run())
+
+
+def test_producer_leaves_ordered_retries_to_the_client(monkeypatch):
+    created = {}
+
+    class RecordingProducer(FakeProducer):
+        def __init__(self, **kwargs):
+            super().__init__()
+            created.update(kwargs)
+
+        async def start(self):
+            pass
+
+    async def run():
+        monkeypatch.setattr(kafka_producer, "AIOKafkaProducer", RecordingProducer)
+        monkeypatch.setattr(kafka_producer, "_producer", None)
+        monkeypatch.setattr(kafka_producer, "_window", None)
+        await kafka_producer.start_producer()
+
+    asyncio.run(run())
+    assert created["enable_idempotence"] is True
+    assert created["request_timeout_ms"] == get_settings().KAFKA_REQUEST_TIMEOUT_MS
@@ -0,0 +1,77 @@
+import os
+import uuid
+from datetime import datetime, timezone
+
+# Disable Kafka for tests before importing app
+os.environ["ENABLE_KAFKA"] = "false"
+os.environ["POSTGRES_DSN"] = "sqlite:///./test.db"
+
+from sqlalchemy import event  # noqa: E402
+
+from app.models import Base, Transaction, TransactionStatus  # noqa: E402
+from app.models.db import SessionLocal, engine  # noqa: E402
+from app.services import persistence  # noqa: E402
+
+
+def _payload(amount: float) -> dict:
+    return {
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "amount": amount,
+        "currency": "USD",
+        "merchant_id": "m_1",
+        "merchant_category": "grocery",
+        "timestamp": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc).isoformat().replace("+00:00", "Z"),
+        "channel": "web",
+        "ip": "10.0.0.1",
+        "geo": {"lat": 1.5, "lon": 2.5},
+        "device_id": "dev1",
+    }
+
+
+def test_persist_scored_inserts_then_updates_scoring_columns():
+    Base.metadata.create_all(bind=engine)
+    p = _payload(10.0)
+
+    assert persistence.persist_scored([p], [0.1], [False]) == 1
+    changed = dict(p, amount=999.0)
+    persistence.persist_scored([changed], [-0.5], [True])
+
+    with SessionLocal() as db:
+        t = db.get(Transaction, p["transaction_id"])
+    assert t.score == -0.5
+    assert t.is_fraud is True
+    assert t.status == TransactionStatus.PENDING_REVIEW
+    # Descriptive columns keep the first write
+    assert float(t.amount) == 10.0
+    assert float(t.lat) == 1.5
+    assert t.timestamp.replace(tzinfo=timezone.utc) == datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+
+def test_build_rows_last_write_wins_within_batch():
+    p = _payload(10.0)
+    rows = persistence.build_rows([p, p], [0.1, -0.3], [False, True])
+    assert len(rows) == 1
+    assert rows[0]["score"] == -0.3 and rows[0]["status"] == TransactionStatus.PENDING_REVIEW
+
+
+def test_large_batch_is_chunked(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(persistence, "VALUES_CHUNK", 7)
+    payloads = [_payload(float(i)) for i in range(20)]
+    pages = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO transactions"):
+            pages.append(len(parameters) if executemany else 1)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert persistence.persist_scored(payloads, [0.0] * 20, [False] * 20) == 20
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert pages == [7, 7, 6]
+
+    ids = [p["transaction_id"] for p in payloads]
+    with SessionLocal() as db:
+        assert db.query(Transaction).filter(Transaction.id.in_(ids)).count() == 20
@@ -0,0 +1,154 @@
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# Disable Kafka for tests before importing app
+os.environ["ENABLE_KAFKA"] = "false"
+os.environ["POSTGRES_DSN"] = "sqlite:///./test.db"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.models import Transaction, TransactionStatus  # noqa: E402
+from app.models.db import SessionLocal, engine  # noqa: E402
+from app.services import persistence, rollups  # noqa: E402
+from app.services.auth import create_access_token  # noqa: E402
+from app.services.stats import compute_stats, plan, query_stats  # noqa: E402
+
+
+client = TestClient(app)
+
+
+def _payload(ts: datetime) -> dict:
+    return {
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": "u1",
+        "amount": 10.0,
+        "currency": "USD",
+        "merchant_id": "m_1",
+        "merchant_category": "grocery",
+        "timestamp": ts.isoformat(),
+        "channel": "web",
+        "ip": "10.0.0.1",
+    }
+
+
+def _stats() -> dict:
+    with SessionLocal() as db:
+        return compute_stats(db, "7d")["totals"]
+
+
+def test_rollups_follow_upserts_and_reviews(empty_db):
+    before = _stats()
+    hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+    clean, fraud = _payload(hour + timedelta(minutes=5)), _payload(hour + timedelta(minutes=50))
+    # Offsets are normalized to UTC before bucketing
+    fraud["timestamp"] = (hour + timedelta(minutes=50)).astimezone(timezone(timedelta(hours=5))).isoformat()
+
+    persistence.persist_scored([clean, fraud], [0.1, -0.5], [False, True])
+    # Redelivery of a rescored row moves it between counters instead of double counting
+    persistence.persist_scored([clean], [-0.4], [True])
+    persistence.persist_scored([clean], [0.2], [False])
+
+    token = create_access_token("tester")
+    r = client.post(
+        f"/fraud/review/{fraud['transaction_id']}",
+        json={"decision": "REJECTED"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert r.status_code == 200
+    # Replaying the topic from earliest leaves the review and the counters as they are
+    persistence.persist_scored([clean, fraud], [0.2, -0.5], [False, True])
+    with SessionLocal() as db:
+        assert db.get(Transaction, fraud["transaction_id"]).status == TransactionStatus.REJECTED
+
+    with engine.connect() as conn:
+        assert rollups.rollup_series(conn, "hour", hour, group_by=())[(hour,)] == [1, 1, 1, 0, 1]
+        assert rollups.rollup_series(conn, "day", hour.replace(hour=0), group_by=("channel",))[
+            (hour.replace(hour=0), "web")
+        ][0] >= 1
+        assert rollups.check(conn) == []
+
+    after = _stats()
+    assert after["fraud_total"] - before["fraud_total"] == 1
+    assert after["clean_total"] - before["clean_total"] == 1
+    assert after["approved_total"] - before["approved_total"] == 1
+    assert after["pending_total"] - before["pending_total"] == 0
+    assert after["rejected_total"] - before["rejected_total"] == 1
+
+
+def test_rebuild_repairs_drift(empty_db):
+    hour = datetime(2023, 3, 4, 5, tzinfo=timezone.utc)
+    persistence.persist_scored([_payload(hour), _payload(hour)], [0.1, -0.5], [False, True])
+
+    with engine.begin() as conn:
+        rollups.apply_deltas(conn, {("hour", hour, "grocery", "web", "USD"): [5, 0, 0, 0, 0]})
+    with engine.connect() as conn:
+        key = ("hour", hour, "grocery", "web", "USD")
+        assert rollups.check(conn, hour) == [(key, [6, 1, 1, 1, 0], [1, 1, 1, 1, 0])]
+
+    with engine.begin() as conn:
+        assert rollups.rebuild(conn, hour) >= 1
+    with engine.connect() as conn:
+        assert rollups.check(conn) == []
+        assert rollups.rollup_series(conn, "hour", hour, group_by=())[(hour,)] == [1, 1, 1, 1, 0]
+
+
+def test_planner_uses_coarsest_rollup_and_raw_edges():
+    start = datetime(2024, 1, 1, 22, 30, tzinfo=timezone.utc)
+    end = datetime(2024, 1, 4, 1, 15, tzinfo=timezone.utc)
+    assert [(src, s.isoformat(), e.isoformat()) for src, s, e in plan(start, end, "day")] == [
+        ("raw", "2024-01-01T22:30:00+00:00", "2024-01-01T23:00:00+00:00"),
+        ("hour", "2024-01-01T23:00:00+00:00", "2024-01-02T00:00:00+00:00"),
+        ("day", "2024-01-02T00:00:00+00:00", "2024-01-04T00:00:00+00:00"),
+        ("hour", "2024-01-04T00:00:00+00:00", "2024-01-04T01:00:00+00:00"),
+        ("raw", "2024-01-04T01:00:00+00:00", "2024-01-04T01:15:00+00:00"),
+    ]
+    # Hourly output cannot use day rollups; minute output needs raw rows
+    assert [src for src, _, _ in plan(start, end, "hour")] == ["raw", "hour", "raw"]
+    assert plan(start, end, "minute") == [("raw", start, end)]
+
+
+def test_query_stats_matches_raw_rows_for_unaligned_range(empty_db):
+    base = datetime(2022, 6, 1, tzinfo=timezone.utc)
+    payloads, flags = [], []
+    for i in range(60):
+        p = _payload(base + timedelta(minutes=47 * i))
+        p["channel"] = "web" if i % 3 else "pos"
+        payloads.append(p)
+        flags.append(i % 4 == 0)
+    persistence.persist_scored(payloads, [0.0] * len(payloads), flags)
+
+    start, end = base + timedelta(minutes=20), base + timedelta(days=1, hours=13, minutes=10)
+    expected = {}
+    for p, fraud in zip(payloads, flags):
+        ts = datetime.fromisoformat(p["timestamp"])
+        if start <= ts < end:
+            key = (ts.replace(hour=0, minute=0).isoformat(), p["channel"])
+            expected[key] = expected.get(key, 0) + (1 if fraud else 0)
+
+    with SessionLocal() as db:
+        result = query_stats(db, start, end, "day", ["channel"])
+        assert [s["source"] for s in result["plan"]] == ["raw", "hour", "raw"]
+        assert {(r["ts"], r["channel"]): r["count_fraud"] for r in result["timeseries"]} == expected
+        assert result["totals"]["fraud_total"] == sum(expected.values())
+
+        minutes = query_stats(db, start, end, "minute")
+        assert sum(r["count_fraud"] for r in minutes["timeseries"]) == sum(expected.values())
+
+
+def test_stats_route_params():
+    token = create_access_token("tester")
+    headers = {"Authorization": f"Bearer {token}"}
+    r = client.get(
+        "/fraud/stats",
+        params={"from": "2022-06-01T00:00:00Z", "to": "2022-06-03T00:00:00Z", "granularity": "hour", "group_by": "currency"},
+        headers=headers,
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["granularity"] == "hour" and body["group_by"] == ["currency"]
+    assert all(row["currency"] == "USD" for row in body["timeseries"])
+
+    assert client.get("/fraud/stats", params={"window": "7x"}, headers=headers).status_code == 400
+    assert client.get("/fraud/stats", params={"group_by": "ip"}, headers=headers).status_code == 400
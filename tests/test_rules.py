@@ -0,0 +1,143 @@
+import json
+import os
+
+os.environ["POSTGRES_DSN"] = "sqlite:///./test.db"
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+
+from app.config import get_settings  # noqa: E402
+from app.models import Base, RuleDefinition  # noqa: E402
+from app.models.db import SessionLocal, engine  # noqa: E402
+from app.services import rules  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def builtin_rules(monkeypatch):
+    yield
+    # Settings patches are undone after this fixture's teardown; rebuild from the restored values
+    monkeypatch.undo()
+    rules.reload_rules()
+
+
+def test_amount_and_category_rules():
+    settings = get_settings()
+    assert rules.evaluate_transaction({"amount": 50, "merchant_category": "crypto"}) == (False, [])
+
+    flagged, reasons = rules.evaluate_transaction({"amount": 5000, "merchant_category": " Crypto "})
+    assert flagged and reasons == ["high_risk_category:crypto"]
+
+    flagged, reasons = rules.evaluate_transaction({"amount": settings.AMOUNT_HARD_MAX + 1})
+    assert flagged and reasons == [f"amount>{settings.AMOUNT_HARD_MAX}"]
+
+
+def test_user_velocity_rule(monkeypatch):
+    monkeypatch.setattr(get_settings(), "VELOCITY_USER_MAX_1M", 3)
+    rules.reload_rules()
+    payload = {"amount": 10, "merchant_category": "grocery", "user_id": "u1"}
+
+    assert rules.evaluate_transaction(payload, {"user_count_1m": 3}) == (False, [])
+    assert rules.evaluate_transaction(payload, {"user_count_1m": 4}) == (True, ["velocity:user_count_1m>3"])
+
+
+def test_batch_matches_per_row():
+    ruleset = rules.RuleSet(
+        [
+            {"type": "amount_max", "max": 10_000},
+            {"type": "category", "categories": ["Crypto", "jewelry"], "min_amount": 500},
+            {"type": "currency_limit", "limits": {"eur": 2000, "JPY": 100_000}},
+            {"type": "velocity", "feature": "device_count_1h", "max": 5},
+        ]
+    )
+    payloads = [
+        {"amount": 50_000, "currency": "EUR", "merchant_category": "crypto"},
+        {"amount": 600, "currency": "usd", "merchant_category": "JEWELRY"},
+        {"amount": 2500, "currency": " eur "},
+        {"amount": "bad", "currency": None, "merchant_category": None},
+    ]
+    velocity = [{"device_count_1h": n} for n in (1, 6, 2, 9)]
+
+    results = ruleset.evaluate_batch(payloads, velocity)
+    assert results.flags.tolist() == [True, True, True, True]
+    assert results.bits.tolist() == [0b0111, 0b1010, 0b0100, 0b1000]
+    batch = results.pairs()
+    assert batch == [ruleset.evaluate(p, v) for p, v in zip(payloads, velocity)]
+    assert batch[0] == (True, ["amount>10000", "high_risk_category:crypto", "currency_limit:EUR>2000"])
+    assert batch[1] == (True, ["high_risk_category:jewelry", "velocity:device_count_1h>5"])
+    assert batch[2] == (True, ["currency_limit:EUR>2000"])
+    assert batch[3] == (True, ["velocity:device_count_1h>5"])
+
+
+def test_columnar_batch():
+    ruleset = rules.RuleSet(
+        [
+            {"name": "risky", "type": "category", "categories": ["crypto"], "min_amount": 100},
+            {"name": "eur", "type": "currency_limit", "limits": {"EUR": 1000}},
+        ]
+    )
+    cols = rules.Columns(
+        amount=np.array([50.0, 150.0, 5000.0, 5000.0]),
+        category=ruleset.encode_categories(["crypto", " CRYPTO", "books", None]),
+        currency=ruleset.encode_currencies(["EUR", "USD", "eur", "GBP"]),
+        velocity={},
+    )
+    assert cols.category.tolist() == [0, 0, -1, -1]
+
+    results = ruleset.evaluate_columns(cols)
+    assert results.flags.tolist() == [False, True, True, False]
+    assert results.bits.tolist() == [0, 0b01, 0b10, 0]
+    assert results.reasons(1) == ["high_risk_category:crypto"]
+    assert results.reasons(2) == ["currency_limit:EUR>1000"]
+    assert results.reasons(3) == []
+
+
+def test_invalid_definitions_rejected():
+    with pytest.raises(rules.RuleDefinitionError):
+        rules.RuleSet([{"type": "velocity", "feature": "nope_count_1m", "max": 1}])
+    with pytest.raises(rules.RuleDefinitionError):
+        rules.RuleSet([{"type": "amount_max"}])
+    with pytest.raises(rules.RuleDefinitionError):
+        rules.RuleSet([{"type": "unknown"}])
+    with pytest.raises(rules.RuleDefinitionError):
+        rules.RuleSet([{"type": "amount_max", "max": i} for i in range(rules.MAX_RULES + 1)])
+
+
+def test_file_rules_hot_reload(tmp_path, monkeypatch):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([{"type": "amount_max", "max": 100}]))
+    monkeypatch.setattr(get_settings(), "RULES_SOURCE", "file")
+    monkeypatch.setattr(get_settings(), "RULES_PATH", str(path))
+    first = rules.reload_rules()
+    assert rules.evaluate_transaction({"amount": 150}) == (True, ["amount>100"])
+    assert not rules.reload_if_changed()
+
+    path.write_text(json.dumps({"rules": [{"type": "amount_max", "max": 200}]}))
+    os.utime(path, (0, 12345))
+    assert rules.reload_if_changed()
+    assert rules.get_ruleset().version != first.version
+    assert rules.evaluate_transaction({"amount": 150}) == (False, [])
+
+    # A broken edit keeps serving the last good version
+    path.write_text(json.dumps([{"type": "amount_max", "max": "lots"}]))
+    os.utime(path, (0, 23456))
+    with pytest.raises(rules.RuleDefinitionError):
+        rules.reload_if_changed()
+    assert rules.evaluate_transaction({"amount": 250}) == (True, ["amount>200"])
+
+
+def test_db_rules(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.query(RuleDefinition).delete()
+        db.add_all(
+            [
+                RuleDefinition(name="gbp", position=1, definition=json.dumps({"type": "currency_limit", "limits": {"GBP": 50}})),
+                RuleDefinition(name="big", position=0, definition=json.dumps({"type": "amount_max", "max": 60})),
+                RuleDefinition(name="off", position=2, enabled=False, definition=json.dumps({"type": "amount_max", "max": 1})),
+            ]
+        )
+        db.commit()
+    monkeypatch.setattr(get_settings(), "RULES_SOURCE", "db")
+    ruleset = rules.reload_rules()
+    assert ruleset.names == ("big", "gbp")
+    assert rules.evaluate_transaction({"amount": 70, "currency": "gbp"}) == (True, ["amount>60", "currency_limit:GBP>50"])
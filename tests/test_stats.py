@@ -1,4 +1,5 @@
 import os
+import threading
 from fastapi.testclient import TestClient
 
 # Disable Kafka for tests before importing app
@@ -6,6 +7,8 @@ os.environ["ENABLE_KAFKA"] = "false"
 os.environ["POSTGRES_DSN"] = "sqlite:///./test.db"
 
 from app.main import app  # noqa: E402
+from app.models import Base  # noqa: E402
+from app.models.db import engine  # noqa: E402
 from app.services.auth import create_access_token  # noqa: E402
 from app.services import stats as stats_service  # noqa: E402
 
@@ -15,11 +18,39 @@ client = TestClient(app)
 
 def test_stats_monkeypatched(monkeypatch):
     token = create_access_token("tester")
-    def fake_compute(db, window):
+    def fake_fetch(db, window, **kwargs):
+        return None
+
+    def fake_shape(rows):
         return {"timeseries": [], "totals": {"fraud_total": 0, "clean_total": 0}}
 
-    monkeypatch.setattr(stats_service, "compute_stats", fake_compute)
+    monkeypatch.setattr(stats_service, "fetch_stats", fake_fetch)
+    monkeypatch.setattr(stats_service, "shape_stats", fake_shape)
 
     r = client.get("/fraud/stats", headers={"Authorization": f"Bearer {token}"})
     assert r.status_code == 200
     assert r.json()["totals"]["fraud_total"] == 0
+
+
+def test_stats_shaping_runs_off_the_event_loop(monkeypatch):
+    Base.metadata.create_all(bind=engine)
+    token = create_access_token("tester")
+    threads = {}
+    real_fetch, real_shape = stats_service.fetch_stats, stats_service.shape_stats
+
+    def fetch(db, window, **kwargs):
+        threads["fetch"] = threading.get_ident()
+        return real_fetch(db, window, **kwargs)
+
+    def shape(rows):
+        threads["shape"] = threading.get_ident()
+        return real_shape(rows)
+
+    monkeypatch.setattr(stats_service, "fetch_stats", fetch)
+    monkeypatch.setattr(stats_service, "shape_stats", shape)
+
+    r = client.get("/fraud/stats?window=13m&granularity=minute", headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 200
+    assert len(r.json()["plan"]) >= 1
+    # run_sync keeps the fetch on the loop thread (its I/O is awaited); shaping must not be there
+    assert threads["shape"] != threads["fetch"]
@@ -0,0 +1,154 @@
+import asyncio
+
+import fakeredis
+
+from app.services.cache import RedisCache, StatsResponseCache, TransactionDetailCache
+
+
+def _redis_cache(client) -> RedisCache:
+    cache = RedisCache("redis://unused:6379/0")
+    cache.client = client
+    return cache
+
+
+class BrokenRedis:
+    async def get(self, key):
+        raise ConnectionError("down")
+
+    async def incr(self, key):
+        raise ConnectionError("down")
+
+    async def set(self, *args, **kwargs):
+        raise ConnectionError("down")
+
+
+class Computer:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {"totals": {"fraud_total": self.calls}}
+
+
+def test_concurrent_misses_share_one_compute():
+    async def run():
+        cache = StatsResponseCache(_redis_cache(fakeredis.FakeAsyncRedis(decode_responses=True)), ttl=60)
+        compute = Computer()
+        results = await asyncio.gather(*(cache.get("7d", compute) for _ in range(10)))
+        assert compute.calls == 1
+        assert sorted(source for _, source in results) == ["coalesced"] * 9 + ["miss"]
+        assert all(value == {"totals": {"fraud_total": 1}} for value, _ in results)
+
+        assert await cache.get("7d", compute) == ({"totals": {"fraud_total": 1}}, "local")
+        assert (await cache.get("30d", compute))[1] == "miss"
+
+    asyncio.run(run())
+
+
+def test_version_bump_invalidates_every_replica():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        a = StatsResponseCache(_redis_cache(client), ttl=60)
+        b = StatsResponseCache(_redis_cache(client), ttl=60)
+        compute = Computer()
+
+        await a.get("7d", compute)
+        assert await b.get("7d", compute) == ({"totals": {"fraud_total": 1}}, "redis")
+
+        # A write seen by replica b invalidates replica a's local entry too
+        await b.bump()
+        assert await a.get("7d", compute) == ({"totals": {"fraud_total": 2}}, "miss")
+        assert compute.calls == 2
+
+    asyncio.run(run())
+
+
+def test_unreachable_redis_degrades_to_local():
+    async def run():
+        cache = StatsResponseCache(_redis_cache(BrokenRedis()), ttl=60, retry_after=60)
+        compute = Computer()
+        assert (await cache.get("7d", compute))[1] == "miss"
+        assert (await cache.get("7d", compute))[1] == "local"
+        await cache.bump()
+        assert (await cache.get("7d", compute))[1] == "miss"
+        assert compute.calls == 2
+
+    asyncio.run(run())
+
+
+def test_failed_compute_is_not_cached():
+    async def run():
+        cache = StatsResponseCache(None, ttl=60)
+        calls = []
+
+        async def failing():
+            calls.append(1)
+            raise RuntimeError("db down")
+
+        for _ in range(2):
+            try:
+                await cache.get("7d", failing)
+            except RuntimeError:
+                pass
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+
+def test_detail_cache_reads_through_lru_and_redis():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await client.set("tx:a", '{"id": "a", "status": "PENDING_REVIEW"}')
+        cache = TransactionDetailCache(_redis_cache(client), max_entries=2, ttl=60)
+        loads = []
+
+        async def load(tx_id):
+            loads.append(tx_id)
+            return {"id": tx_id} if tx_id != "missing" else None
+
+        assert await cache.get("a", lambda: load("a")) == ('{"id": "a", "status": "PENDING_REVIEW"}', "redis")
+        assert (await cache.get("a", lambda: load("a")))[1] == "local"
+        assert await cache.get("b", lambda: load("b")) == ('{"id":"b"}', "miss")
+        # Misses are written back to Redis with an expiry
+        assert await client.get("tx:b") == '{"id":"b"}' and await client.ttl("tx:b") > 0
+        assert await cache.get("missing", lambda: load("missing")) == (None, "miss")
+
+        # The LRU holds two bodies: "c" evicts "a", the least recently used
+        await cache.get("c", lambda: load("c"))
+        assert list(cache._local) == ["b", "c"]
+
+        await cache.invalidate("b")
+        await client.set("tx:b", '{"id": "b", "status": "REJECTED"}')
+        assert await cache.get("b", lambda: load("b")) == ('{"id": "b", "status": "REJECTED"}', "redis")
+        assert loads == ["b", "missing", "c"]
+
+    asyncio.run(run())
+
+
+def test_detail_fill_loaded_before_a_review_is_dropped():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        cache = TransactionDetailCache(_redis_cache(client), ttl=60)
+        reviewer = TransactionDetailCache(_redis_cache(client), ttl=60)
+
+        async def load_then_review():
+            # The row is read before the review commits; the review lands before the fill is written
+            body = {"id": "a", "status": "PENDING_REVIEW"}
+            await reviewer.invalidate("a")
+            return body
+
+        assert (await cache.get("a", load_then_review))[1] == "miss"
+        assert await client.get("tx:a") is None
+
+        # A load that starts after the review fills as usual
+        async def load():
+            return {"id": "a", "status": "REJECTED"}
+
+        cache._local.clear()
+        assert (await cache.get("a", load))[1] == "miss"
+        assert await client.get("tx:a") == '{"id":"a","status":"REJECTED"}'
+        assert 0 < await client.ttl("tx:rev:a") <= cache.fill_ttl
+
+    asyncio.run(run())
@@ -1,4 +1,6 @@
+import json
 import os
+import time
 import uuid
 from datetime import datetime, timezone
 from fastapi.testclient import TestClient
@@ -41,3 +43,149 @@ def test_post_transactions_monkeypatched(monkeypatch):
     data = r.json()
     assert data["enqueued"] is True
     assert data["id"] == payload["transaction_id"]
+
+
+def test_post_transaction_the_wire_format_cannot_carry_is_422(monkeypatch):
+    async def fake_send(*args, **kwargs):
+        return True
+
+    monkeypatch.setattr(kafka_producer, "send_transaction", fake_send)
+    payload = {
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": "u\u00001",
+        "amount": 1.0,
+        "currency": "USD",
+        "merchant_id": "m_1",
+        "merchant_category": "electronics",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "channel": "web",
+        "ip": "10.0.0.1",
+    }
+    r = client.post("/transactions", json=payload)
+    assert r.status_code == 422
+    assert "NUL" in r.json()["detail"]
+
+
+def test_ingest_sheds_load_with_retry_after(monkeypatch):
+    from app.services import admission
+
+    async def fake_send(*args, **kwargs):
+        return True
+
+    monkeypatch.setattr(kafka_producer, "send_transaction", fake_send)
+    controller = admission.AdmissionController(
+        max_in_flight=0, max_producer_queue=100, max_latency_ms=50, window_s=0.2, min_samples=1, retry_after_s=3
+    )
+    monkeypatch.setattr(admission, "_controller", controller)
+    payload = {
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "amount": 10.0,
+        "currency": "USD",
+        "merchant_id": "m_1",
+        "merchant_category": "grocery",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "channel": "web",
+        "ip": "10.0.0.1",
+    }
+
+    # Producer queue over the limit
+    controller.producer_queue = lambda: 100
+    r = client.post("/transactions", json=payload)
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == "3"
+    r = client.post("/transactions/bulk", content=json.dumps([payload]))
+    assert r.status_code == 429
+
+    # Recent latency over the limit, until the slow samples leave the window
+    controller.producer_queue = lambda: 0
+    controller.observe(0.5)
+    assert client.post("/transactions", json=payload).status_code == 429
+    time.sleep(0.25)
+    assert client.post("/transactions", json=payload).status_code == 200
+    assert controller.in_flight == 0
+
+
+def test_slow_bulk_uploads_do_not_shed_single_ingest():
+    from app.services import admission
+
+    controller = admission.AdmissionController(
+        max_in_flight=0, max_producer_queue=0, max_latency_ms=50, window_s=60, min_samples=2
+    )
+    # Multi-second bulk uploads fill their own window only
+    controller.observe(3.0, admission.BULK)
+    controller.observe(4.0, admission.BULK)
+    assert controller.reject_reason(admission.BULK) == "latency"
+    assert controller.reject_reason() is None
+    controller.observe(0.01)
+    controller.observe(0.02)
+    assert controller.recent_latency_ms() == 15.0
+
+
+def test_bulk_latency_is_recorded_per_row(monkeypatch):
+    from app.services import admission
+
+    async def fake_send_batch(topic, messages):
+        return [True] * len(messages)
+
+    monkeypatch.setattr(kafka_producer, "send_batch", fake_send_batch)
+    controller = admission.AdmissionController(max_in_flight=0, max_producer_queue=0, min_samples=1)
+    monkeypatch.setattr(admission, "_controller", controller)
+    rows = [
+        {
+            "transaction_id": str(uuid.uuid4()),
+            "user_id": "u1",
+            "amount": 10.0,
+            "currency": "USD",
+            "merchant_id": "m_1",
+            "merchant_category": "grocery",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "channel": "web",
+            "ip": "10.0.0.1",
+        }
+        for _ in range(50)
+    ]
+    start = time.perf_counter()
+    assert client.post("/transactions/bulk", json=rows).status_code == 200
+    elapsed_ms = 1000.0 * (time.perf_counter() - start)
+    assert controller.recent_latency_ms(admission.BULK) <= elapsed_ms / 50
+    assert controller.recent_latency_ms() is None
+
+
+def test_post_transaction_carries_and_returns_decision(monkeypatch):
+    from app.services.decision import from_headers
+
+    sent, keys = [], []
+
+    async def fake_send(topic, key, value, headers=None):
+        sent.append(headers)
+        keys.append(key)
+        return True
+
+    monkeypatch.setattr(kafka_producer, "send_transaction", fake_send)
+    payload = {
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "amount": 5000.0,
+        "currency": "USD",
+        "merchant_id": "m_1",
+        "merchant_category": "crypto",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "channel": "web",
+        "ip": "10.0.0.1",
+    }
+
+    r = client.post("/transactions", json=payload)
+    assert r.status_code == 200 and "decision" not in r.json()
+
+    r = client.post("/transactions", params={"decision": "true"}, json=payload)
+    assert r.status_code == 200
+    verdict = r.json()["decision"]
+    assert verdict["is_fraud"] is True and verdict["reasons"]
+    carried = from_headers(sent[-1])
+    assert carried.is_fraud is True and carried.score == verdict["score"]
+    assert carried.model_version == verdict["model_version"] and carried.rule_bits > 0
+    # Nothing on the default scoring path reads velocity, so the consumer can trust the verdict
+    assert carried.velocity_source == "none"
+    # Partitioned by user, so a user's transactions are consumed in order
+    assert keys[-1] == payload["user_id"].encode()
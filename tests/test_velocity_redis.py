@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timezone
+
+import fakeredis
+
+from app.services.cache import SharedVelocityCounters
+
+T0 = 1_700_000_000.0
+
+
+def _tx(amount: float, user: str = "u1", device: str = "d1", merchant: str = "m1") -> dict:
+    return {"amount": amount, "user_id": user, "device_id": device, "merchant_id": merchant}
+
+
+def _counters(**kwargs) -> SharedVelocityCounters:
+    return SharedVelocityCounters(fakeredis.FakeAsyncRedis(decode_responses=True), **kwargs)
+
+
+def test_batch_rows_see_earlier_rows_and_replicas_share_state():
+    async def run():
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        a = SharedVelocityCounters(client, local_ttl=0)
+        b = SharedVelocityCounters(client, local_ttl=0)
+
+        rows = await a.observe_batch([_tx(10.0), _tx(5.0, user="u2"), _tx(20.0)], now=T0)
+        assert [r["user_count_1m"] for r in rows] == [1, 1, 2]
+        assert rows[2]["user_sum_1m"] == 30.0
+        assert rows[2]["merchant_count_1h"] == 3
+
+        # Another replica sees the same counters
+        rows = await b.observe_batch([_tx(1.0)], now=T0 + 10)
+        assert rows[0]["user_count_1m"] == 3 and rows[0]["user_sum_24h"] == 31.0
+
+    asyncio.run(run())
+
+
+def test_windows_expire_by_bucket():
+    async def run():
+        c = _counters(local_ttl=0)
+        await c.observe_batch([_tx(10.0)], now=T0)
+        rows = await c.observe_batch([_tx(1.0)], now=T0 + 120)
+        assert rows[0]["user_count_1m"] == 1
+        assert rows[0]["user_count_1h"] == 2 and rows[0]["user_sum_1h"] == 11.0
+
+    asyncio.run(run())
+
+
+def test_read_does_not_record_and_uses_local_cache():
+    async def run():
+        c = _counters(local_ttl=60)
+        await c.observe_batch([_tx(10.0)], now=T0)
+
+        calls = []
+        original = c._run
+
+        async def counting_run(agg):
+            calls.append(len(agg))
+            return await original(agg)
+
+        c._run = counting_run
+        first = await c.read([_tx(2.0)], now=T0 + 1)
+        again = await c.read([_tx(2.0)], now=T0 + 1)
+        assert first == again
+        assert first[0]["user_count_1m"] == 2 and first[0]["user_sum_1m"] == 12.0
+        # Cached from observe_batch: no Redis round-trip at all
+        assert calls == []
+
+        # A cold replica reads through Redis; reads never record
+        fresh = SharedVelocityCounters(c.client, local_ttl=60)
+        rows = await fresh.read([_tx(2.0), _tx(3.0)], now=T0 + 1)
+        assert [r["user_count_1m"] for r in rows] == [2, 2]
+
+    asyncio.run(run())
+
+
+def test_rows_are_bucketed_at_their_event_time():
+    async def run():
+        c = _counters(local_ttl=0)
+        iso = lambda t: datetime.fromtimestamp(t, timezone.utc).isoformat()  # noqa: E731
+        # A replayed backlog spread over two hours, then live traffic
+        backlog = [dict(_tx(1.0), timestamp=iso(T0 + 600 * i)) for i in range(12)]
+        rows = await c.observe_batch(backlog)
+        assert [r["user_count_1m"] for r in rows] == [1] * 12
+        assert rows[-1]["user_count_1h"] == 6 and rows[-1]["user_count_24h"] == 12
+
+        live = [dict(_tx(5.0), timestamp=iso(T0 + 86400 * 2))]
+        assert (await c.read(live))[0]["user_count_24h"] == 1
+        rows = await c.observe_batch(live)
+        assert rows[0]["user_count_1m"] == 1 and rows[0]["user_sum_24h"] == 5.0
+
+    asyncio.run(run())
@@ -0,0 +1,60 @@
+import json
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app.schemas.transaction import TransactionIn
+from app.services import wire
+
+
+def _payload(**overrides) -> dict:
+    payload = TransactionIn(
+        transaction_id=str(uuid.uuid4()),
+        user_id=str(uuid.uuid4()),
+        amount=123.45,
+        currency="EUR",
+        merchant_id="m_1",
+        merchant_category="électronique",
+        timestamp=datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+        channel="web",
+        ip="10.0.0.1",
+        geo={"lat": 48.85, "lon": None},
+        device_id="dev1",
+    ).model_dump(mode="json")
+    payload.update(overrides)
+    return payload
+
+
+def test_binary_round_trip_matches_json_payload():
+    for payload in (
+        _payload(),
+        _payload(transaction_id="tx-1", user_id="U_42", geo=None, device_id=None),
+        _payload(transaction_id=str(uuid.uuid4()).upper(), timestamp="2024-05-01T12:30:15"),
+    ):
+        raw = wire.encode(payload)
+        assert wire.is_binary(raw) and len(raw) < len(json.dumps(payload))
+        decoded = wire.decode(raw)
+        # The timestamp comes back as a datetime; everything else is identical
+        ts = decoded.pop("timestamp")
+        expected = dict(payload)
+        assert ts == datetime.fromisoformat(expected.pop("timestamp").replace("Z", "+00:00"))
+        assert decoded == expected
+
+
+def test_naive_timestamp_stays_naive():
+    decoded = wire.decode(wire.encode(_payload(timestamp="2024-05-01T12:30:15")))
+    assert decoded["timestamp"] == datetime(2024, 5, 1, 12, 30, 15)
+
+
+def test_legacy_json_is_still_accepted():
+    payload = _payload()
+    assert wire.decode(json.dumps(payload).encode()) == payload
+    assert wire.decode(wire.encode(payload, "json")) == payload
+
+
+def test_corrupt_messages_raise_value_error():
+    raw = wire.encode(_payload())
+    for bad in (raw[:-1], raw + b"x", bytes([wire.MAGIC, 99]) + raw[2:], b"[1, 2]", b"not json"):
+        with pytest.raises(ValueError):
+            wire.decode(bad)
@@ -0,0 +1,54 @@
+import asyncio
+import json
+import os
+
+# Disable Kafka for tests before importing app
+os.environ["ENABLE_KAFKA"] = "false"
+os.environ["POSTGRES_DSN"] = "sqlite:///./test.db"
+
+import pytest  # noqa: E402
+
+from app import worker  # noqa: E402
+from app.config import get_settings  # noqa: E402
+from app.services import rules  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def builtin_rules(monkeypatch):
+    yield
+    monkeypatch.undo()
+    rules.reload_rules()
+
+
+def test_worker_picks_up_rules_file_change(tmp_path, monkeypatch):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([{"type": "amount_max", "max": 100}]))
+    settings = get_settings()
+    monkeypatch.setattr(settings, "RULES_SOURCE", "file")
+    monkeypatch.setattr(settings, "RULES_PATH", str(path))
+    monkeypatch.setattr(settings, "RULES_RELOAD_INTERVAL_S", 0.01)
+    monkeypatch.setattr(settings, "CONSUMER_METRICS_PORT", 0)
+    rules.reload_rules()
+    verdicts = []
+
+    class FakeService:
+        async def run(self, stop):
+            verdicts.append(rules.evaluate_transaction({"amount": 150}))
+            # The API hot-reloads an edited rules file; the worker must follow without a restart
+            path.write_text(json.dumps([{"type": "amount_max", "max": 200}]))
+            os.utime(path, (0, 12345))
+            for _ in range(200):
+                await asyncio.sleep(0.01)
+                if rules.evaluate_transaction({"amount": 150}) == (False, []):
+                    break
+            verdicts.append(rules.evaluate_transaction({"amount": 150}))
+
+    monkeypatch.setattr(worker, "KafkaConsumerService", FakeService)
+
+    async def run():
+        await worker._consume(0)
+        # The watcher was cancelled with the drain
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
+    assert verdicts == [(True, ["amount>100"]), (False, [])]